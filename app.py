@@ -7,10 +7,22 @@ import time
 import logging
 import json
 from datetime import datetime, timedelta
-import re
-from collections import defaultdict
 import signal
-from data_manager import DataManager
+import argparse
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import checkpoint
+from data_manager import create_data_manager
+from gpu_monitor import AdmissionController, GpuSampler, create_provider, processes
+from grouping import GroupCache, group_all
+from job_queue import JobQueue, create_policy
+from name_parser import clear_cache as clear_name_cache, parsed
+from pipeline import IOPipeline
+from reconcile import reconcile
+from scanner import DirectoryCache, scan_videos, scan_videos_parallel
+from throughput import open_history
+from time_windows import TimeWindows
+from video_record import VideoRecord
+from watcher import collapse_directories, create_watcher
 import io
 
 # 确保标准输出和错误输出使用UTF-8编码
@@ -31,9 +43,6 @@ def signal_handler(sig, frame):
 signal.signal(signal.SIGINT, signal_handler)
             
 
-# 视频文件扩展名集合
-VIDEO_EXTENSIONS = {'.mp4', '.mkv', '.avi', '.mov', '.flv', '.wmv', '.m4v', '.mpeg', '.mpg', '.ts', '.webm', '.vob', '.ogv', '.rmvb', '.asf', '.rm', '.3gp'}
-
 # -------------------------------
 # 1. 日志配置（务必放在最前面）
 # -------------------------------
@@ -140,407 +149,500 @@ json_filename = f"scan_result_{sanitized_name}.json"
 output_json_path = os.path.join(DATA_DIR, json_filename)
 
 # 初始化数据管理器
-data_manager = DataManager(output_json_path)
+data_backend = config.get('Data', 'Backend', fallback='json')
+data_manager_options = {}
+if data_backend.lower() == 'journal':
+    data_manager_options['compact_threshold'] = config.getint('Data', 'JournalCompactThreshold', fallback=1000)
+elif data_backend.lower() == 'json':
+    data_manager_options['cache'] = config.getboolean('Data', 'Cache', fallback=False)
+data_manager = create_data_manager(output_json_path, data_backend, **data_manager_options)
 
 # -------------------------------
 # 4. 扫描目录并记录日志
 # -------------------------------
-file_data_list = []
-
-logger.info(f"开始扫描目录: {scan_path}")
-
-try:
-    for root, dirs, files in os.walk(scan_path):
-        for file in files:
-            # 只处理视频文件
-            ext = os.path.splitext(file)[1].lower()
-            if ext not in VIDEO_EXTENSIONS:
-                continue
-            try:
-                full_path = os.path.join(root, file)
-                parent_dir = root
-                filename_with_ext = file
-                file_size = os.path.getsize(full_path)
-                mod_time = os.path.getmtime(full_path)
-                mod_time_str = datetime.fromtimestamp(mod_time).strftime('%Y-%m-%d %H:%M:%S')
-
-                # 从文件名中提取 季度(S01) 和 集数(E06)
-                season_match = re.search(r'S(\d{2})E(\d{2,4})', filename_with_ext, re.IGNORECASE)
-                season = "00"  # 默认值
-                episode = "0000"  # 默认值
-
-                if season_match:
-                    season = season_match.group(1)  # 如 '01'
-                    episode = season_match.group(2)  # 如 '06'
-
-                file_record = {
-                    "父目录": parent_dir,
-                    "文件名带扩展名": filename_with_ext,
-                    "文件完整路径": full_path,
-                    "文件大小 (字节)": file_size,
-                    "文件修改时间": mod_time_str,
-                    "季度信息": season,
-                    "集数信息": episode,
-                    "分支": -1,
-                    "处理优先级": -1,
-                    "处理步骤": 3 if "Viden2x_HQ" in filename_with_ext else 0
-                }
-                file_data_list.append(file_record)
-                logger.debug(f"发现视频文件: {file_record['文件完整路径']}")
-
-            except Exception as e:
-                logger.error("⚠️ 处理文件 '%s' 时出错: %s", file, e, exc_info=True)
+# 目录修改时间缓存，与扫描结果JSON存放在同一目录
+dir_cache = None
+if config.getboolean('Scan', 'IncrementalCache', fallback=True):
+    dir_cache = DirectoryCache(
+        os.path.join(DATA_DIR, f"scan_cache_{sanitized_name}.json"),
+        recheck_seconds=config.getfloat('Scan', 'RecheckRecentHours', fallback=48) * 3600)
+
+# 并行扫描线程数（1为串行）及单个目录的超时秒数
+scan_workers = config.getint('Scan', 'Workers', fallback=1)
+scan_dir_timeout = config.getfloat('Scan', 'DirTimeout', fallback=120)
+
+# 分组结果缓存：文件列表未变化的目录直接复用上次的分支和处理优先级
+group_cache = None
+if config.getboolean('Scan', 'GroupCache', fallback=True):
+    group_cache = GroupCache(os.path.join(DATA_DIR, f"group_cache_{sanitized_name}.json"))
+
+# 处理流水线：处理当前文件时后台预取后续文件并移出已完成的结果（预取数为0时不启用）
+prefetch_depth = config.getint('Pipeline', 'PrefetchDepth', fallback=1)
+tmp_budget_bytes = int(config.getfloat('Pipeline', 'TmpBudgetGB', fallback=40) * 2**30)
+min_free_bytes = int(config.getfloat('Pipeline', 'MinFreeGB', fallback=20) * 2**30)
+
+# 并发任务数及准入控制：再启动一个任务前，GPU使用率和显存占用须低于上限
+max_concurrent_jobs = max(1, config.getint('Schedule', 'MaxConcurrentJobs', fallback=1))
+gpu_provider = create_provider(config.get('Schedule', 'GpuProvider', fallback='nvidia-smi'))
+admit_gpu_usage = config.getfloat('Schedule', 'AdmitGpuUsage', fallback=70)
+admit_memory_percent = config.getfloat('Schedule', 'AdmitMemoryPercent', fallback=80)
+admit_settle_seconds = config.getfloat('Schedule', 'AdmitSettleSeconds', fallback=30)
+ADMIT_POLL_SECONDS = 5
+# 没有任务运行时GPU使用率超过该值（其他程序占用）则推迟开始处理
+gpu_usage_threshold = config.getfloat('Schedule', 'GpuUsageThreshold', fallback=80)
+# 后台采样与挂起/恢复的滞回阈值
+sample_interval = config.getfloat('Schedule', 'SampleInterval', fallback=10)
+pause_gpu_usage = config.getfloat('Schedule', 'PauseGpuUsage', fallback=95)
+resume_gpu_usage = config.getfloat('Schedule', 'ResumeGpuUsage', fallback=60)
+pause_memory_percent = config.getfloat('Schedule', 'PauseMemoryPercent', fallback=95)
+resume_memory_percent = config.getfloat('Schedule', 'ResumeMemoryPercent', fallback=85)
+pause_samples = config.getint('Schedule', 'PauseSamples', fallback=3)
+
+# 每日处理时间窗口（未配置 TimeWindows 时为 AllowedDays 范围内的全天），
+# 窗口结束后再等待 WindowGraceMinutes 分钟，仍未完成的任务被终止，已完成的阶段留到下一个窗口继续
+schedule_windows = TimeWindows.from_config(config.get('Schedule', 'TimeWindows', fallback=''),
+                                           config.get('Schedule', 'AllowedDays', fallback='1-7'))
+window_grace_seconds = config.getfloat('Schedule', 'WindowGraceMinutes', fallback=10) * 60
+# 处理失败（未取得进展）的文件在 RetryBackoffMinutes 分钟后才重试，每次失败等待时间加倍，
+# 连续失败 MaxFailures 次后本次运行不再重试，避免监视模式下反复处理损坏的文件
+retry_backoff_seconds = config.getfloat('Schedule', 'RetryBackoffMinutes', fallback=30) * 60
+max_failures = max(1, config.getint('Schedule', 'MaxFailures', fallback=5))
+# 待处理文件的排序策略（fifo / priority / smallest / cost）及 cost 策略的权重；
+# 队列保存每个文件首次进入队列的时间，用于老化
+scheduling_policy = config.get('Schedule', 'Policy', fallback='cost')
+policy_weights = {
+    'priority_weight': config.getfloat('Schedule', 'PriorityWeight', fallback=1.0),
+    'recency_weight': config.getfloat('Schedule', 'RecencyWeight', fallback=0.5),
+    'aging_per_day': config.getfloat('Schedule', 'AgingPerDay', fallback=1.0),
+}
+job_queue_path = os.path.join(DATA_DIR, f"job_queue_{sanitized_name}.json")
+# 文件和各处理阶段的耗时历史，用于判断文件能否在剩余窗口内处理完（与 video_processor 共用）
+throughput_history = open_history(os.path.join(DATA_DIR, 'throughput.db'))
+
+
+def group_records(file_data_list):
+    """按目录计算分支和处理优先级，并保存分组缓存"""
+    group_all(file_data_list, group_cache)
+    if group_cache is not None:
+        group_cache.save()
+        logger.info(f"分组缓存: 复用 {group_cache.hits} 个目录，增量归类 {group_cache.incremental} 个目录，"
+                    f"重新分组 {group_cache.misses} 个目录")
+
+# 读取分辨率增强倍数配置
+res_multiplier = config.get('Video', 'res_multiplier', fallback='2')
+
+
+def scan_library(root, scan_skipped_dirs):
+    """
+    扫描目录下的全部视频文件
+    Args:
+        root: 扫描根目录
+        scan_skipped_dirs: 因超时被跳过的子树根目录会追加到该列表
+    Returns:
+        扫描记录列表
+    """
+    file_data_list = []
+    logger.info(f"开始扫描目录: {root}")
+    # 单次 os.scandir 遍历，每个视频文件只 stat 一次；修改时间未变的目录直接复用缓存
+    if scan_workers > 1:
+        scan_iter = scan_videos_parallel(root, scan_workers, scan_dir_timeout, dir_cache, scan_skipped_dirs)
+    else:
+        scan_iter = scan_videos(root, dir_cache)
+    for file_record in scan_iter:
+        file_data_list.append(file_record)
+    if scan_skipped_dirs:
+        logger.warning(f"⚠️ 以下 {len(scan_skipped_dirs)} 个目录扫描超时，本次保留其原有记录: {scan_skipped_dirs}")
+    if dir_cache is not None:
+        dir_cache.save()
+        logger.info(f"目录缓存: 复用 {dir_cache.hits} 个目录，重新列出 {dir_cache.misses} 个目录")
 
     logger.info(f"✅ 扫描完成，共发现 {len(file_data_list)} 个视频文件")
+    return file_data_list
 
-    # 按目录分组文件
-    dir_groups = {}
-    for file in file_data_list:
-        dir_path = file["父目录"]
-        if dir_path not in dir_groups:
-            dir_groups[dir_path] = []
-        dir_groups[dir_path].append(file)
-
-    # 计算字符串相似度 (Levenshtein距离)
-    def levenshtein_distance(s1, s2):
-        if len(s1) < len(s2):
-            return levenshtein_distance(s2, s1)
-        if len(s2) == 0:
-            return len(s1)
-        previous_row = range(len(s2) + 1)
-        for i, c1 in enumerate(s1):
-            current_row = [i + 1]
-            for j, c2 in enumerate(s2):
-                insertions = previous_row[j + 1] + 1
-                deletions = current_row[j] + 1
-                substitutions = previous_row[j] + (c1 != c2)
-                current_row.append(min(insertions, deletions, substitutions))
-            previous_row = current_row
-        return previous_row[-1]
-
-    # 裁剪文件名到相同长度，保留后缀名
-    def trim_filenames(name1, name2):
-        base1, ext1 = os.path.splitext(name1)
-        base2, ext2 = os.path.splitext(name2)
-        
-        target_len = min(len(name1), len(name2))
-        
-        # 处理第一个文件名
-        if len(name1) > target_len:
-            base_len = target_len - len(ext1)
-            base1 = base1[:base_len] if base_len > 0 else ''
-            name1 = f"{base1}{ext1}"
-        
-        # 处理第二个文件名
-        if len(name2) > target_len:
-            base_len = target_len - len(ext2)
-            base2 = base2[:base_len] if base_len > 0 else ''
-            name2 = f"{base2}{ext2}"
-        
-        return name1, name2
-
-    # 处理每个目录
-    for dir_path, files in dir_groups.items():
-        # 1. 文件归类 (分支)
-        branches = []
-        ungrouped = [file for file in files if "Viden2x_HQ" not in file["文件完整路径"]]
-        while ungrouped:
-            current_file = ungrouped.pop(0)
-            current_group = [current_file]
-            current_name = current_file["文件名带扩展名"]
-            current_ext = os.path.splitext(current_name)[1]
-            current_len = len(current_name)
-
-            # 比较剩余文件
-            to_remove = []
-            for i, file in enumerate(ungrouped):
-                name = file["文件名带扩展名"]
-                ext = os.path.splitext(name)[1]
-                name_len = len(name)
-
-                # 检查后缀名是否相同
-                if ext != current_ext:
-                    continue
 
-                # 检查文件名长度差异
-                if abs(name_len - current_len) > 5:
-                    continue
+def load_records():
+    """读取已有扫描结果，转换为内存中使用的 VideoRecord"""
+    return [VideoRecord.from_dict(record) for record in data_manager.load_data()]
 
-                # 检查文件名相似度
-                # 移除文件名中的季度和集数信息 (SxxExx格式)
-                pattern = re.compile(r'S\d{2,}E\d{2,}', re.IGNORECASE)
-                cleaned_current = pattern.sub('', current_name)
-                cleaned_name = pattern.sub('', name) 
-                distance = levenshtein_distance(cleaned_current, cleaned_name)
-                similarity = 1 - (distance / max(len(current_name), len(name)))
-                if similarity > 0.6:
-                    current_group.append(file)
-                    to_remove.append(i)
-
-            # 将同一组的文件标记相同分支
-            branch_id = len(branches)
-            for file in current_group:
-                file["分支"] = branch_id
-            branches.append(current_group)
-
-            # 从待分组列表中移除已分组文件
-            for i in reversed(to_remove):
-                ungrouped.pop(i)
-
-        # 处理小分支合并 - 将文件数≤2的分支合并到相似度最高的大分支
-        small_branches = [b for b in branches if len(b) <= 2]
-        large_branches = [b for b in branches if len(b) >= 3]
-
-        # 仅当存在大分支时才合并小分支
-        if large_branches and small_branches:
-            # 创建新分支列表，以大分支为基础
-            new_branches = large_branches.copy()
-            
-            for small_branch in small_branches:
-                # 取小分支的第一个文件作为代表
-                small_rep = small_branch[0]
-                small_name = small_rep["文件名带扩展名"]
-                min_distance = float('inf')
-                best_branch = None
-
-                # 在新分支列表中找到相似度最高的大分支（不设置匹配阈值）
-                for candidate_branch in new_branches:
-                    # 取候选分支的第一个文件作为代表
-                    rep_name = candidate_branch[0]["文件名带扩展名"]
-                     # 裁剪文件名到相同长度，保留后缀名
-                    small_name_trimmed, rep_name_trimmed = trim_filenames(small_name, rep_name)
-                     # 计算裁剪后的字符串相似度
-                    distance = levenshtein_distance(small_name_trimmed, rep_name_trimmed)
-                    if distance < min_distance:
-                        min_distance = distance
-                        best_branch = candidate_branch
-                # 将小分支合并到最佳匹配的大分支（不设置相似度阈值）
-                # 无条件合并到最相似的大分支
-                branch_id = new_branches.index(best_branch)
-
-                for file in small_branch:
-                    file["分支"] = branch_id
-                best_branch.extend(small_branch)
-        
-            # 更新分支列表为合并后的新分支
-            branches = new_branches
 
-        # 2. 计算处理优先级
-        # 2.3 按新的排序逻辑分配优先级
-        # 过滤掉分支级为-1的分支
-        filtered_branches = [branch for branch in branches if all(file["分支"] != -1 for file in branch)]
-        
-        def get_file_sort_key(file):
-            """获取文件排序键：按修改时间排序"""
-            try:
-                modify_time = datetime.strptime(file["文件修改时间"], '%Y-%m-%d %H:%M:%S')
-            except ValueError:
-                # 如果无法解析时间，使用当前时间
-                modify_time = datetime.now()
-            return modify_time
-        
-        # 新的排序逻辑：
-        # 1. 按季度和集数组合对所有分支中的文件分组
-        # 2. 对每组相同季度和集数的文件按修改时间排序
-        # 3. 统计每个分支中具有最早修改时间的文件数量
-        # 4. 按照这个数量进行排序，数量多的分支优先级更高
-        
-        # 按季度和集数组合对所有文件分组
-        # 只有在所有分支中都存在的季度和集数组合才会被纳入排序考虑
-        episode_groups = {}  # {(季度, 集数): [文件列表]}
-        
-        # 首先统计每个季度和集数组合出现在多少个分支中
-        episode_branch_counts = {}
-        branch_count = len(filtered_branches)
-        
-        for branch in filtered_branches:
-            # 使用集合来避免同一分支中重复的季度和集数组合被多次计算
-            branch_episode_keys = set()
-            for file in branch:
-                episode_key = (file["季度信息"], file["集数信息"])
-                branch_episode_keys.add(episode_key)
-            
-            # 增加每个季度和集数组合的分支计数
-            for episode_key in branch_episode_keys:
-                episode_branch_counts[episode_key] = episode_branch_counts.get(episode_key, 0) + 1
-        
-        # 只保留那些在所有分支中都存在的季度和集数组合
-        valid_episode_keys = {key for key, count in episode_branch_counts.items() if count == branch_count}
-        
-        # 对所有文件进行分组，但只保留有效的季度和集数组合
-        for branch in filtered_branches:
-            for file in branch:
-                episode_key = (file["季度信息"], file["集数信息"])
-                if episode_key in valid_episode_keys:
-                    if episode_key not in episode_groups:
-                        episode_groups[episode_key] = []
-                    episode_groups[episode_key].append(file)
-        
-        # 对每组相同季度和集数的文件按修改时间排序
-        for episode_key, files in episode_groups.items():
-            files.sort(key=get_file_sort_key)
-        
-        # 统计每个分支中具有最早修改时间的文件数量
-        # （即在各自季度和集数组合中时间最早的文件）
-        branch_early_file_counts = [0] * len(filtered_branches)
-        # 创建一个从文件路径到分支索引的映射，提高查找效率
-        file_to_branch_index = {}
-        for branch_idx, branch in enumerate(filtered_branches):
-            for file in branch:
-                file_to_branch_index[file["文件完整路径"]] = branch_idx
-                
-        # 对于每个episode group，只统计最早修改的那个文件所属的分支
-        for episode_key, files in episode_groups.items():
-            if files:  # 确保组中有文件
-                # files已经按修改时间排序，第一个就是最早修改的文件
-                earliest_file = files[0]
-                # 找到该文件所属的分支
-                branch_idx = file_to_branch_index.get(earliest_file["文件完整路径"])
-                if branch_idx is not None:
-                    branch_early_file_counts[branch_idx] += 1
-        
-        # 根据每个分支中早期文件的数量排序分支
-        # 数量多的分支优先级更高（处理优先级数字更小）
-        branch_indices = list(range(len(filtered_branches)))
-        # 按早期文件数量降序排列（使用负数实现降序）
-        sorted_indices = sorted(branch_indices, key=lambda i: -branch_early_file_counts[i])
-        
-        # 根据排序结果分配处理优先级，确保同一分支内的文件具有相同的优先级
-        # 修改优先级分配逻辑，使早期文件数量多的分支优先级数字更小（优先级更高）
-        # 优先级从0开始分配，数值越小优先级越高
-        for priority, branch_idx in enumerate(sorted_indices):
-            branch = filtered_branches[branch_idx]
-            for file in branch:
-                file["处理优先级"] = priority
-
-    logger.info(f"✅ 数据处理完成，共处理 {len(file_data_list)} 个文件")
-
-    # 新旧扫描结果对比，只保留新增或修改的文件
-    if os.path.exists(output_json_path):
-        try:
-            with open(output_json_path, 'r', encoding='utf-8') as f:
-                old_data = data_manager.load_data()
-            # 过滤旧数据中实际文件不存在的条目
-            old_data = [file for file in old_data if os.path.exists(file['文件完整路径'])]
-            # 创建旧数据的路径到文件信息的映射（统一转为小写路径，避免大小写问题）
-            # 创建旧数据的路径+大小组合键映射（用于判断新增文件）
-            old_file_keys = set()
-            for file in old_data:
-                path = file['文件完整路径'].lower()
-                size = file['文件大小 (字节)']
-                key = f"{path}_{size}"
-                old_file_keys.add(key)
-            
-            # 筛选新增文件（路径+大小组合不存在于旧数据中）
-            new_files = []
-            for new_file in file_data_list:
-                path = new_file['文件完整路径'].lower()
-                size = new_file['文件大小 (字节)']
-                key = f"{path}_{size}"
-                if key not in old_file_keys:
-                    new_files.append(new_file)
-            
-            # 追加新增文件到旧数据中
-            file_data_list = old_data + new_files
-        except (json.JSONDecodeError, KeyError) as e:
-            logger.error(f"加载旧扫描结果失败: {e}，将保存完整扫描结果")
-            # 加载失败时使用完整扫描结果
-            pass
-
-    os.makedirs(DATA_DIR, exist_ok=True)
-    # 筛选6天内更新且处理优先级==0、处理步骤==0的文件，标记处理步骤为1（已筛选）
+def mark_recent_files(file_data_list):
+    """
+    筛选6天内更新且处理优先级==0、处理步骤==0的文件，标记处理步骤为1（已筛选）
+    Args:
+        file_data_list: 记录列表，符合条件的记录会被原地修改
+    Returns:
+        被标记的文件路径列表
+    """
     current_time = datetime.now()
-    six_days_ago = current_time - timedelta(days=6)
-    filtered_count = 0
+    six_days_ago = (current_time - timedelta(days=6)).timestamp()
     filtered_files = []
     for file in file_data_list:
         if file.get("处理优先级") == 0 and file.get("处理步骤") == 0:
-            try:
-                modify_time = datetime.strptime(file["文件修改时间"], '%Y-%m-%d %H:%M:%S')
-                if modify_time >= six_days_ago:
-                    file["处理步骤"] = 1  # 标记为已筛选
-                    filtered_count += 1
-                    filtered_files.append(file["文件完整路径"])
-            except ValueError:
+            # 修改时间在解析阶段已换算为 epoch 秒
+            modify_time = parsed(file).mtime
+            if modify_time is None:
                 logger.warning(f"无法解析文件修改时间: {file['文件修改时间']}")
+            elif modify_time >= six_days_ago:
+                file["处理步骤"] = 1  # 标记为已筛选
+                filtered_files.append(file["文件完整路径"])
     # 输出筛选结果统计
-    logger.info(f"筛选出 {filtered_count} 个符合条件的文件:")
+    logger.info(f"筛选出 {len(filtered_files)} 个符合条件的文件:")
     for file_path in filtered_files:
         logger.info(f"- {file_path}")
-    # 保存数据
-    data_manager.save_data(file_data_list)
-    
-    # 读取分辨率增强倍数配置
-    res_multiplier = config.get('Video', 'res_multiplier', fallback='2')
-    # 开始画面增强处理
-    # 检查是否在允许的时间范围内执行
-    allowed_days = config.get('Schedule', 'AllowedDays', fallback='1-7')
-    start_day, end_day = map(int, allowed_days.split('-'))
-    current_day = datetime.now().weekday() + 1  # Python中周一为0，转换为1-7
-
-    if not (start_day <= current_day <= end_day):
-        logger.info(f"当前星期 {current_day} 不在允许的执行时间范围 {allowed_days} 内，保存数据并退出程序")
-        # 保存数据
-        data_manager.save_data(file_data_list)
-        sys.exit(0)
-    
-    # 检查GPU占用度
-    gpu_threshold = config.getint('Schedule', 'GpuUsageThreshold', fallback=80)
-    try:
-        result = subprocess.run(
-            ['nvidia-smi', '--query-gpu=utilization.gpu', '--format=csv,noheader,nounits'],
-            capture_output=True, text=True, check=True
-        )
-        gpu_usage = int(result.stdout.strip())
-        logger.info(f"当前GPU使用率: {gpu_usage}%")
-
-        if gpu_usage > gpu_threshold:
-            logger.info(f"GPU占用度 {gpu_usage}% 超过阈值 {gpu_threshold}%，保存数据并退出程序")
-            # 保存数据
-            data_manager.save_data(file_data_list)
-            sys.exit(0)
-    except subprocess.CalledProcessError as e:
-        logger.warning(f"获取GPU使用率失败: {e}，将继续执行程序")
-    except (ValueError, Exception) as e:
-        logger.warning(f"GPU检查异常: {e}，将继续执行程序")
+    return filtered_files
 
 
-    # 移除了系统资源获取函数get_system_resources
-    # 因为现在改为直接处理方式，不需要检查系统资源
+def scan_and_save():
+    """完整扫描、分组，并与旧结果合并后保存"""
+    clear_name_cache()
+    scan_skipped_dirs = []
+    file_data_list = scan_library(scan_path, scan_skipped_dirs)
 
+    # 按目录计算分支和处理优先级
+    group_records(file_data_list)
+    logger.info(f"✅ 数据处理完成，共处理 {len(file_data_list)} 个文件")
+
+    # 在跨进程锁内完成"读取旧结果-合并-保存"，避免与其他正在运行的实例互相覆盖状态
+    with data_manager.locked():
+        # 新旧扫描结果对账：未变化的文件保留原有处理状态，文件是否存在以本次扫描为准
+        if data_manager.exists():
+            try:
+                file_data_list = reconcile(load_records(), file_data_list, [scan_path],
+                                           scan_skipped_dirs).merged
+            except (json.JSONDecodeError, KeyError) as e:
+                logger.error(f"加载旧扫描结果失败: {e}，将保存完整扫描结果")
+                # 加载失败时使用完整扫描结果
+                pass
+
+        os.makedirs(DATA_DIR, exist_ok=True)
+        mark_recent_files(file_data_list)
+        # 保存数据
+        data_manager.save_data(file_data_list)
+    return file_data_list
+
+
+def rescan_directories(changed_dirs):
+    """
+    监视模式下只重新扫描发生变化的目录：对这些目录重新分组、与已有记录合并，
+    并通过 batch() 只写回新增、删除和新标记的记录
+    Args:
+        changed_dirs: 发生变化的目录列表（已合并嵌套目录）
+    Returns:
+        新标记为待处理的文件数量
+    """
+    clear_name_cache()
+    new_records = []
+    for dir_path in changed_dirs:
+        if os.path.isdir(dir_path):
+            new_records.extend(scan_videos(dir_path, dir_cache))
+    if dir_cache is not None:
+        dir_cache.save()
+    # 只对有变化的目录重新计算分支和处理优先级
+    group_records(new_records)
+
+    prefixes = [os.path.join(d, '') for d in changed_dirs]
+    def in_changed(dir_path):
+        return dir_path in changed_dirs or dir_path.startswith(tuple(prefixes))
+
+    with data_manager.batch():
+        old_records = [r for r in load_records() if in_changed(r["父目录"])]
+        result = reconcile(old_records, new_records, changed_dirs)
+        marked = mark_recent_files(result.merged)
+
+        # 删除文件已不存在的旧记录，修改过的文件以新记录替换旧记录；
+        # 按路径删除会连带删除同路径的重复记录中被保留的那条，之后重新写回
+        dropped = {record["文件完整路径"] for record in result.removed + [old for old, _ in result.modified]}
+        for path in dropped:
+            data_manager.delete_record({"文件完整路径": path})
+        restored = [record for record in result.unchanged if record["文件完整路径"] in dropped]
+        for record in result.added + [new for _, new in result.modified] + restored:
+            data_manager.add_record(record)
+        for record in result.unchanged:
+            if record["文件完整路径"] in marked:
+                data_manager.update_record({"文件完整路径": record["文件完整路径"], "处理步骤": 0},
+                                           {"处理步骤": 1})
+    logger.info(f"✅ 目录变化已处理: {changed_dirs}，重新扫描 {len(new_records)} 个文件")
+    return len(marked)
 
-    # 移除了资源检查和多进程启动函数check_resource_and_launch
-    # 现在直接处理视频，无需检查系统资源和进程数量
 
-    # 直接遍历处理每个符合条件的文件（替代原来的多进程方式）
+# -------------------------------
+# 5. 调度检查与视频处理
+# -------------------------------
+def check_schedule():
+    """
+    检查当前是否允许执行视频增强处理（是否在处理时间窗口内）；
+    GPU占用度改由处理过程中的后台采样持续检查，GPU繁忙时推迟准入或挂起任务，而不是直接退出
+    Returns:
+        是否允许执行
+    """
+    if not schedule_windows.is_open():
+        next_open = schedule_windows.next_open()
+        logger.info(f"当前不在处理时间窗口内，下一个窗口开始于: "
+                    f"{next_open.strftime('%Y-%m-%d %H:%M') if next_open else '无'}")
+        return False
+    return True
+
+
+def create_job_queue():
+    """按配置创建待处理队列（工作量使用 video_processor 的视频信息探测）"""
+    import video_processor
+    return JobQueue(job_queue_path, create_policy(scheduling_policy, video_processor.prober, **policy_weights))
+
+
+def order_for_window(queue, remaining, estimate_file=None):
+    """
+    剩余窗口有限时，只保留预计能在剩余时间内完成的文件，顺序不变（已按排序策略排列）
+    Args:
+        queue: 按排序策略排列的待处理记录列表
+        remaining: 剩余窗口秒数，None 表示不限时（全部保留）
+        estimate_file: 估算记录处理秒数的函数，默认使用 video_processor.estimate_file（只读取探测缓存）
+    Returns:
+        可以启动的记录列表
+    """
+    if remaining is None:
+        return list(queue)
+    if estimate_file is None:
+        import video_processor
+
+        def estimate_file(record):
+            # 每次准入都会估算全部待处理文件，不能同步运行 ffprobe
+            return video_processor.estimate_file(record, cached_only=True)
+    fitting = []
+    for record in queue:
+        estimate = estimate_file(record)
+        # 没有耗时历史的文件无法估算，视为可以完成
+        if estimate is None or estimate <= remaining:
+            fitting.append(record)
+    return fitting
+
+
+def recover_interrupted():
+    """
+    启动时清理崩溃遗留的残缺临时文件；画面增强已完成但记录未更新的文件直接进入帧率增强，
+    画面增强结果已丢失（残缺、无清单或旧版本遗留被删除）的文件退回处理步骤1重新生成。
+    在数据锁内执行，其他存活实例正在处理的文件（包括被挂起的任务）的临时文件不会被删除
+    """
+    import video_processor
+    with data_manager.locked():
+        active = [record["文件完整路径"] for record in data_manager.claimed_by_others()]
+        recovered = video_processor.recover_checkpoints(active)
+        with data_manager.batch():
+            for source, stages in recovered.items():
+                if checkpoint.STAGE_INTERMEDIATE in stages:
+                    data_manager.update_record({"文件完整路径": source, "处理步骤": 1}, {"处理步骤": 2})
+            active = set(active)
+            for record in data_manager.query_by_steps([2]):
+                source = record["文件完整路径"]
+                if source not in active and checkpoint.STAGE_INTERMEDIATE not in recovered.get(source, ()):
+                    logger.warning(f"画面增强结果已丢失，退回重新处理: {source}")
+                    data_manager.update_record({"文件完整路径": source, "处理步骤": 2}, {"处理步骤": 1})
+
+
+# 处理失败的文件：(文件完整路径, 文件大小, 文件修改时间) -> (连续失败次数, 可以重试的 monotonic 时刻)；
+# 源文件被替换（大小或修改时间变化）后按新文件重新计算
+failed_files = {}
+
+
+def _failure_key(record):
+    return (record["文件完整路径"], record.get("文件大小 (字节)"), record.get("文件修改时间"))
+
+
+def record_outcome(record, progressed):
+    """
+    记录一次处理结果：取得进展时清除失败记录，否则按失败次数推迟重试
+    Args:
+        record: 处理的记录
+        progressed: 处理步骤或分段进度是否前进
+    """
+    key = _failure_key(record)
+    if progressed:
+        failed_files.pop(key, None)
+        return
+    attempts = failed_files.get(key, (0, 0))[0] + 1
+    if attempts >= max_failures:
+        failed_files[key] = (attempts, float('inf'))
+        logger.error(f"文件连续处理失败 {attempts} 次，本次运行不再重试: {record['文件完整路径']}")
+        return
+    delay = retry_backoff_seconds * 2 ** (attempts - 1)
+    failed_files[key] = (attempts, time.monotonic() + delay)
+    logger.warning(f"文件处理失败（第 {attempts} 次），{delay / 60:.0f} 分钟后重试: {record['文件完整路径']}")
+
+
+def backing_off(record):
+    """记录是否因处理失败处于等待重试期间"""
+    entry = failed_files.get(_failure_key(record))
+    return entry is not None and time.monotonic() < entry[1]
+
+
+def process_claimed_file(file, pipeline=None):
+    """
+    处理一个已占用的记录，处理结束（启用流水线时为结果移出完成）后释放占用
+    Args:
+        file: 已占用的记录
+        pipeline: 可选的 IOPipeline
+    Returns:
+        是否处理成功
+    """
+    import video_processor
+    start_step = file.get("处理步骤")
+    start_segments = len(file.get(video_processor.SEGMENT_KEY) or [])
+    start_time = time.monotonic()
+    success = False
+    try:
+        success = video_processor.video_processorn(
+            file, tmp_dir, video2x_path, res_width, res_height, res_processor,
+            res_shader, res_encoder, res_preset, res_crf, frame_multiplier,
+            frame_processor, rife_model, frame_encoder, frame_preset, frame_crf,
+            threads, pipeline)
+    finally:
+        seconds = time.monotonic() - start_time
+        if pipeline is not None:
+            # 处理结束仍未使用的预取（例如源文件已达到目标而跳过）立即释放
+            pipeline.release(file["文件完整路径"])
+
+        def release():
+            data_manager.release_record(file["文件完整路径"])
+            # 处理函数内部记录错误后正常返回，以处理步骤和分段进度是否前进判断是否失败
+            record_outcome(file, success and (file.get("处理步骤") != start_step
+                                              or file.get(video_processor.SKIPPED_KEY)
+                                              or len(file.get(video_processor.SEGMENT_KEY) or []) > start_segments))
+            if (file.get("处理步骤") or 0) >= 2.5 and not file.get(video_processor.SKIPPED_KEY):
+                # 结果已移回原目录，记录本次耗时（不含移出）；源文件已达到目标而跳过的文件不计入
+                throughput_history.record(file["文件完整路径"], file.get("文件大小 (字节)"), start_step, seconds)
+
+        # 结果移出完成后才释放占用，避免其他进程重复处理
+        if pipeline is not None:
+            pipeline.defer(release)
+        else:
+            release()
+    if success:
+        logger.info(f"成功处理文件: {file.get('文件名带扩展名', '未知文件')}")
+    else:
+        logger.error(f"处理文件失败: {file.get('文件名带扩展名', '未知文件')}")
+    return success
+
+
+def process_pending_files():
+    """
+    处理处理步骤为1或2的文件：同时运行的任务数不超过 MaxConcurrentJobs，
+    只有GPU使用率和显存占用低于准入上限时才启动下一个任务；
+    处理期间后台持续采样，GPU被其他程序占满时挂起正在运行的 video2x，回落后恢复。
+    文件按排序策略（Policy）的顺序处理；处理时间窗口有限时跳过预计无法在剩余时间内完成的文件，
+    窗口结束后不再启动新任务，超过 WindowGraceMinutes 仍未完成的任务被终止
+    Returns:
+        处理的文件数量
+    """
     processed_count = 0
-    
+    # 导入video_processor模块，逐个调用video_processorn函数处理文件
+    import video_processor
+    pipeline = IOPipeline(prefetch_depth, tmp_budget_bytes, min_free_bytes,
+                          video_processor.record_prefetch, video_processor.discard_prefetch) if prefetch_depth > 0 else None
+    sampler = GpuSampler(gpu_provider, interval=sample_interval, pause_utilization=pause_gpu_usage,
+                         resume_utilization=resume_gpu_usage, pause_memory_percent=pause_memory_percent,
+                         resume_memory_percent=resume_memory_percent, samples=pause_samples)
+    admission = AdmissionController(gpu_provider, max_concurrent_jobs, admit_gpu_usage,
+                                    admit_memory_percent, admit_settle_seconds,
+                                    sampler=sampler, start_utilization=gpu_usage_threshold)
+    running = {}  # Future -> 记录，同名文件共用临时路径，不能同时处理
+    # 当前时间窗口的结束时刻（monotonic），None 表示不限时
+    remaining = schedule_windows.remaining_seconds()
+    deadline = None if remaining is None else time.monotonic() + remaining
+
+    def seconds_left():
+        return None if deadline is None else deadline - time.monotonic()
+
     try:
-        for file in file_data_list:
-            if file.get("处理步骤") == 1 or file.get("处理步骤") == 2:
-                # 直接调用video_processor.py中的video_processorn函数处理文件
-                # 导入video_processor模块并调用video_processorn函数
-                import video_processor
-                success = video_processor.video_processorn(
-                    file, tmp_dir, video2x_path, res_width, res_height, res_processor,
-                    res_shader, res_encoder, res_preset, res_crf, frame_multiplier,
-                    frame_processor, rife_model, frame_encoder, frame_preset, frame_crf,
-                    threads)
-                if success:
-                    logger.info(f"成功处理文件: {file.get('文件名带扩展名', '未知文件')}")
-                else:
-                    logger.error(f"处理文件失败: {file.get('文件名带扩展名', '未知文件')}")
-                processed_count += 1
+        sampler.start()
+        # 通过数据管理器查询待处理记录（SQLite后端走处理步骤索引）
+        job_queue = create_job_queue()
+        queue = job_queue.order(data_manager.query_by_steps((1, 2)))
+        job_queue.save()
+        # 处理失败后等待重试的文件本轮跳过
+        waiting = [record for record in queue if backing_off(record)]
+        if waiting:
+            logger.info(f"{len(waiting)} 个文件处理失败后等待重试，本轮跳过")
+            queue = [record for record in queue if not backing_off(record)]
+        # 排序只使用已缓存的视频信息，未缓存的文件在后台探测，结果用于本次的窗口估算和下次运行的排序
+        video_processor.prober.warm(queue)
+        with ThreadPoolExecutor(max_workers=max_concurrent_jobs, thread_name_prefix='job') as executor:
+            while queue:
+                # 等待准入：任务数未满、GPU有余量且没有同名文件正在处理
+                while True:
+                    for future in [f for f in running if f.done()]:
+                        running.pop(future)
+                        processed_count += 1
+                    remaining = seconds_left()
+                    if remaining is not None and remaining <= 0:
+                        logger.info(f"处理时间窗口已结束，不再启动新任务，剩余 {len(queue)} 个文件留到下一个窗口")
+                        candidates = []
+                        break
+                    candidates = order_for_window(queue, remaining)
+                    if not candidates:
+                        logger.info(f"剩余窗口 {remaining / 60:.0f} 分钟内预计无法完成任何待处理文件，不再启动新任务")
+                        break
+                    running_names = {r["文件名带扩展名"] for r in running.values()}
+                    pending = next((c for c in candidates if c["文件名带扩展名"] not in running_names), None)
+                    if pending is not None and admission.admit(len(running)):
+                        break
+                    if running:
+                        wait(list(running), timeout=ADMIT_POLL_SECONDS, return_when=FIRST_COMPLETED)
+                    else:
+                        time.sleep(ADMIT_POLL_SECONDS)
+                if not candidates:
+                    break
+                queue.remove(pending)
+                # 先占用记录，已被其他存活进程领取的文件直接跳过
+                file = data_manager.claim_record(pending["文件完整路径"], (1, 2))
+                if file is None:
+                    logger.info(f"文件已被其他进程领取，跳过: {pending.get('文件名带扩展名', '未知文件')}")
+                    if pipeline is not None:
+                        pipeline.release(pending["文件完整路径"])
+                    continue
+                file = VideoRecord.from_dict(file)
+                if pipeline is not None:
+                    # 处理当前文件期间预取后续文件；同名文件共用临时路径，与正在处理的文件同名的不预取，
+                    # 否则会覆盖其临时副本
+                    busy = {r["文件名带扩展名"] for r in running.values()} | {file["文件名带扩展名"]}
+                    upcoming_files = []
+                    for c in candidates:
+                        if c is not pending and c["文件名带扩展名"] not in busy:
+                            busy.add(c["文件名带扩展名"])
+                            upcoming_files.append(c)
+                    upcoming_files = upcoming_files[:prefetch_depth]
+                    # 已不在预取范围内（超出处理窗口或被排到后面）的文件释放其预取名额
+                    pipeline.retain({r["文件完整路径"] for r in [file, *running.values(), *upcoming_files]})
+                    for upcoming in upcoming_files:
+                        staging = video_processor.staging_path(upcoming, tmp_dir)
+                        if staging is not None and not pipeline.prefetch(
+                                upcoming["文件完整路径"], staging, upcoming.get("文件大小 (字节)", 0)):
+                            break
+                running[executor.submit(process_claimed_file, file, pipeline)] = file
+            if running and deadline is not None:
+                # 窗口结束后最多再等待 WindowGraceMinutes，仍在运行的任务被终止；
+                # 已完成的阶段有检查点，分段模式下已完成的分段有进度记录，下一个窗口继续
+                _, not_done = wait(list(running), timeout=max(0, seconds_left() + window_grace_seconds))
+                if not_done:
+                    logger.warning(f"处理时间窗口已结束，终止 {len(not_done)} 个仍在运行的任务")
+                    processes.terminate_all()
+            processed_count += len(running)
     except Exception as e:
         logger.error(f"处理文件时出错: {e}")
-    
-    
-    
+    finally:
+        processes.reset()
+        sampler.stop()
+        if pipeline is not None:
+            move_errors = pipeline.close()
+            if move_errors:
+                logger.error(f"{len(move_errors)} 个文件已移回原目录但后续的记录更新失败: "
+                             f"{[dst for dst, _ in move_errors]}")
+        video_processor.prober.save()
+
     logger.info(f"总共处理了 {processed_count} 个文件")
-    # 由于改为直接处理方式，不再需要等待多进程任务完成
-    # 所有视频文件已经在上面的循环中处理完毕
-    logger.info("所有视频文件处理完成")
+    return processed_count
+
 
+def shutdown_if_enabled():
+    """任务完成后按配置自动关机，期间检测到键盘或鼠标活动则取消"""
     # 检查是否启用自动关机
     auto_shutdown = config.getboolean('Schedule', 'AutoShutdown', fallback=False)
     if auto_shutdown:
@@ -656,6 +758,147 @@ try:
         logger.info("所有任务已完成，自动关机功能已禁用")
         sys.exit(0)
 
-except Exception as e:
-    logger.critical("💥 扫描过程中发生严重错误: %s", e, exc_info=True)
-    sys.exit(1)
+# -------------------------------
+# 6. 运行模式
+# -------------------------------
+def run_once():
+    """单次运行：扫描、分组、处理，完成后按配置关机（任务计划程序调用的默认模式）"""
+    scan_and_save()
+
+    if not check_schedule():
+        # 扫描结果已在上面保存，这里不再重复写入，以免覆盖其他实例的状态更新
+        logger.info("不满足执行条件，退出程序")
+        sys.exit(0)
+
+    process_pending_files()
+    # 所有视频文件已经在上面的循环中处理完毕
+    logger.info("所有视频文件处理完成")
+    shutdown_if_enabled()
+
+
+def run_watch_mode():
+    """
+    常驻监视模式：启动时完整扫描一次，之后只对发生变化的目录增量扫描、分组并标记，
+    新文件在稳定 SettleSeconds 秒后进入处理队列
+    """
+    watch_mode = config.get('Watch', 'Mode', fallback='auto')
+    poll_interval = config.getfloat('Watch', 'PollInterval', fallback=60)
+    settle_seconds = config.getfloat('Watch', 'SettleSeconds', fallback=30)
+
+    watcher = create_watcher(scan_path, watch_mode, poll_interval)
+    logger.info(f"进入监视模式: {type(watcher).__name__}，目录: {scan_path}")
+    scan_and_save()
+    try:
+        while True:
+            pending = [record for record in data_manager.query_by_steps((1, 2)) if not backing_off(record)]
+            if pending and check_schedule():
+                process_pending_files()
+
+            changed = watcher.poll(poll_interval)
+            if not changed:
+                continue
+            # 等待目录稳定（下载或复制仍在进行时会持续产生事件）
+            while True:
+                more = watcher.poll(settle_seconds)
+                if not more:
+                    break
+                changed |= more
+            rescan_directories(collapse_directories(changed))
+    finally:
+        watcher.close()
+
+
+def format_duration(seconds):
+    """把秒数格式化为 "X小时YY分" """
+    minutes = int(round(seconds / 60))
+    return f"{minutes // 60}小时{minutes % 60:02d}分" if minutes >= 60 else f"{minutes}分"
+
+
+def print_plan():
+    """
+    打印当前待处理文件的预计开始和完成时间：按处理时的选择顺序（排序策略，时间窗口有限时跳过放不下的文件）、
+    MaxConcurrentJobs 个任务并行模拟，耗时由历史记录估算，不实际处理文件
+    """
+    import video_processor
+    estimates = {}
+    unknown, unfit = [], []
+    records = data_manager.query_by_steps((1, 2))
+    # 只打印计划，不急于开始处理，先探测全部未缓存的文件再排序
+    for record in records:
+        video_processor.prober.info(record)
+    for record in create_job_queue().order(records):
+        estimate = video_processor.estimate_file(record)
+        if estimate is None:
+            unknown.append(record)
+        else:
+            estimates[record["文件完整路径"]] = (estimate, record)
+    video_processor.prober.save()
+
+    def estimate_of(record):
+        return estimates[record["文件完整路径"]][0]
+
+    queue = [record for _, record in estimates.values()]
+
+    now = datetime.now()
+    lanes = [now] * max_concurrent_jobs  # 每个并行任务位的空闲时间
+    rows = []
+    while queue:
+        lane = min(range(len(lanes)), key=lanes.__getitem__)
+        start = lanes[lane]
+        remaining = schedule_windows.remaining_seconds(start)
+        candidates = order_for_window(queue, remaining, estimate_of) if remaining != 0 else []
+        if not candidates:
+            # 当前窗口放不下任何文件，移到下一个能放下最短文件的窗口
+            shortest = min(queue, key=estimate_of)
+            next_start = schedule_windows.next_fit(start + timedelta(seconds=remaining or 0), estimate_of(shortest))
+            if next_start is None:
+                # 剩余文件都超过任何一个处理时间窗口的长度
+                unfit.extend(queue)
+                break
+            lanes[lane] = max(next_start, start + timedelta(seconds=1))
+            continue
+        record = candidates[0]
+        queue.remove(record)
+        end = start + timedelta(seconds=estimate_of(record))
+        lanes[lane] = end
+        rows.append((start, end, estimate_of(record), record))
+
+    print(f"待处理文件 {len(rows) + len(unknown) + len(unfit)} 个，并行任务数 {max_concurrent_jobs}")
+    # 中文表头每个字占两列宽
+    print(f"{'预计开始':<12}  {'预计完成':<12}  {'耗时':>5}  文件")
+    for start, end, seconds, record in rows:
+        minutes = int(round(seconds / 60))
+        print(f"{start:%Y-%m-%d %H:%M}  {end:%Y-%m-%d %H:%M}  {minutes // 60:>4}:{minutes % 60:02d}  {record['文件完整路径']}")
+    if rows:
+        total = sum(seconds for _, _, seconds, _ in rows)
+        print(f"合计处理时间 {format_duration(total)}，预计全部完成于 {max(end for _, end, _, _ in rows):%Y-%m-%d %H:%M}")
+    if unfit:
+        print(f"预计耗时超过任何一个处理时间窗口的文件 {len(unfit)} 个：")
+        for record in unfit:
+            print(f"  {format_duration(estimate_of(record))}  {record['文件完整路径']}")
+    if unknown:
+        print(f"没有耗时历史、无法估算的文件 {len(unknown)} 个（处理过同类文件后即可估算）")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Auto-Video2x 视频质量增强工具")
+    parser.add_argument('--watch', action='store_true', help="常驻监视模式，目录变化时增量处理新文件")
+    parser.add_argument('--plan', action='store_true', help="只打印待处理文件的预计完成时间，不处理文件")
+    args = parser.parse_args()
+
+    if args.plan:
+        print_plan()
+        return
+    try:
+        recover_interrupted()
+        if args.watch:
+            run_watch_mode()
+        else:
+            run_once()
+    except Exception as e:
+        logger.critical("💥 扫描过程中发生严重错误: %s", e, exc_info=True)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
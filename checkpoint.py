@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""
+处理检查点模块
+
+每个正在处理的源文件在 tmp/checkpoints 下有一个清单，记录已完成阶段产生的临时文件
+（路径、大小和抽样哈希）。只有阶段成功结束后才写入清单，因此：
+- 清单中且校验通过的临时文件是完整的，重新运行时直接复用；
+- 不在任何清单中的临时文件（崩溃时未写完的输出、未改名的 .part 文件）是残缺的，
+  启动时的恢复过程会把它们删除，避免帧率增强误用被截断的中间文件。
+"""
+import hashlib
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+# 抽样哈希读取的块大小：文件开头、中间和结尾各读取一块
+HASH_BLOCK = 1 << 20
+
+# 阶段名称：tmp/raw 中的源文件副本、帧率增强的输入（画面增强结果或源文件副本）、
+# 尚未移回原目录的帧率增强结果
+STAGE_RAW = 'raw'
+STAGE_INTERMEDIATE = 'intermediate'
+STAGE_OUTPUT = 'output'
+
+
+def sample_hash(path, size=None):
+    """
+    文件的抽样哈希（大小 + 开头、中间、结尾各 1 MiB），多 GB 的文件也只需读取 3 MiB
+    Args:
+        path: 文件路径
+        size: 已知的文件大小，省略时重新获取
+    Returns:
+        十六进制哈希字符串
+    """
+    if size is None:
+        size = os.path.getsize(path)
+    digest = hashlib.sha1(str(size).encode())
+    with open(path, 'rb') as f:
+        for offset in sorted({0, max(0, size // 2 - HASH_BLOCK // 2), max(0, size - HASH_BLOCK)}):
+            f.seek(offset)
+            digest.update(f.read(HASH_BLOCK))
+    return digest.hexdigest()
+
+
+def _path_key(path):
+    return os.path.normcase(os.path.abspath(path))
+
+
+class CheckpointStore:
+    """按源文件保存检查点清单"""
+    def __init__(self, directory):
+        """
+        初始化检查点存储
+        Args:
+            directory: 清单所在目录
+        """
+        self.directory = directory
+
+    def _manifest_path(self, source):
+        name = hashlib.sha1(source.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, f"{name}.json")
+
+    def load(self, source):
+        """读取源文件的清单，不存在或损坏时返回 None"""
+        try:
+            with open(self._manifest_path(source), encoding='utf-8') as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"检查点清单损坏，忽略: {source}: {e}")
+            return None
+        return manifest if manifest.get("source") == source else None
+
+    def _write(self, manifest):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._manifest_path(manifest["source"])
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+
+    def record(self, source, stage, path):
+        """
+        阶段成功结束后记录其产生的临时文件
+        Args:
+            source: 源文件路径
+            stage: 阶段名称
+            path: 该阶段产生的临时文件
+        """
+        size = os.path.getsize(path)
+        manifest = self.load(source) or {"source": source, "stages": {}}
+        manifest["stages"][stage] = {"path": path, "size": size, "hash": sample_hash(path, size),
+                                     "time": time.strftime('%Y-%m-%d %H:%M:%S')}
+        self._write(manifest)
+
+    @staticmethod
+    def _valid(entry):
+        try:
+            size = os.path.getsize(entry["path"])
+            return size == entry["size"] and sample_hash(entry["path"], size) == entry["hash"]
+        except (OSError, KeyError, TypeError):
+            return False
+
+    def verify(self, source, stage, path):
+        """
+        检查某阶段的临时文件是否完整
+        Args:
+            source: 源文件路径
+            stage: 阶段名称
+            path: 期望的临时文件路径
+        Returns:
+            清单中记录了该文件且大小、哈希一致时返回 True
+        """
+        manifest = self.load(source)
+        entry = manifest and manifest["stages"].get(stage)
+        return bool(entry) and entry["path"] == path and self._valid(entry)
+
+    def discard(self, source, stage=None):
+        """删除某阶段的检查点，stage 为 None 时删除整个清单"""
+        manifest = self.load(source)
+        if manifest is None:
+            return
+        if stage is not None:
+            manifest["stages"].pop(stage, None)
+        if stage is None or not manifest["stages"]:
+            try:
+                os.remove(self._manifest_path(source))
+            except FileNotFoundError:
+                pass
+        else:
+            self._write(manifest)
+
+    def recover(self, tmp_dirs, grace_seconds=600, keep=None):
+        """
+        启动时的恢复过程：校验全部清单，删除残缺和无主的临时文件
+        Args:
+            tmp_dirs: 需要清理的临时目录（只检查目录下的文件，不递归）
+            grace_seconds: 最近修改时间在该秒数内的无主文件视为其他进程正在写入，不删除
+            keep: 可选的函数，接收临时文件路径，返回 True 时不删除（例如其他存活进程正在处理的文件）
+        Returns:
+            {源文件路径: 校验通过的阶段名称集合}
+        """
+        valid, referenced = {}, set()
+        names = os.listdir(self.directory) if os.path.isdir(self.directory) else []
+        for name in names:
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.directory, name), encoding='utf-8') as f:
+                    manifest = json.load(f)
+                source = manifest["source"]
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning(f"删除损坏的检查点清单 {name}: {e}")
+                os.remove(os.path.join(self.directory, name))
+                continue
+            stages = {stage for stage, entry in manifest["stages"].items() if self._valid(entry)}
+            for stage in set(manifest["stages"]) - stages:
+                logger.warning(f"检查点校验失败，丢弃阶段 {stage}: {source}")
+                self.discard(source, stage)
+            if stages:
+                valid[source] = stages
+                referenced.update(_path_key(manifest["stages"][stage]["path"]) for stage in stages)
+
+        now = time.time()
+        for tmp_dir in tmp_dirs:
+            if not os.path.isdir(tmp_dir):
+                continue
+            with os.scandir(tmp_dir) as it:
+                for entry in it:
+                    if not entry.is_file() or _path_key(entry.path) in referenced:
+                        continue
+                    if keep is not None and keep(entry.path):
+                        continue
+                    try:
+                        if now - entry.stat().st_mtime < grace_seconds:
+                            continue
+                        os.remove(entry.path)
+                        logger.info(f"已删除残缺的临时文件: {entry.path}")
+                    except OSError as e:
+                        logger.warning(f"删除临时文件失败: {entry.path}: {e}")
+        if valid:
+            logger.info(f"检查点恢复: {len(valid)} 个文件的已完成阶段可直接复用")
+        return valid
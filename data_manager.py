@@ -1,24 +1,180 @@
 import json
 import os
 import logging
+import socket
+import sqlite3
+import threading
+from contextlib import contextmanager
 from typing import List, Dict, Any, Optional
 
+from video_record import json_default
+
+# 主键字段：文件完整路径，用于建立内存索引
+PRIMARY_KEY = "文件完整路径"
+
+# 记录版本字段：每次更新自增，用于乐观并发控制
+VERSION_KEY = "记录版本"
+# 记录占用字段：值为 "主机名:进程号"，表示该记录正在被哪个进程处理
+OWNER_KEY = "占用进程"
+
+
+def _match(record: Dict[str, Any], condition: Dict[str, Any]) -> bool:
+    """判断记录是否满足键值对条件"""
+    return all(record.get(k) == v for k, v in condition.items())
+
+
+def current_owner() -> str:
+    """当前进程的占用标识"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _pid_alive(pid: int) -> bool:
+    """判断本机上的进程是否仍在运行"""
+    if os.name == 'nt':
+        import ctypes
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle:
+            return False
+        exit_code = ctypes.c_ulong()
+        kernel32.GetExitCodeProcess(handle, ctypes.byref(exit_code))
+        kernel32.CloseHandle(handle)
+        return exit_code.value == 259  # STILL_ACTIVE
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _owner_alive(owner: Optional[str]) -> bool:
+    """占用标识对应的进程是否仍然有效，其他主机上的占用一律视为有效"""
+    if not owner:
+        return False
+    host, _, pid = owner.rpartition(':')
+    if host != socket.gethostname():
+        return True
+    try:
+        return _pid_alive(int(pid))
+    except ValueError:
+        return False
+
+
+class FileLock:
+    """
+    基于锁文件的跨进程咨询锁
+    Linux 使用 fcntl.flock，Windows 使用 msvcrt.locking；同一实例在同一线程内可重入
+    """
+    def __init__(self, lock_path: str):
+        self.lock_path = lock_path
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._fd = None
+
+    def acquire(self):
+        self._thread_lock.acquire()
+        if self._depth == 0:
+            try:
+                os.makedirs(os.path.dirname(self.lock_path) or '.', exist_ok=True)
+                fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+                if os.name == 'nt':
+                    import msvcrt
+                    while True:
+                        try:
+                            os.lseek(fd, 0, os.SEEK_SET)
+                            # LK_LOCK 自身会重试约10秒，超时后继续等待
+                            msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+                            break
+                        except OSError:
+                            continue
+                else:
+                    import fcntl
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+                self._fd = fd
+            except Exception:
+                self._thread_lock.release()
+                raise
+        self._depth += 1
+
+    def release(self):
+        self._depth -= 1
+        if self._depth == 0:
+            try:
+                if os.name == 'nt':
+                    import msvcrt
+                    os.lseek(self._fd, 0, os.SEEK_SET)
+                    msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+                else:
+                    import fcntl
+                    fcntl.flock(self._fd, fcntl.LOCK_UN)
+            finally:
+                os.close(self._fd)
+                self._fd = None
+        self._thread_lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+
+
+def _apply_updates(record: Dict[str, Any], updates: Dict[str, Any]):
+    """应用更新并递增记录版本，忽略更新内容中携带的旧版本号"""
+    version = record.get(VERSION_KEY, 0)
+    record.update(updates)
+    record[VERSION_KEY] = version + 1
+
+
 class DataManager:
     """用于对JSON数据进行增删改查操作的数据管理器"""
-    def __init__(self, data_file_path: str):
+    def __init__(self, data_file_path: str, cache: bool = False):
         """
         初始化数据管理器
         Args:
             data_file_path: JSON数据文件的路径
+            cache: 是否在内存中缓存解析后的记录，文件修改时间或大小变化时才重新加载
         """
         self.data_file_path = data_file_path
         self.logger = logging.getLogger(__name__)
-    def load_data(self) -> List[Dict[str, Any]]:
+        self.cache_enabled = cache
+        self._cache: Optional[List[Dict[str, Any]]] = None
+        self._cache_signature = None
+        self._cache_index: Optional[Dict[Any, List[int]]] = None
+        self._batch_depth = 0
+        self._batch_dirty = False
+        # 所有写操作都在跨进程锁内完成"读取-修改-写回"
+        self._file_lock = FileLock(f"{data_file_path}.lock")
+
+    def locked(self):
         """
-        从JSON文件加载数据
-        Returns:
-            包含数据的列表
+        获取数据文件的跨进程写锁，可与 batch() 及各写操作嵌套使用
+
+        用法:
+            with data_manager.locked():
+                data = data_manager.load_data()
+                ...
+                data_manager.save_data(data)
         """
+        return self._file_lock
+
+    def exists(self) -> bool:
+        """数据文件是否已存在"""
+        return os.path.exists(self.data_file_path)
+
+    def _file_signature(self):
+        """数据文件的 (修改时间ns, 大小)，文件不存在时返回None"""
+        try:
+            st = os.stat(self.data_file_path)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def _read_file(self) -> List[Dict[str, Any]]:
+        """从JSON文件读取全部记录"""
         try:
             if os.path.exists(self.data_file_path):
                 with open(self.data_file_path, 'r', encoding='utf-8') as f:
@@ -30,6 +186,104 @@ class DataManager:
         except Exception as e:
             self.logger.error(f"加载数据时发生错误: {e}")
             return []
+
+    def _write_file(self, data: List[Dict[str, Any]]):
+        """原子地写入JSON文件：先写临时文件，再用 os.replace 替换，避免崩溃时截断数据文件"""
+        # 确保目录存在
+        os.makedirs(os.path.dirname(self.data_file_path), exist_ok=True)
+        tmp_path = f"{self.data_file_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            # 内存中的 VideoRecord 在这里按原有 JSON 格式写出
+            json.dump(data, f, ensure_ascii=False, indent=2, default=json_default)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.data_file_path)
+
+    def _working_data(self) -> List[Dict[str, Any]]:
+        """
+        获取用于读写的记录列表
+        启用缓存或处于batch()中时返回内存中的列表，否则每次重新读取文件
+        """
+        if self._batch_depth and self._cache is not None:
+            # 事务进行中以内存数据为准
+            return self._cache
+        if self.cache_enabled or self._batch_depth:
+            signature = self._file_signature()
+            if self._cache is None or signature != self._cache_signature:
+                self._cache = self._read_file()
+                self._cache_signature = signature
+                self._cache_index = None
+            return self._cache
+        return self._read_file()
+
+    def _commit(self, data: List[Dict[str, Any]]) -> bool:
+        """提交修改后的记录列表，batch()中只标记为待写回；写入失败时丢弃已被就地修改的缓存"""
+        if self._batch_depth:
+            self._cache = data
+            self._batch_dirty = True
+            return True
+        if self.save_data(data):
+            return True
+        # 缓存已被就地修改而文件未写入，签名仍与文件一致，必须丢弃，下次重新读取文件
+        self._cache = None
+        self._cache_index = None
+        return False
+
+    def _find_indices(self, data: List[Dict[str, Any]], condition: Dict[str, Any]) -> List[int]:
+        """查找满足条件的记录下标，对缓存数据按文件完整路径走索引"""
+        if PRIMARY_KEY in condition and data is self._cache:
+            if self._cache_index is None:
+                self._cache_index = {}
+                for i, record in enumerate(data):
+                    self._cache_index.setdefault(record.get(PRIMARY_KEY), []).append(i)
+            candidates = self._cache_index.get(condition[PRIMARY_KEY], [])
+        else:
+            candidates = range(len(data))
+        return [i for i in candidates if _match(data[i], condition)]
+
+    @contextmanager
+    def batch(self):
+        """
+        批量修改上下文，期间的 add_record/update_record/delete_record
+        只修改内存数据，退出时一次性原子写回；发生异常时放弃全部修改
+
+        用法:
+            with data_manager.batch():
+                data_manager.update_record(...)
+                data_manager.add_record(...)
+        """
+        self._file_lock.acquire()
+        self._batch_depth += 1
+        try:
+            yield self
+        except Exception:
+            if self._batch_depth == 1:
+                self._cache = None
+                self._cache_signature = None
+                self._cache_index = None
+                self._batch_dirty = False
+            raise
+        else:
+            if self._batch_depth == 1 and self._batch_dirty:
+                self._batch_dirty = False
+                self.save_data(self._cache)
+        finally:
+            self._batch_depth -= 1
+            if not self._batch_depth and not self.cache_enabled:
+                self._cache = None
+                self._cache_index = None
+            self._file_lock.release()
+
+    def load_data(self) -> List[Dict[str, Any]]:
+        """
+        从JSON文件加载数据
+        Returns:
+            包含数据的列表
+        """
+        if self.cache_enabled or self._batch_depth:
+            # 返回副本，避免调用方修改缓存中的记录
+            return [dict(record) for record in self._working_data()]
+        return self._read_file()
     
     def save_data(self, data: List[Dict[str, Any]]) -> bool:
         """
@@ -40,10 +294,12 @@ class DataManager:
             保存是否成功
         """
         try:
-            # 确保目录存在
-            os.makedirs(os.path.dirname(self.data_file_path), exist_ok=True)
-            with open(self.data_file_path, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
+            with self._file_lock:
+                self._write_file(data)
+            if self.cache_enabled or self._batch_depth:
+                self._cache = [dict(record) for record in data]
+                self._cache_signature = self._file_signature()
+                self._cache_index = None
             self.logger.info(f"数据已保存到: {self.data_file_path}")
             return True
         except Exception as e:
@@ -61,11 +317,17 @@ class DataManager:
             添加是否成功
         """
         try:
-            data = self.load_data()
-            data.append(record)
-            return self.save_data(data)
+            with self._file_lock:
+                data = self._working_data()
+                data.append(dict(record))
+                if data is self._cache and self._cache_index is not None:
+                    self._cache_index.setdefault(record.get(PRIMARY_KEY), []).append(len(data) - 1)
+                return self._commit(data)
         except Exception as e:
             self.logger.error(f"添加记录时发生错误: {e}")
+            if not self._batch_depth:
+                self._cache = None
+                self._cache_index = None
             return False
     
     def delete_record(self, condition: Dict[str, Any]) -> int:
@@ -79,53 +341,61 @@ class DataManager:
             删除的记录数量
         """
         try:
-            data = self.load_data()
-            original_length = len(data)
-            
-            # 过滤掉满足条件的记录
-            data = [record for record in data if not all(record.get(k) == v for k, v in condition.items())]
-            
-            deleted_count = original_length - len(data)
-            
-            if deleted_count > 0:
-                self.save_data(data)
-                self.logger.info(f"成功删除 {deleted_count} 条记录")
+            with self._file_lock:
+                data = self._working_data()
+                indices = set(self._find_indices(data, condition))
+                deleted_count = len(indices)
+
+                if deleted_count > 0:
+                    # 过滤掉满足条件的记录
+                    data = [record for i, record in enumerate(data) if i not in indices]
+                    self._cache_index = None
+                    if not self._commit(data):
+                        return 0
+                    self.logger.info(f"成功删除 {deleted_count} 条记录")
             
             return deleted_count
         except Exception as e:
             self.logger.error(f"删除记录时发生错误: {e}")
             return 0
     
-    def update_record(self, condition: Dict[str, Any], updates: Dict[str, Any]) -> int:
+    def update_record(self, condition: Dict[str, Any], updates: Dict[str, Any],
+                      expected_version: Optional[int] = None) -> int:
         """
-        根据条件更新记录
+        根据条件更新记录，每条被更新记录的记录版本加1
         
         Args:
             condition: 更新条件，键值对形式
             updates: 要更新的字段和值
+            expected_version: 乐观并发控制，仅更新记录版本等于该值的记录
             
         Returns:
             更新的记录数量
         """
         try:
-            data = self.load_data()
-            updated_count = 0
-            
-            for record in data:
-                # 检查是否满足更新条件
-                if all(record.get(k) == v for k, v in condition.items()):
+            with self._file_lock:
+                data = self._working_data()
+                indices = [i for i in self._find_indices(data, condition)
+                           if expected_version is None or data[i].get(VERSION_KEY, 0) == expected_version]
+
+                for i in indices:
                     # 更新记录
-                    for key, value in updates.items():
-                        record[key] = value
-                    updated_count += 1
-            
-            if updated_count > 0:
-                self.save_data(data)
-                self.logger.info(f"成功更新 {updated_count} 条记录")
+                    _apply_updates(data[i], updates)
+                updated_count = len(indices)
+
+                if updated_count > 0:
+                    if PRIMARY_KEY in updates:
+                        self._cache_index = None
+                    if not self._commit(data):
+                        return 0
+                    self.logger.info(f"成功更新 {updated_count} 条记录")
             
             return updated_count
         except Exception as e:
             self.logger.error(f"更新记录时发生错误: {e}")
+            if not self._batch_depth:
+                self._cache = None
+                self._cache_index = None
             return 0
     
     def query_records(self, condition: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
@@ -139,17 +409,633 @@ class DataManager:
             符合条件的记录列表
         """
         try:
-            data = self.load_data()
-            
             if condition is None:
-                return data
+                return self.load_data()
+            data = self._working_data()
             # 过滤满足条件的记录
-            result = [record for record in data if all(record.get(k) == v for k, v in condition.items())]
+            result = [data[i] for i in self._find_indices(data, condition)]
+            if data is self._cache:
+                result = [dict(record) for record in result]
             return result
         except Exception as e:
             self.logger.error(f"查询记录时发生错误: {e}")
             return []
 
+    def claim_record(self, path: str, steps, owner: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        以原子方式占用一条待处理记录，供多个工作进程并发领取任务
+        Args:
+            path: 文件完整路径
+            steps: 允许被领取的处理步骤集合
+            owner: 占用标识，默认为当前 "主机名:进程号"
+        Returns:
+            占用成功时返回占用后的记录，记录不存在、步骤不符或已被其他存活进程占用时返回None
+        """
+        owner = owner or current_owner()
+        steps = set(steps)
+        with self.locked():
+            for record in self.query_records({PRIMARY_KEY: path}):
+                if record.get("处理步骤") not in steps:
+                    continue
+                holder = record.get(OWNER_KEY)
+                if holder and holder != owner and _owner_alive(holder):
+                    continue
+                version = record.get(VERSION_KEY, 0)
+                if self.update_record({PRIMARY_KEY: path}, {OWNER_KEY: owner}, expected_version=version):
+                    record[OWNER_KEY] = owner
+                    record[VERSION_KEY] = version + 1
+                    return record
+        return None
+
+    def release_record(self, path: str, owner: Optional[str] = None) -> bool:
+        """
+        释放由 claim_record 占用的记录
+        Args:
+            path: 文件完整路径
+            owner: 占用标识，默认为当前进程
+        Returns:
+            是否释放成功
+        """
+        owner = owner or current_owner()
+        return self.update_record({PRIMARY_KEY: path, OWNER_KEY: owner}, {OWNER_KEY: None}) > 0
+
+    def claimed_by_others(self) -> List[Dict[str, Any]]:
+        """
+        查询被其他存活进程占用的记录
+        Returns:
+            占用标识不是当前进程且对应进程仍然有效的记录列表
+        """
+        owner = current_owner()
+        return [record for record in self.query_records()
+                if record.get(OWNER_KEY) and record[OWNER_KEY] != owner and _owner_alive(record[OWNER_KEY])]
+
+    def query_by_steps(self, steps, condition: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """
+        查询处理步骤属于指定集合的记录
+        Args:
+            steps: 处理步骤取值集合，如 (1, 2)
+            condition: 额外的键值对条件
+        Returns:
+            符合条件的记录列表
+        """
+        steps = set(steps)
+        return [record for record in self.query_records(condition) if record.get("处理步骤") in steps]
+
+    def import_json(self, json_path: str) -> int:
+        """
+        从现有的JSON扫描结果导入全部记录
+        Args:
+            json_path: 要导入的JSON文件路径
+        Returns:
+            导入的记录数量
+        """
+        data = DataManager(json_path).load_data()
+        if not self.save_data(data):
+            return 0
+        return len(data)
+
+    def export_json(self, json_path: str) -> bool:
+        """
+        将当前全部记录导出为原有格式的JSON文件
+        Args:
+            json_path: 导出文件路径
+        Returns:
+            导出是否成功
+        """
+        return DataManager(json_path).save_data(self.load_data())
+
+
+class JournalDataManager(DataManager):
+    """
+    基于追加日志的数据管理器
+
+    快照仍然是原有格式的JSON文件，每次增删改只向 `<数据文件>.journal`
+    追加一行变更记录，内存中按文件完整路径维护主索引，因此单条记录的
+    更新只需要 O(1) 的磁盘写入。日志条数超过阈值时自动压缩回快照。
+    batch() 中的变更先应用到内存并缓存，退出时一次性追加到日志，发生异常时全部放弃。
+    """
+    def __init__(self, data_file_path: str, compact_threshold: int = 1000):
+        """
+        初始化日志数据管理器
+        Args:
+            data_file_path: JSON快照文件的路径
+            compact_threshold: 日志条数超过该值时执行压缩
+        """
+        super().__init__(data_file_path)
+        self.journal_path = f"{data_file_path}.journal"
+        self.compact_threshold = compact_threshold
+        self._records: Dict[int, Dict[str, Any]] = {}
+        self._path_index: Dict[Any, List[int]] = {}
+        self._next_id = 0
+        self._journal_entries = 0
+        self._disk_state = None
+        # batch() 中尚未写入日志的变更
+        self._pending: List[Dict[str, Any]] = []
+
+    def exists(self) -> bool:
+        return super().exists() or os.path.exists(self.journal_path)
+
+    @contextmanager
+    def batch(self):
+        """
+        批量修改上下文，期间的 add_record/update_record/delete_record 只修改内存数据，
+        退出时一次性追加到日志；发生异常或写入失败时放弃全部修改并从磁盘重新加载
+        """
+        with self._file_lock:
+            self._batch_depth += 1
+            try:
+                yield self
+            except Exception:
+                if self._batch_depth == 1:
+                    self._pending = []
+                    self._disk_state = None
+                raise
+            else:
+                if self._batch_depth == 1 and self._pending:
+                    entries, self._pending = self._pending, []
+                    try:
+                        self._write_entries(entries)
+                        self._compact_if_needed()
+                    except Exception as e:
+                        self.logger.error(f"保存数据时发生错误: {e}")
+                        self._disk_state = None
+            finally:
+                self._batch_depth -= 1
+
+    def _snapshot_signature(self) -> Optional[List[int]]:
+        """快照文件的 [大小, 修改时间ns]，用于识别日志属于哪一份快照"""
+        try:
+            st = os.stat(self.data_file_path)
+        except FileNotFoundError:
+            return None
+        return [st.st_size, st.st_mtime_ns]
+
+    def _journal_size(self) -> int:
+        try:
+            return os.path.getsize(self.journal_path)
+        except FileNotFoundError:
+            return 0
+
+    def _current_disk_state(self):
+        return (self._snapshot_signature(), self._journal_size())
+
+    def _index_add(self, record_id: int, record: Dict[str, Any]):
+        self._records[record_id] = record
+        self._path_index.setdefault(record.get(PRIMARY_KEY), []).append(record_id)
+
+    def _index_remove(self, record_id: int):
+        record = self._records.pop(record_id)
+        ids = self._path_index.get(record.get(PRIMARY_KEY), [])
+        if record_id in ids:
+            ids.remove(record_id)
+            if not ids:
+                del self._path_index[record.get(PRIMARY_KEY)]
+
+    def _apply(self, entry: Dict[str, Any]):
+        """将一条日志变更应用到内存状态"""
+        op = entry.get("op")
+        if op == "add":
+            self._index_add(entry["id"], entry["record"])
+            self._next_id = max(self._next_id, entry["id"] + 1)
+        elif op == "update":
+            for record_id in entry["ids"]:
+                record = self._records.get(record_id)
+                if record is None:
+                    continue
+                old_key = record.get(PRIMARY_KEY)
+                _apply_updates(record, entry["updates"])
+                if record.get(PRIMARY_KEY) != old_key:
+                    # 主键被修改时重建该记录的索引
+                    ids = self._path_index.get(old_key, [])
+                    if record_id in ids:
+                        ids.remove(record_id)
+                        if not ids:
+                            del self._path_index[old_key]
+                    self._path_index.setdefault(record.get(PRIMARY_KEY), []).append(record_id)
+        elif op == "delete":
+            for record_id in entry["ids"]:
+                if record_id in self._records:
+                    self._index_remove(record_id)
+
+    def _reset(self, data: List[Dict[str, Any]]):
+        """用快照内容重建内存状态，记录ID按快照中的顺序分配"""
+        self._records = {}
+        self._path_index = {}
+        self._next_id = 0
+        self._journal_entries = 0
+        for record in data:
+            self._index_add(self._next_id, dict(record))
+            self._next_id += 1
+
+    def _reload(self):
+        """
+        从快照加载数据并重放属于该快照的日志；在跨进程锁内读取快照和日志，
+        避免读到压缩到一半的状态，或删除其他进程刚为新快照写入的日志
+        """
+        with self._file_lock:
+            self._reset(self._read_file())
+            signature = self._snapshot_signature()
+            if os.path.exists(self.journal_path):
+                with open(self.journal_path, 'r', encoding='utf-8') as f:
+                    lines = f.readlines()
+                header = None
+                if lines:
+                    try:
+                        header = json.loads(lines[0])
+                    except json.JSONDecodeError:
+                        header = None
+                if not header or header.get("op") != "header" or header.get("snapshot") != signature:
+                    # 快照在日志之后被重写（压缩完成或外部修改），日志已失效
+                    self.logger.warning(f"日志文件 {self.journal_path} 与快照不匹配，已忽略")
+                    os.remove(self.journal_path)
+                else:
+                    for line in lines[1:]:
+                        try:
+                            entry = json.loads(line)
+                        except json.JSONDecodeError:
+                            # 崩溃时可能留下不完整的最后一行
+                            self.logger.warning("忽略日志中不完整的变更记录")
+                            break
+                        self._apply(entry)
+                        self._journal_entries += 1
+            self._disk_state = self._current_disk_state()
+
+    def _ensure_loaded(self):
+        """磁盘状态与内存不一致时（首次使用或被其他实例修改）重新加载"""
+        if self._disk_state is None or self._disk_state != self._current_disk_state():
+            self._reload()
+
+    def _append(self, entry: Dict[str, Any]):
+        """向日志追加一条变更并应用到内存，batch()中只应用到内存并等待退出时写入"""
+        if self._batch_depth:
+            self._apply(entry)
+            self._pending.append(entry)
+            return
+        self._write_entries([entry])
+        self._apply(entry)
+        self._compact_if_needed()
+
+    def _write_entries(self, entries: List[Dict[str, Any]]):
+        """把变更一次性追加到日志，内存状态由调用方应用"""
+        os.makedirs(os.path.dirname(self.data_file_path), exist_ok=True)
+        lines = []
+        if not os.path.exists(self.journal_path):
+            lines.append(json.dumps({"op": "header", "snapshot": self._snapshot_signature()}))
+        lines.extend(json.dumps(entry, ensure_ascii=False) for entry in entries)
+        with open(self.journal_path, 'a', encoding='utf-8') as f:
+            f.write("\n".join(lines) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self._journal_entries += len(entries)
+        self._disk_state = self._current_disk_state()
+
+    def _compact_if_needed(self):
+        if self._journal_entries >= self.compact_threshold:
+            self.compact()
+
+    def _find_ids(self, condition: Optional[Dict[str, Any]]) -> List[int]:
+        """按条件查找记录ID，条件包含文件完整路径时走主索引"""
+        if condition is None:
+            return list(self._records)
+        if PRIMARY_KEY in condition:
+            candidates = self._path_index.get(condition[PRIMARY_KEY], [])
+        else:
+            candidates = self._records
+        return [i for i in candidates if _match(self._records[i], condition)]
+
+    def _write_snapshot(self, data: List[Dict[str, Any]]) -> bool:
+        """原子地写入快照并删除旧日志"""
+        try:
+            self._write_file(data)
+            if os.path.exists(self.journal_path):
+                os.remove(self.journal_path)
+            self.logger.info(f"数据已保存到: {self.data_file_path}")
+            return True
+        except Exception as e:
+            self.logger.error(f"保存数据时发生错误: {e}")
+            return False
+
+    def compact(self) -> bool:
+        """
+        将日志合并回JSON快照
+        Returns:
+            压缩是否成功
+        """
+        with self._file_lock:
+            self._ensure_loaded()
+            data = list(self._records.values())
+            if not self._write_snapshot(data):
+                return False
+            self._reset(data)
+            self._disk_state = self._current_disk_state()
+        self.logger.info(f"日志压缩完成，共 {len(data)} 条记录")
+        return True
+
+    def load_data(self) -> List[Dict[str, Any]]:
+        self._ensure_loaded()
+        return [dict(record) for record in self._records.values()]
+
+    def save_data(self, data: List[Dict[str, Any]]) -> bool:
+        # 全量保存直接生成新快照，同时使旧日志失效；batch()中此前缓存的变更已被快照取代
+        with self._file_lock:
+            self._pending = []
+            if not self._write_snapshot(data):
+                self._disk_state = None
+                return False
+            self._reset(data)
+            self._disk_state = self._current_disk_state()
+        return True
+
+    def add_record(self, record: Dict[str, Any]) -> bool:
+        try:
+            with self._file_lock:
+                self._ensure_loaded()
+                self._append({"op": "add", "id": self._next_id, "record": dict(record)})
+            return True
+        except Exception as e:
+            self.logger.error(f"添加记录时发生错误: {e}")
+            return False
+
+    def delete_record(self, condition: Dict[str, Any]) -> int:
+        try:
+            with self._file_lock:
+                self._ensure_loaded()
+                ids = self._find_ids(condition)
+                if ids:
+                    self._append({"op": "delete", "ids": ids})
+            if ids:
+                self.logger.info(f"成功删除 {len(ids)} 条记录")
+            return len(ids)
+        except Exception as e:
+            self.logger.error(f"删除记录时发生错误: {e}")
+            return 0
+
+    def update_record(self, condition: Dict[str, Any], updates: Dict[str, Any],
+                      expected_version: Optional[int] = None) -> int:
+        try:
+            with self._file_lock:
+                self._ensure_loaded()
+                ids = [i for i in self._find_ids(condition)
+                       if expected_version is None or self._records[i].get(VERSION_KEY, 0) == expected_version]
+                if ids:
+                    self._append({"op": "update", "ids": ids, "updates": dict(updates)})
+            if ids:
+                self.logger.info(f"成功更新 {len(ids)} 条记录")
+            return len(ids)
+        except Exception as e:
+            self.logger.error(f"更新记录时发生错误: {e}")
+            return 0
+
+    def query_records(self, condition: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        try:
+            self._ensure_loaded()
+            return [dict(self._records[i]) for i in self._find_ids(condition)]
+        except Exception as e:
+            self.logger.error(f"查询记录时发生错误: {e}")
+            return []
+
+
+class SQLiteDataManager(DataManager):
+    """
+    基于 sqlite3 (WAL模式) 的数据管理器
+
+    完整记录以JSON文本保存在 data 列中，文件完整路径、父目录、处理步骤、
+    处理优先级和文件修改时间另存为带索引的列，按这些字段查询时不再需要
+    全表扫描。数据库文件与JSON文件同名，扩展名为 .db。
+    batch() 在一个写事务中执行，期间的每个写操作使用保存点，退出时提交，发生异常时整体回滚。
+    """
+    # 记录字段 -> 索引列
+    INDEXED_COLUMNS = {
+        "文件完整路径": "path",
+        "父目录": "parent",
+        "处理步骤": "step",
+        "处理优先级": "priority",
+        "文件修改时间": "mtime",
+    }
+
+    def __init__(self, data_file_path: str):
+        """
+        初始化SQLite数据管理器
+        Args:
+            data_file_path: JSON数据文件的路径，数据库保存在同名 .db 文件中
+        """
+        super().__init__(data_file_path)
+        self.db_path = f"{os.path.splitext(data_file_path)[0]}.db"
+        self._lock = threading.RLock()
+        self._conn = None
+
+    def exists(self) -> bool:
+        return os.path.exists(self.db_path)
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS records ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "path TEXT, parent TEXT, step NUMERIC, priority NUMERIC, mtime TEXT, "
+                "data TEXT NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_records_path ON records(path)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_records_parent ON records(parent)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_records_step ON records(step)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_records_priority_step ON records(priority, step)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_records_mtime ON records(mtime)")
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    @contextmanager
+    def _transaction(self):
+        """
+        在跨进程锁内开启 BEGIN IMMEDIATE 写事务，保证查询与更新之间不被其他进程插入；
+        batch() 中已有事务时改用保存点，失败只回滚本次操作
+        """
+        with self._file_lock, self._lock:
+            conn = self._connect()
+            if self._batch_depth and conn.in_transaction:
+                conn.execute("SAVEPOINT record_op")
+                try:
+                    yield conn
+                except Exception:
+                    conn.execute("ROLLBACK TO SAVEPOINT record_op")
+                    conn.execute("RELEASE SAVEPOINT record_op")
+                    raise
+                else:
+                    conn.execute("RELEASE SAVEPOINT record_op")
+                return
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except Exception:
+                conn.rollback()
+                raise
+            else:
+                conn.commit()
+
+    @contextmanager
+    def batch(self):
+        """批量修改上下文，期间的写操作在同一个事务中执行，退出时提交，发生异常时全部回滚"""
+        with self._file_lock, self._lock:
+            if self._batch_depth:
+                self._batch_depth += 1
+                try:
+                    yield self
+                finally:
+                    self._batch_depth -= 1
+                return
+            with self._transaction():
+                self._batch_depth += 1
+                try:
+                    yield self
+                finally:
+                    self._batch_depth -= 1
+
+    def _row_values(self, record: Dict[str, Any]) -> tuple:
+        return tuple(record.get(field) for field in self.INDEXED_COLUMNS) + (
+            json.dumps(record, ensure_ascii=False, default=json_default),)
+
+    def _where(self, condition: Optional[Dict[str, Any]]):
+        """把条件拆分为 SQL 子句（索引列）和剩余需在Python中过滤的条件"""
+        clauses, params, rest = [], [], {}
+        for key, value in (condition or {}).items():
+            column = self.INDEXED_COLUMNS.get(key)
+            if column is None or isinstance(value, (dict, list, bool)):
+                rest[key] = value
+            elif value is None:
+                clauses.append(f"{column} IS NULL")
+            else:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        return clauses, params, rest
+
+    def _select(self, clauses: List[str], params: list, rest: Dict[str, Any]):
+        sql = "SELECT id, data FROM records"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY id"
+        rows = self._connect().execute(sql, params).fetchall()
+        result = []
+        for record_id, data in rows:
+            record = json.loads(data)
+            if _match(record, rest):
+                result.append((record_id, record))
+        return result
+
+    def load_data(self) -> List[Dict[str, Any]]:
+        try:
+            with self._lock:
+                return [record for _, record in self._select([], [], {})]
+        except Exception as e:
+            self.logger.error(f"加载数据时发生错误: {e}")
+            return []
+
+    def save_data(self, data: List[Dict[str, Any]]) -> bool:
+        try:
+            with self._transaction() as conn:
+                conn.execute("DELETE FROM records")
+                conn.executemany(
+                    "INSERT INTO records (path, parent, step, priority, mtime, data) VALUES (?, ?, ?, ?, ?, ?)",
+                    (self._row_values(record) for record in data))
+            self.logger.info(f"数据已保存到: {self.db_path}")
+            return True
+        except Exception as e:
+            self.logger.error(f"保存数据时发生错误: {e}")
+            return False
+
+    def add_record(self, record: Dict[str, Any]) -> bool:
+        try:
+            with self._transaction() as conn:
+                conn.execute(
+                    "INSERT INTO records (path, parent, step, priority, mtime, data) VALUES (?, ?, ?, ?, ?, ?)",
+                    self._row_values(record))
+            return True
+        except Exception as e:
+            self.logger.error(f"添加记录时发生错误: {e}")
+            return False
+
+    def delete_record(self, condition: Dict[str, Any]) -> int:
+        try:
+            with self._transaction() as conn:
+                ids = [(record_id,) for record_id, _ in self._select(*self._where(condition))]
+                conn.executemany("DELETE FROM records WHERE id = ?", ids)
+            if ids:
+                self.logger.info(f"成功删除 {len(ids)} 条记录")
+            return len(ids)
+        except Exception as e:
+            self.logger.error(f"删除记录时发生错误: {e}")
+            return 0
+
+    def update_record(self, condition: Dict[str, Any], updates: Dict[str, Any],
+                      expected_version: Optional[int] = None) -> int:
+        try:
+            with self._transaction() as conn:
+                rows = []
+                for record_id, record in self._select(*self._where(condition)):
+                    if expected_version is not None and record.get(VERSION_KEY, 0) != expected_version:
+                        continue
+                    _apply_updates(record, updates)
+                    rows.append(self._row_values(record) + (record_id,))
+                conn.executemany(
+                    "UPDATE records SET path = ?, parent = ?, step = ?, priority = ?, mtime = ?, data = ? WHERE id = ?",
+                    rows)
+            if rows:
+                self.logger.info(f"成功更新 {len(rows)} 条记录")
+            return len(rows)
+        except Exception as e:
+            self.logger.error(f"更新记录时发生错误: {e}")
+            return 0
+
+    def query_records(self, condition: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        try:
+            with self._lock:
+                return [record for _, record in self._select(*self._where(condition))]
+        except Exception as e:
+            self.logger.error(f"查询记录时发生错误: {e}")
+            return []
+
+    def query_by_steps(self, steps, condition: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        try:
+            steps = list(steps)
+            clauses, params, rest = self._where(condition)
+            clauses.append(f"step IN ({', '.join('?' for _ in steps)})")
+            params.extend(steps)
+            with self._lock:
+                return [record for _, record in self._select(clauses, params, rest)]
+        except Exception as e:
+            self.logger.error(f"查询记录时发生错误: {e}")
+            return []
+
+
+def create_data_manager(data_file_path: str, backend: str = "json", **options) -> DataManager:
+    """
+    根据存储后端名称创建数据管理器
+    Args:
+        data_file_path: JSON数据文件的路径
+        backend: 存储后端，json 为整文件读写，journal 为追加日志模式，sqlite 为带索引的SQLite数据库
+        options: 传给具体后端的额外参数
+    Returns:
+        数据管理器实例
+    """
+    backend = (backend or "json").lower()
+    if backend == "journal":
+        return JournalDataManager(data_file_path, **options)
+    if backend == "sqlite":
+        return SQLiteDataManager(data_file_path, **options)
+    if backend != "json":
+        logging.getLogger(__name__).warning(f"未知的存储后端 {backend}，使用 json")
+    return DataManager(data_file_path, **options)
+
 # 使用示例
 if __name__ == "__main__":
     # 创建数据管理器实例
@@ -0,0 +1,397 @@
+# -*- coding: utf-8 -*-
+"""
+GPU 指标、并发准入控制与任务暂停模块
+
+GPU 指标通过可替换的提供者读取：NvidiaSmiProvider 调用 nvidia-smi，
+StubProvider 返回固定或预设序列的指标，用于在没有 GPU 的机器上测试调度逻辑。
+AdmissionController 决定是否可以再启动一个 video2x 任务：
+正在运行的任务数未达上限，且采样到的 GPU 使用率和显存占用都低于上限时才准入。
+GpuSampler 在后台按固定间隔采样，GPU 持续被其他程序占满时挂起正在运行的 video2x 进程
+（ProcessRegistry 中登记的进程），负载回落到恢复阈值以下后再继续（滞回）。
+"""
+import logging
+import os
+import signal
+import subprocess
+import threading
+import time
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+
+class GpuSample(namedtuple('GpuSample', ['utilization', 'memory_used', 'memory_total'])):
+    """一次采样：GPU 使用率（%）、已用显存和总显存（MiB）"""
+    __slots__ = ()
+
+    @property
+    def memory_percent(self):
+        return 100.0 * self.memory_used / self.memory_total if self.memory_total else 0.0
+
+
+class NvidiaSmiProvider:
+    """通过 nvidia-smi 读取 GPU 指标"""
+    def __init__(self, gpu_index=0, executable='nvidia-smi'):
+        """
+        初始化提供者
+        Args:
+            gpu_index: GPU 序号
+            executable: nvidia-smi 可执行文件路径
+        """
+        self.gpu_index = gpu_index
+        self.executable = executable
+
+    def sample(self):
+        """
+        读取一次 GPU 指标
+        Returns:
+            GpuSample，读取失败时返回 None
+        """
+        try:
+            result = subprocess.run(
+                [self.executable, f'--id={self.gpu_index}',
+                 '--query-gpu=utilization.gpu,memory.used,memory.total', '--format=csv,noheader,nounits'],
+                capture_output=True, text=True, check=True, timeout=10)
+            utilization, used, total = (float(v) for v in result.stdout.strip().splitlines()[0].split(','))
+            return GpuSample(utilization, used, total)
+        except (OSError, subprocess.SubprocessError, ValueError, IndexError) as e:
+            logger.warning(f"获取GPU指标失败: {e}")
+            return None
+
+
+class StubProvider:
+    """返回固定值或按顺序返回预设指标（序列用完后重复最后一个），用于测试"""
+    def __init__(self, samples=None, utilization=0, memory_used=0, memory_total=8192):
+        """
+        初始化提供者
+        Args:
+            samples: 可选的 GpuSample 序列
+            utilization: 未提供序列时返回的 GPU 使用率
+            memory_used: 未提供序列时返回的已用显存（MiB）
+            memory_total: 未提供序列时返回的总显存（MiB）
+        """
+        self._samples = list(samples or [GpuSample(utilization, memory_used, memory_total)])
+        self._index = 0
+
+    def sample(self):
+        sample = self._samples[min(self._index, len(self._samples) - 1)]
+        self._index += 1
+        return sample
+
+
+def create_provider(name='nvidia-smi', **options):
+    """
+    按名称创建 GPU 指标提供者
+    Args:
+        name: nvidia-smi 或 stub
+        options: 传给提供者的参数
+    Returns:
+        提供者实例
+    """
+    name = (name or 'nvidia-smi').lower()
+    if name == 'stub':
+        return StubProvider(**options)
+    if name == 'nvidia-smi':
+        return NvidiaSmiProvider(**options)
+    raise ValueError(f"未知的GPU指标提供者: {name}")
+
+
+def _set_suspended(pid, suspend):
+    """挂起或恢复进程：Windows 使用 NtSuspendProcess/NtResumeProcess，其他平台使用 SIGSTOP/SIGCONT"""
+    if os.name == 'nt':
+        import ctypes
+        PROCESS_SUSPEND_RESUME = 0x0800
+        kernel32 = ctypes.WinDLL('kernel32', use_last_error=True)
+        ntdll = ctypes.WinDLL('ntdll')
+        handle = kernel32.OpenProcess(PROCESS_SUSPEND_RESUME, False, pid)
+        if not handle:
+            raise ctypes.WinError(ctypes.get_last_error())
+        try:
+            status = (ntdll.NtSuspendProcess if suspend else ntdll.NtResumeProcess)(handle)
+            if status != 0:
+                raise OSError(f"NTSTATUS 0x{status & 0xFFFFFFFF:08X}")
+        finally:
+            kernel32.CloseHandle(handle)
+    else:
+        os.kill(pid, signal.SIGSTOP if suspend else signal.SIGCONT)
+
+
+class ProcessRegistry:
+    """正在运行的 video2x 进程登记表，支持整体挂起、恢复和终止"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._processes = set()
+        self.suspended = False
+        self.stopped = False
+
+    def run(self, cmd, env=None):
+        """
+        运行命令并等待结束（不经过 shell，输出直接显示在控制台），运行期间登记进程
+        Args:
+            cmd: 命令参数列表
+            env: 环境变量
+        Returns:
+            subprocess.CompletedProcess，已调用 terminate_all 时不启动并返回 STOPPED_RETURNCODE
+        """
+        if self.stopped:
+            return subprocess.CompletedProcess(cmd, STOPPED_RETURNCODE)
+        process = subprocess.Popen(cmd, env=env)
+        with self._lock:
+            self._processes.add(process)
+            if self.stopped:
+                process.terminate()
+            elif self.suspended:
+                # 挂起期间启动的进程（例如分段的下一阶段）同样立即挂起
+                self._apply(process, True)
+        try:
+            returncode = process.wait()
+        finally:
+            with self._lock:
+                self._processes.discard(process)
+        return subprocess.CompletedProcess(cmd, returncode)
+
+    @staticmethod
+    def _apply(process, suspend):
+        try:
+            _set_suspended(process.pid, suspend)
+        except (OSError, ProcessLookupError) as e:
+            logger.warning(f"{'挂起' if suspend else '恢复'}进程 {process.pid} 失败: {e}")
+
+    def suspend_all(self):
+        """挂起全部登记的进程"""
+        with self._lock:
+            self.suspended = True
+            for process in self._processes:
+                self._apply(process, True)
+            return len(self._processes)
+
+    def resume_all(self):
+        """恢复全部登记的进程"""
+        with self._lock:
+            self.suspended = False
+            for process in self._processes:
+                self._apply(process, False)
+            return len(self._processes)
+
+    def terminate_all(self):
+        """终止全部登记的进程，之后 run 不再启动新进程，直到调用 reset"""
+        with self._lock:
+            self.stopped = True
+            for process in self._processes:
+                if self.suspended:
+                    # 挂起的进程收不到终止信号，先恢复
+                    self._apply(process, False)
+                try:
+                    process.terminate()
+                except OSError as e:
+                    logger.warning(f"终止进程 {process.pid} 失败: {e}")
+            self.suspended = False
+            return len(self._processes)
+
+    def reset(self):
+        """允许再次启动进程"""
+        with self._lock:
+            self.stopped = False
+
+
+# terminate_all 之后调用 run 时返回的退出代码
+STOPPED_RETURNCODE = -1
+
+# video_processor 和 segment 通过该登记表运行 video2x
+processes = ProcessRegistry()
+
+
+class GpuSampler:
+    """后台 GPU 采样线程，按滞回阈值挂起和恢复 video2x 进程"""
+    def __init__(self, provider, registry=processes, interval=10, pause_utilization=95,
+                 resume_utilization=60, pause_memory_percent=95, resume_memory_percent=85, samples=3,
+                 self_load_backoff=1800, clock=time.monotonic):
+        """
+        初始化采样器
+        Args:
+            provider: GPU 指标提供者
+            registry: 需要挂起/恢复的进程登记表
+            interval: 采样间隔秒数
+            pause_utilization: GPU 使用率连续 samples 次不低于该值时挂起（%）
+            resume_utilization: 挂起后 GPU 使用率连续 samples 次低于该值时恢复（%）
+            pause_memory_percent: 显存占用连续 samples 次不低于该值时挂起（%）
+            resume_memory_percent: 挂起后显存占用连续 samples 次低于该值时恢复（%）
+            samples: 触发挂起或恢复所需的连续采样次数
+            self_load_backoff: 挂起后使用率立即回落（高负载来自本程序自身）时，在该秒数内只按显存判断
+            clock: 返回当前时间（秒）的函数，便于测试
+        """
+        self.provider = provider
+        self.registry = registry
+        self.interval = interval
+        self.pause_utilization = pause_utilization
+        self.resume_utilization = resume_utilization
+        self.pause_memory_percent = pause_memory_percent
+        self.resume_memory_percent = resume_memory_percent
+        self.samples = max(1, samples)
+        self.self_load_backoff = self_load_backoff
+        self._clock = clock
+        self.latest = None
+        self.paused = False
+        self._streak = 0
+        self._paused_by_utilization = False
+        self._first_paused_sample = False
+        # 在该时刻之前不按GPU使用率挂起，None 表示按使用率判断
+        self._ignore_utilization_until = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def update(self, sample):
+        """
+        处理一次采样结果，必要时挂起或恢复进程
+        Args:
+            sample: GpuSample，采样失败时为 None（保持当前状态）
+        """
+        if sample is None:
+            return
+        self.latest = sample
+        if self._ignore_utilization_until is not None and self._clock() >= self._ignore_utilization_until:
+            self._ignore_utilization_until = None
+            logger.info("GPU使用率退避已结束，重新按GPU使用率判断是否挂起")
+        utilization_high = self._ignore_utilization_until is None and sample.utilization >= self.pause_utilization
+        if not self.paused:
+            high = utilization_high or sample.memory_percent >= self.pause_memory_percent
+            self._streak = self._streak + 1 if high else 0
+            if self._streak >= self.samples:
+                self._streak = 0
+                self.paused = True
+                self._paused_by_utilization = utilization_high
+                self._first_paused_sample = True
+                count = self.registry.suspend_all()
+                logger.warning(f"GPU持续高负载（使用率 {sample.utilization:.0f}%，显存 {sample.memory_percent:.0f}%），"
+                               f"已挂起 {count} 个处理进程并暂停启动新任务")
+            return
+
+        low = sample.utilization < self.resume_utilization and sample.memory_percent < self.resume_memory_percent
+        if self._first_paused_sample:
+            self._first_paused_sample = False
+            if low and self._paused_by_utilization and sample.memory_percent < self.pause_memory_percent:
+                # 挂起后使用率立即回落，说明高负载来自本程序自身的任务，之后一段时间内只按显存判断；
+                # 退避结束后恢复按使用率判断，长时间运行时仍能让位给其他程序
+                self._ignore_utilization_until = self._clock() + self.self_load_backoff
+                logger.warning(f"挂起后GPU使用率立即回落，高负载来自本程序的任务；"
+                               f"{self.self_load_backoff / 60:.0f} 分钟内不再按GPU使用率挂起")
+                self._resume(sample)
+                return
+        self._streak = self._streak + 1 if low else 0
+        if self._streak >= self.samples:
+            self._resume(sample)
+
+    def _resume(self, sample):
+        self._streak = 0
+        self.paused = False
+        count = self.registry.resume_all()
+        logger.info(f"GPU负载已回落（使用率 {sample.utilization:.0f}%，显存 {sample.memory_percent:.0f}%），已恢复 {count} 个处理进程")
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.update(self.provider.sample())
+            except Exception as e:
+                logger.error(f"GPU采样出错: {e}")
+
+    def start(self):
+        """启动后台采样线程"""
+        self._stop.clear()
+        self.update(self.provider.sample())
+        self._thread = threading.Thread(target=self._run, name='gpu-sampler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止采样，并恢复仍处于挂起状态的进程"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self.paused:
+            self.paused = False
+            self.registry.resume_all()
+
+
+class AdmissionController:
+    """并发任务准入控制"""
+    def __init__(self, provider, max_jobs=1, max_utilization=70, max_memory_percent=80,
+                 settle_seconds=30, clock=time.monotonic, sampler=None, start_utilization=None):
+        """
+        初始化准入控制
+        Args:
+            provider: GPU 指标提供者
+            max_jobs: 同时运行的任务数上限
+            max_utilization: 准入新任务时 GPU 使用率须低于该值（%）
+            max_memory_percent: 准入新任务时显存占用须低于该值（%）
+            settle_seconds: 准入一个任务后等待其负载稳定的秒数，期间不再准入
+            clock: 时钟函数，测试时可替换
+            sampler: 可选的 GpuSampler，提供时使用其最近一次采样，且其暂停期间不准入
+            start_utilization: 没有任务运行时，GPU使用率须不高于该值才启动第一个任务（None 表示不检查）
+        """
+        self.provider = provider
+        self.max_jobs = max_jobs
+        self.max_utilization = max_utilization
+        self.max_memory_percent = max_memory_percent
+        self.settle_seconds = settle_seconds
+        self._clock = clock
+        self.sampler = sampler
+        self.start_utilization = start_utilization
+        self._last_admit = None
+
+    def _sample(self):
+        if self.sampler is not None and self.sampler.latest is not None:
+            return self.sampler.latest
+        return self.provider.sample()
+
+    def admit(self, running):
+        """
+        判断是否可以再启动一个任务，可以时记录准入时间
+        Args:
+            running: 正在运行的任务数
+        Returns:
+            是否准入
+        """
+        if running >= self.max_jobs:
+            return False
+        if self.sampler is not None and self.sampler.paused:
+            return False
+        if running == 0 and self.start_utilization is not None:
+            # 没有任务运行时的使用率即其他程序的负载
+            sample = self._sample()
+            if sample is not None and sample.utilization > self.start_utilization:
+                logger.info(f"GPU占用度 {sample.utilization:.0f}% 超过阈值 {self.start_utilization}%，等待空闲后再开始处理")
+                return False
+        elif running > 0:
+            if self._last_admit is not None and self._clock() - self._last_admit < self.settle_seconds:
+                return False
+            sample = self._sample()
+            # 指标未知时不增加并发
+            if sample is None:
+                return False
+            if sample.utilization >= self.max_utilization or sample.memory_percent >= self.max_memory_percent:
+                logger.debug(f"GPU负载较高（使用率 {sample.utilization:.0f}%，显存 {sample.memory_percent:.0f}%），暂不启动新任务")
+                return False
+            logger.info(f"GPU使用率 {sample.utilization:.0f}%，显存 {sample.memory_percent:.0f}%，启动第 {running + 1} 个任务")
+        self._last_admit = self._clock()
+        return True
+
+
+def _simulate():
+    """用随运行任务数变化的模拟指标演示准入过程：每个任务约占 40% GPU 和 3 GiB 显存"""
+    now = [0.0]
+    running = []
+    class LoadProvider:
+        def sample(self):
+            return GpuSample(min(100, 40 * len(running)), 3072 * len(running), 12288)
+    controller = AdmissionController(LoadProvider(), max_jobs=4, max_utilization=70,
+                                     max_memory_percent=80, settle_seconds=30, clock=lambda: now[0])
+    for step in range(12):
+        running = [end for end in running if end > now[0]]
+        while controller.admit(len(running)):
+            running.append(now[0] + 300)
+        print(f"t={now[0]:4.0f}s 运行中 {len(running)} 个任务")
+        now[0] += 30
+
+
+if __name__ == "__main__":
+    _simulate()
@@ -0,0 +1,1138 @@
+# -*- coding: utf-8 -*-
+"""
+文件分组模块
+
+同一目录下的视频文件按文件名相似度（Levenshtein距离）归入不同分支（分支），
+再按季度/集数与修改时间计算每个分支的处理优先级（处理优先级）。
+"""
+import hashlib
+import heapq
+import json
+import logging
+import os
+import random
+import re
+import string
+import sys
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+from functools import lru_cache
+
+from name_parser import parsed
+
+try:
+    import numpy as np
+except ImportError:  # NumPy 为可选依赖，未安装时使用纯 Python 实现
+    np = None
+
+logger = logging.getLogger(__name__)
+
+
+# 文件名相似度阈值：1 - 距离 / 最长文件名长度 > 0.6 时归为同一分支
+SIMILARITY_THRESHOLD = 0.6
+
+# 同一分支的文件名长度最多相差的字符数
+MAX_LENGTH_DIFF = 5
+
+# 候选数达到该值时才使用 NumPy 批量计算，候选太少时逐个计算更快
+NUMPY_MIN_BATCH = 64
+
+# NumPy 批量计算以 64 位整数作为位向量，模式串最长 64 个字符
+NUMPY_MAX_PATTERN = 64
+
+
+
+def bounded_levenshtein(s1, s2, max_distance=None):
+    """
+    带上限的 Levenshtein 距离：去掉相同的前后缀后用位并行算法（Myers/Hyyrö）逐列推进，
+    剩余列数已不足以把距离降回上限以内时立即返回
+    Args:
+        s1: 字符串1
+        s2: 字符串2
+        max_distance: 距离上限，None 表示不设上限
+    Returns:
+        距离不超过上限时返回准确距离，否则返回 max_distance + 1
+    """
+    if len(s1) < len(s2):
+        s1, s2 = s2, s1
+    # 去掉相同的前缀和后缀，同一剧集的文件名通常只有中间几个字符不同
+    start = 0
+    end1, end2 = len(s1), len(s2)
+    while start < end2 and s1[start] == s2[start]:
+        start += 1
+    while end2 > start and s1[end1 - 1] == s2[end2 - 1]:
+        end1 -= 1
+        end2 -= 1
+    s1 = s1[start:end1]
+    s2 = s2[start:end2]
+    len1, len2 = len(s1), len(s2)
+
+    if max_distance is None:
+        max_distance = len1
+    over = max_distance + 1
+    if len1 - len2 > max_distance:
+        return over
+    if len2 == 0:
+        return len1
+
+    # 较短的字符串作为模式串，每个字符对应一个出现位置的位掩码
+    peq = {}
+    bit = 1
+    for c in s2:
+        peq[c] = peq.get(c, 0) | bit
+        bit <<= 1
+    mask = bit - 1
+    high = bit >> 1
+    pv = mask  # 纵向 +1 位向量
+    mv = 0     # 纵向 -1 位向量
+    distance = len2
+    remaining = len1
+    for c in s1:
+        eq = peq.get(c, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = mv | (mask & ~(xh | pv))
+        mh = pv & xh
+        if ph & high:
+            distance += 1
+        elif mh & high:
+            distance -= 1
+        remaining -= 1
+        # 之后每列最多使距离减 1
+        if distance - remaining > max_distance:
+            return over
+        ph = ((ph << 1) | 1) & mask
+        mh = (mh << 1) & mask
+        pv = mh | (mask & ~(xv | ph))
+        mv = ph & xv
+    return distance if distance <= max_distance else over
+
+
+# 计算字符串相似度 (Levenshtein距离)
+def levenshtein_distance(s1, s2):
+    return bounded_levenshtein(s1, s2)
+
+
+@lru_cache(maxsize=None)
+def similarity_cutoff(max_len):
+    """
+    与 1 - (distance / max_len) > SIMILARITY_THRESHOLD 等价的最大允许距离
+    （逐个验证浮点比较，保证与原判断结果完全一致）
+    Args:
+        max_len: 两个文件名中较长者的长度
+    Returns:
+        满足相似度阈值的最大距离，任何距离都不满足时返回 -1
+    """
+    distance = int(max_len * (1 - SIMILARITY_THRESHOLD)) + 1
+    while distance >= 0 and not 1 - (distance / max_len) > SIMILARITY_THRESHOLD:
+        distance -= 1
+    return distance
+
+
+# 裁剪文件名到相同长度，保留后缀名
+def trim_filenames(name1, name2):
+    base1, ext1 = os.path.splitext(name1)
+    base2, ext2 = os.path.splitext(name2)
+    
+    target_len = min(len(name1), len(name2))
+    
+    # 处理第一个文件名
+    if len(name1) > target_len:
+        base_len = target_len - len(ext1)
+        base1 = base1[:base_len] if base_len > 0 else ''
+        name1 = f"{base1}{ext1}"
+    
+    # 处理第二个文件名
+    if len(name2) > target_len:
+        base_len = target_len - len(ext2)
+        base2 = base2[:base_len] if base_len > 0 else ''
+        name2 = f"{base2}{ext2}"
+    
+    return name1, name2
+
+
+def _common_chars(counts1, counts2):
+    """两个字符计数中共同字符的数量（按多重集计算）"""
+    if len(counts1) > len(counts2):
+        counts1, counts2 = counts2, counts1
+    get = counts2.get
+    common = 0
+    for char, count in counts1.items():
+        other = get(char)
+        if other:
+            common += count if count < other else other
+    return common
+
+
+def char_lower_bound(s1, s2, counts1=None, counts2=None):
+    """
+    基于字符频次（1-gram）的编辑距离下界：一次编辑最多消除一个多出的字符，
+    因此距离不小于 max(len) - 共同字符数
+    Args:
+        s1: 字符串1
+        s2: 字符串2
+        counts1: s1 的字符计数，None 时现场计算
+        counts2: s2 的字符计数，None 时现场计算
+    Returns:
+        不大于真实 Levenshtein 距离的整数
+    """
+    if counts1 is None:
+        counts1 = Counter(s1)
+    if counts2 is None:
+        counts2 = Counter(s2)
+    return max(len(s1), len(s2)) - _common_chars(counts1, counts2)
+
+
+def encode_names(names):
+    """
+    把字符串编码为以 0 补齐的 Unicode 码位矩阵
+    Args:
+        names: 字符串列表
+    Returns:
+        (码位矩阵 uint32[n, 最大长度], 长度数组 int64[n])
+    """
+    width = max(1, max(len(name) for name in names))
+    buffer = "".join(name.ljust(width, "\0") for name in names).encode('utf-32-le')
+    codes = np.frombuffer(buffer, dtype=np.uint32).reshape(len(names), width)
+    return codes, np.array([len(name) for name in names], dtype=np.int64)
+
+
+def _batch_myers(eq_matrix, lengths, pattern_lengths):
+    """
+    位并行 Levenshtein 距离在候选维度上的向量化实现，每一列只需十几次数组运算
+    Args:
+        eq_matrix: uint64[n, 列数]，每个文本字符在对应模式串中出现位置的掩码
+        lengths: 各文本长度
+        pattern_lengths: 各模式串长度（不超过 NUMPY_MAX_PATTERN）
+    Returns:
+        int64 距离数组
+    """
+    one = np.uint64(1)
+    mask = np.array([(1 << m) - 1 for m in pattern_lengths.tolist()], dtype=np.uint64)
+    high = np.array([1 << (m - 1) if m else 0 for m in pattern_lengths.tolist()], dtype=np.uint64)
+    pv = mask.copy()
+    mv = np.zeros(len(lengths), dtype=np.uint64)
+    distances = pattern_lengths.astype(np.int64)
+    for j in range(eq_matrix.shape[1]):
+        eq = eq_matrix[:, j]
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = mv | (~(xh | pv) & mask)
+        mh = pv & xh
+        # 已超出自身长度的文本不再更新距离
+        active = lengths > j
+        distances += active & ((ph & high) != 0)
+        distances -= active & ((mh & high) != 0)
+        ph = ((ph << one) | one) & mask
+        mh = (mh << one) & mask
+        pv = mh | (~(xv | ph) & mask)
+        mv = ph & xv
+    # 空模式串的距离即文本长度
+    return np.where(pattern_lengths == 0, lengths, distances)
+
+
+def batch_levenshtein(pattern, codes, lengths):
+    """
+    一个字符串与一批字符串的 Levenshtein 距离
+    Args:
+        pattern: 字符串，长度不超过 NUMPY_MAX_PATTERN
+        codes: encode_names 返回的码位矩阵
+        lengths: encode_names 返回的长度数组
+    Returns:
+        int64 距离数组
+    """
+    if not pattern:
+        return lengths.copy()
+    # 模式串每个字符的出现位置掩码，按码位排序后用 searchsorted 查表
+    peq = {}
+    for i, char in enumerate(pattern):
+        peq[ord(char)] = peq.get(ord(char), 0) | (1 << i)
+    table_codes = np.array(sorted(peq), dtype=np.uint32)
+    table_masks = np.array([peq[code] for code in sorted(peq)], dtype=np.uint64)
+    slots = np.minimum(np.searchsorted(table_codes, codes), len(table_codes) - 1)
+    eq_matrix = np.where(table_codes[slots] == codes, table_masks[slots], np.uint64(0))
+    return _batch_myers(eq_matrix, lengths, np.full(len(lengths), len(pattern), dtype=np.int64))
+
+
+def batch_levenshtein_pairs(patterns, texts):
+    """
+    逐对计算两组字符串的 Levenshtein 距离
+    Args:
+        patterns: 字符串列表，每个长度不超过 NUMPY_MAX_PATTERN
+        texts: 与 patterns 等长的字符串列表
+    Returns:
+        int64 距离数组
+    """
+    pattern_codes, pattern_lengths = encode_names(patterns)
+    text_codes, text_lengths = encode_names(texts)
+    eq_matrix = np.zeros(text_codes.shape, dtype=np.uint64)
+    for i in range(pattern_codes.shape[1]):
+        # 补齐位置不参与匹配
+        column = np.where(pattern_lengths > i, pattern_codes[:, i], np.uint32(0xFFFFFFFF))
+        eq_matrix |= np.where(text_codes == column[:, None], np.uint64(1 << i), np.uint64(0))
+    return _batch_myers(eq_matrix, text_lengths, pattern_lengths)
+
+
+class CandidateIndex:
+    """
+    分支归类的候选索引：按（后缀名, 文件名长度）分桶，
+    并缓存每个文件清理季度集数后的文件名及其字符计数
+    """
+    def __init__(self, files):
+        """
+        建立索引
+        Args:
+            files: 扫描记录列表，下标即文件位置
+        """
+        names = [parsed(file) for file in files]
+        self.lengths = [name.length for name in names]
+        self.cleaned = [name.cleaned for name in names]
+        self.alive = [True] * len(names)
+        self._counts = [None] * len(names)
+        self._encoded = None
+        self._exts = [name.ext for name in names]
+        self._buckets = defaultdict(list)
+        for pos, key in enumerate(zip(self._exts, self.lengths)):
+            self._buckets[key].append(pos)
+
+    def remove(self, pos):
+        """标记文件已归入分支"""
+        self.alive[pos] = False
+
+    def candidates(self, pos):
+        """
+        按位置升序返回与 pos 同后缀、长度相差不超过 MAX_LENGTH_DIFF 的未分组文件
+        Args:
+            pos: 当前文件位置
+        """
+        length = self.lengths[pos]
+        lists = []
+        for other_len in range(length - MAX_LENGTH_DIFF, length + MAX_LENGTH_DIFF + 1):
+            bucket = self._buckets.get((self._exts[pos], other_len))
+            if not bucket:
+                continue
+            # 顺便清理已分组的文件，避免后续重复跳过
+            bucket[:] = [p for p in bucket if self.alive[p]]
+            if bucket:
+                lists.append(bucket)
+        if len(lists) == 1:
+            return list(lists[0])
+        return list(heapq.merge(*lists))
+
+    def encoded(self):
+        """
+        清理后文件名的码位矩阵、长度数组、原文件名长度数组和相似度距离上限表（首次调用时生成）
+        """
+        if self._encoded is None:
+            codes, cleaned_lengths = encode_names(self.cleaned)
+            cutoffs = np.array([similarity_cutoff(n) if n else -1 for n in range(max(self.lengths) + 1)],
+                               dtype=np.int64)
+            self._encoded = (codes, cleaned_lengths, np.array(self.lengths, dtype=np.int64), cutoffs)
+        return self._encoded
+
+    def _char_counts(self, pos):
+        counts = self._counts[pos]
+        if counts is None:
+            counts = self._counts[pos] = Counter(self.cleaned[pos])
+        return counts
+
+    def lower_bound(self, pos1, pos2):
+        """两个文件清理后文件名编辑距离的字符频次下界"""
+        return char_lower_bound(self.cleaned[pos1], self.cleaned[pos2],
+                                self._char_counts(pos1), self._char_counts(pos2))
+
+
+def group_files_by_directory(file_data_list):
+    """
+    按父目录对扫描记录分组
+    Args:
+        file_data_list: 扫描记录列表
+    Returns:
+        {父目录: [记录列表]}，保持记录原有顺序
+    """
+    dir_groups = {}
+    for file in file_data_list:
+        dir_path = file["父目录"]
+        if dir_path not in dir_groups:
+            dir_groups[dir_path] = []
+        dir_groups[dir_path].append(file)
+    return dir_groups
+
+
+def _is_similar(cleaned1, len1, cleaned2, len2):
+    """清理季度集数后的文件名相似度是否超过阈值（len 为清理前的文件名长度）"""
+    cutoff = similarity_cutoff(max(len1, len2))
+    return cutoff >= 0 and bounded_levenshtein(cleaned1, cleaned2, cutoff) <= cutoff
+
+
+def _form_branches(ungrouped):
+    """
+    逐个比较全部剩余文件的分支归类（原始算法，作为索引版本的对照）
+    Args:
+        ungrouped: 待分组的记录列表
+    Returns:
+        分支列表，每个分支为记录列表
+    """
+    branches = []
+    ungrouped = list(ungrouped)
+    while ungrouped:
+        current_file = ungrouped.pop(0)
+        current_group = [current_file]
+        current = parsed(current_file)
+
+        # 比较剩余文件
+        to_remove = []
+        for i, file in enumerate(ungrouped):
+            name = parsed(file)
+
+            # 检查后缀名是否相同
+            if name.ext != current.ext:
+                continue
+
+            # 检查文件名长度差异
+            if abs(name.length - current.length) > MAX_LENGTH_DIFF:
+                continue
+
+            # 检查文件名相似度（移除季度和集数信息后比较）
+            if _is_similar(current.cleaned, current.length, name.cleaned, name.length):
+                current_group.append(file)
+                to_remove.append(i)
+        branches.append(current_group)
+
+        # 从待分组列表中移除已分组文件
+        for i in reversed(to_remove):
+            ungrouped.pop(i)
+    return branches
+
+
+def _form_branches_indexed(ungrouped, use_numpy=False):
+    """
+    通过候选索引进行分支归类，结果与 _form_branches 完全一致：
+    只比较同后缀、长度相差不超过 MAX_LENGTH_DIFF 且字符频次下界未超过阈值的文件
+    Args:
+        ungrouped: 待分组的记录列表
+        use_numpy: 候选较多时是否用 NumPy 批量计算距离
+    Returns:
+        分支列表，每个分支为记录列表
+    """
+    index = CandidateIndex(ungrouped)
+    branches = []
+    for pos, current_file in enumerate(ungrouped):
+        if not index.alive[pos]:
+            continue
+        index.remove(pos)
+        current_group = [current_file]
+        current_len = index.lengths[pos]
+        candidates = index.candidates(pos)
+        if (use_numpy and len(candidates) >= NUMPY_MIN_BATCH
+                and len(index.cleaned[pos]) <= NUMPY_MAX_PATTERN):
+            codes, cleaned_lengths, lengths, cutoffs = index.encoded()
+            distances = batch_levenshtein(index.cleaned[pos], codes[candidates], cleaned_lengths[candidates])
+            similar = distances <= cutoffs[np.maximum(lengths[candidates], current_len)]
+            matched = [other for other, ok in zip(candidates, similar.tolist()) if ok]
+        else:
+            matched = []
+            for other in candidates:
+                other_len = index.lengths[other]
+                cutoff = similarity_cutoff(max(current_len, other_len))
+                if cutoff < 0 or index.lower_bound(pos, other) > cutoff:
+                    continue
+                if bounded_levenshtein(index.cleaned[pos], index.cleaned[other], cutoff) <= cutoff:
+                    matched.append(other)
+        for other in matched:
+            current_group.append(ungrouped[other])
+            index.remove(other)
+        branches.append(current_group)
+    return branches
+
+
+def _closest_branch(small_name, rep_names):
+    """
+    逐个比较各大分支代表文件名，返回裁剪后距离最小的分支下标（距离相同取靠前者）
+    Args:
+        small_name: 小分支代表文件名
+        rep_names: 各大分支代表文件名
+    Returns:
+        分支下标
+    """
+    min_distance = float('inf')
+    best_index = None
+    for i, rep_name in enumerate(rep_names):
+        # 裁剪文件名到相同长度，保留后缀名
+        small_name_trimmed, rep_name_trimmed = trim_filenames(small_name, rep_name)
+        # 计算裁剪后的字符串相似度，只需判断是否优于当前最佳距离
+        bound = None if best_index is None else min_distance - 1
+        distance = bounded_levenshtein(small_name_trimmed, rep_name_trimmed, bound)
+        if distance < min_distance:
+            min_distance = distance
+            best_index = i
+    return best_index
+
+
+def _closest_branch_numpy(small_name, rep_names):
+    """
+    与 _closest_branch 结果一致：一次性用 NumPy 计算到全部大分支代表的距离后取第一个最小值
+    Args:
+        small_name: 小分支代表文件名
+        rep_names: 各大分支代表文件名
+    Returns:
+        分支下标
+    """
+    pairs = [trim_filenames(small_name, rep_name) for rep_name in rep_names]
+    # 位并行以较短者作为模式串，裁剪后两者等长，超长时退回逐个计算
+    if max(len(small_trimmed) for small_trimmed, _ in pairs) > NUMPY_MAX_PATTERN:
+        return _closest_branch(small_name, rep_names)
+    distances = batch_levenshtein_pairs([small_trimmed for small_trimmed, _ in pairs],
+                                        [rep_trimmed for _, rep_trimmed in pairs])
+    # argmin 返回第一个最小值，与逐个比较时距离相同保留靠前分支一致
+    return int(np.argmin(distances))
+
+
+def _closest_branch_indexed(small_name, rep_names, use_numpy=False):
+    """
+    与 _closest_branch 结果一致，但先按字符频次下界从小到大排列候选，
+    下界已超过当前最佳距离时停止比较
+    Args:
+        small_name: 小分支代表文件名
+        rep_names: 各大分支代表文件名
+        use_numpy: 候选较多时是否用 NumPy 批量计算距离
+    Returns:
+        分支下标
+    """
+    if use_numpy and len(rep_names) >= NUMPY_MIN_BATCH:
+        return _closest_branch_numpy(small_name, rep_names)
+    candidates = []
+    for i, rep_name in enumerate(rep_names):
+        small_name_trimmed, rep_name_trimmed = trim_filenames(small_name, rep_name)
+        bound = char_lower_bound(small_name_trimmed, rep_name_trimmed)
+        candidates.append((bound, i, small_name_trimmed, rep_name_trimmed))
+    candidates.sort(key=lambda c: (c[0], c[1]))
+
+    min_distance = float('inf')
+    best_index = None
+    for bound, i, small_name_trimmed, rep_name_trimmed in candidates:
+        if bound > min_distance:
+            break
+        # 距离相同时保留下标更小的分支，因此这里允许等于当前最佳距离
+        distance = bounded_levenshtein(small_name_trimmed, rep_name_trimmed,
+                                       None if best_index is None else min_distance)
+        if distance < min_distance or (distance == min_distance and i < best_index):
+            min_distance = distance
+            best_index = i
+    return best_index
+
+
+def _groupable(files):
+    """参与分组的文件（排除已增强输出的文件）"""
+    return [file for file in files if "Viden2x_HQ" not in file["文件完整路径"]]
+
+
+def form_branches(files, use_index=True, use_numpy=None):
+    """
+    对同一目录下的文件归类分支并合并小分支，结果写入记录的"分支"字段
+    Args:
+        files: 同一目录下的扫描记录列表
+        use_index: 是否使用候选索引（False 时逐对比较，用于对照验证）
+        use_numpy: 是否使用 NumPy 批量计算距离，None 表示已安装 NumPy 时使用
+    Returns:
+        分支列表，下标即分支编号
+    """
+    if use_numpy is None:
+        use_numpy = np is not None
+    # 1. 文件归类 (分支)
+    ungrouped = _groupable(files)
+    if use_index:
+        branches = _form_branches_indexed(ungrouped, use_numpy)
+    else:
+        branches = _form_branches(ungrouped)
+    # 将同一组的文件标记相同分支
+    for branch_id, branch in enumerate(branches):
+        for file in branch:
+            file["分支"] = branch_id
+
+    # 处理小分支合并 - 将文件数≤2的分支合并到相似度最高的大分支
+    small_branches = [b for b in branches if len(b) <= 2]
+    large_branches = [b for b in branches if len(b) >= 3]
+
+    # 仅当存在大分支时才合并小分支
+    if large_branches and small_branches:
+        # 创建新分支列表，以大分支为基础
+        new_branches = large_branches.copy()
+        # 取候选分支的第一个文件作为代表（合并只会追加文件，代表不变）
+        rep_names = [branch[0]["文件名带扩展名"] for branch in new_branches]
+
+        for small_branch in small_branches:
+            # 取小分支的第一个文件作为代表
+            small_name = small_branch[0]["文件名带扩展名"]
+            # 在新分支列表中找到相似度最高的大分支（不设置匹配阈值）
+            if use_index:
+                branch_id = _closest_branch_indexed(small_name, rep_names, use_numpy)
+            else:
+                branch_id = _closest_branch(small_name, rep_names)
+            # 将小分支合并到最佳匹配的大分支（不设置相似度阈值）
+            # 无条件合并到最相似的大分支
+            for file in small_branch:
+                file["分支"] = branch_id
+            new_branches[branch_id].extend(small_branch)
+
+        # 更新分支列表为合并后的新分支
+        branches = new_branches
+    return branches
+
+
+def assign_priorities(branches):
+    """
+    按各分支中最早修改的集数数量计算处理优先级，结果写入记录的"处理优先级"字段
+    Args:
+        branches: form_branches 返回的分支列表
+    """
+    # 2. 计算处理优先级
+    # 2.3 按新的排序逻辑分配优先级
+    # 过滤掉分支级为-1的分支
+    filtered_branches = [branch for branch in branches if all(file["分支"] != -1 for file in branch)]
+    
+    # 无法解析的修改时间按当前时间排序
+    now = datetime.now().timestamp()
+
+    def get_file_sort_key(file):
+        """获取文件排序键：按修改时间排序"""
+        mtime = parsed(file).mtime
+        return now if mtime is None else mtime
+    
+    # 新的排序逻辑：
+    # 1. 按季度和集数组合对所有分支中的文件分组
+    # 2. 对每组相同季度和集数的文件按修改时间排序
+    # 3. 统计每个分支中具有最早修改时间的文件数量
+    # 4. 按照这个数量进行排序，数量多的分支优先级更高
+    
+    # 按季度和集数组合对所有文件分组
+    # 只有在所有分支中都存在的季度和集数组合才会被纳入排序考虑
+    episode_groups = {}  # {(季度, 集数): [文件列表]}
+    
+    # 首先统计每个季度和集数组合出现在多少个分支中
+    episode_branch_counts = {}
+    branch_count = len(filtered_branches)
+    
+    for branch in filtered_branches:
+        # 使用集合来避免同一分支中重复的季度和集数组合被多次计算
+        branch_episode_keys = set()
+        for file in branch:
+            episode_key = (file["季度信息"], file["集数信息"])
+            branch_episode_keys.add(episode_key)
+        
+        # 增加每个季度和集数组合的分支计数
+        for episode_key in branch_episode_keys:
+            episode_branch_counts[episode_key] = episode_branch_counts.get(episode_key, 0) + 1
+    
+    # 只保留那些在所有分支中都存在的季度和集数组合
+    valid_episode_keys = {key for key, count in episode_branch_counts.items() if count == branch_count}
+    
+    # 对所有文件进行分组，但只保留有效的季度和集数组合
+    for branch in filtered_branches:
+        for file in branch:
+            episode_key = (file["季度信息"], file["集数信息"])
+            if episode_key in valid_episode_keys:
+                if episode_key not in episode_groups:
+                    episode_groups[episode_key] = []
+                episode_groups[episode_key].append(file)
+    
+    # 对每组相同季度和集数的文件按修改时间排序
+    for episode_key, files in episode_groups.items():
+        files.sort(key=get_file_sort_key)
+    
+    # 统计每个分支中具有最早修改时间的文件数量
+    # （即在各自季度和集数组合中时间最早的文件）
+    branch_early_file_counts = [0] * len(filtered_branches)
+    # 创建一个从文件路径到分支索引的映射，提高查找效率
+    file_to_branch_index = {}
+    for branch_idx, branch in enumerate(filtered_branches):
+        for file in branch:
+            file_to_branch_index[file["文件完整路径"]] = branch_idx
+            
+    # 对于每个episode group，只统计最早修改的那个文件所属的分支
+    for episode_key, files in episode_groups.items():
+        if files:  # 确保组中有文件
+            # files已经按修改时间排序，第一个就是最早修改的文件
+            earliest_file = files[0]
+            # 找到该文件所属的分支
+            branch_idx = file_to_branch_index.get(earliest_file["文件完整路径"])
+            if branch_idx is not None:
+                branch_early_file_counts[branch_idx] += 1
+    
+    # 根据每个分支中早期文件的数量排序分支
+    # 数量多的分支优先级更高（处理优先级数字更小）
+    branch_indices = list(range(len(filtered_branches)))
+    # 按早期文件数量降序排列（使用负数实现降序）
+    sorted_indices = sorted(branch_indices, key=lambda i: -branch_early_file_counts[i])
+    
+    # 根据排序结果分配处理优先级，确保同一分支内的文件具有相同的优先级
+    # 修改优先级分配逻辑，使早期文件数量多的分支优先级数字更小（优先级更高）
+    # 优先级从0开始分配，数值越小优先级越高
+    for priority, branch_idx in enumerate(sorted_indices):
+        branch = filtered_branches[branch_idx]
+        for file in branch:
+            file["处理优先级"] = priority
+
+
+def group_directory(files, use_index=True, use_numpy=None):
+    """
+    对同一目录下的文件计算分支和处理优先级，结果直接写入记录的"分支"和"处理优先级"字段
+    Args:
+        files: 同一目录下的扫描记录列表
+        use_index: 是否使用候选索引（False 时逐对比较，用于对照验证）
+        use_numpy: 是否使用 NumPy 批量计算距离，None 表示已安装 NumPy 时使用
+    Returns:
+        分支列表
+    """
+    branches = form_branches(files, use_index, use_numpy)
+    assign_priorities(branches)
+    return branches
+
+
+def add_to_branches(branches, new_files):
+    """
+    把新增文件逐个归入已有分支，不重新计算其他文件：
+    依次与各分支的首个文件比较，满足相似度条件即加入该分支（与完整归类时新文件跟随最早相似文件一致）；
+    都不相似时按小分支的规则并入最相似的大分支，没有大分支时单独成为新分支
+    Args:
+        branches: 已有分支列表，会被原地追加
+        new_files: 新增的扫描记录
+    """
+    for file in new_files:
+        name = parsed(file)
+        target = None
+        for branch_id, branch in enumerate(branches):
+            head = parsed(branch[0])
+            if (head.ext == name.ext and abs(head.length - name.length) <= MAX_LENGTH_DIFF
+                    and _is_similar(head.cleaned, head.length, name.cleaned, name.length)):
+                target = branch_id
+                break
+        if target is None:
+            large = [branch_id for branch_id, branch in enumerate(branches) if len(branch) >= 3]
+            if large:
+                target = large[_closest_branch(file["文件名带扩展名"],
+                                               [branches[i][0]["文件名带扩展名"] for i in large])]
+            else:
+                target = len(branches)
+                branches.append([])
+        # 沿用所在分支已有文件的分支编号，新分支使用未占用的编号
+        if branches[target]:
+            file["分支"] = branches[target][0]["分支"]
+        else:
+            file["分支"] = max((branch[0]["分支"] for branch in branches if branch), default=-1) + 1
+        branches[target].append(file)
+
+
+def listing_fingerprint(files):
+    """
+    目录文件列表的指纹：排序后的（文件名, 修改时间）摘要
+    Args:
+        files: 参与分组的扫描记录
+    Returns:
+        十六进制摘要字符串
+    """
+    digest = hashlib.sha1()
+    for name, mtime in sorted((file["文件名带扩展名"], file["文件修改时间"]) for file in files):
+        digest.update(f"{name}\0{mtime}\n".encode('utf-8'))
+    return digest.hexdigest()
+
+
+class GroupCache:
+    """
+    持久化的分组结果缓存
+
+    每个目录保存文件列表指纹、每个文件的修改时间/分支/处理优先级，以及按分支排列的文件名。
+    指纹一致时直接复用；只新增了少量文件（已有文件未删除、修改时间未变）时，
+    只把新文件归入已有分支并重新计算优先级；其他情况完整重新分组。
+    """
+    def __init__(self, cache_path, incremental_ratio=0.5):
+        """
+        初始化分组缓存
+        Args:
+            cache_path: 缓存JSON文件路径
+            incremental_ratio: 新增文件数不超过已缓存文件数的该比例时增量归类
+        """
+        self.cache_path = cache_path
+        self.incremental_ratio = incremental_ratio
+        self.hits = 0
+        self.incremental = 0
+        self.misses = 0
+        self._entries = {}
+        self._visited = {}
+        try:
+            with open(cache_path, 'r', encoding='utf-8') as f:
+                self._entries = json.load(f)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"读取分组缓存失败: {e}，将重新分组")
+
+    def _store(self, dir_path, files, branches):
+        self._visited[dir_path] = {
+            "fingerprint": listing_fingerprint(files),
+            "files": {file["文件名带扩展名"]: [file["文件修改时间"], file["分支"], file["处理优先级"]] for file in files},
+            "branches": [[file["文件名带扩展名"] for file in branch] for branch in branches],
+        }
+
+    def group_directory(self, dir_path, files, use_index=True, use_numpy=None):
+        """
+        计算（或复用）同一目录下文件的分支和处理优先级
+        Args:
+            dir_path: 目录路径
+            files: 同一目录下的扫描记录列表
+            use_index: 是否使用候选索引
+            use_numpy: 是否使用 NumPy 批量计算距离
+        """
+        groupable = _groupable(files)
+        # 常驻的监视模式中优先使用本次运行中更新过的条目
+        entry = self._visited.get(dir_path) or self._entries.get(dir_path)
+        by_name = {file["文件名带扩展名"]: file for file in groupable}
+        # 同一目录下文件名唯一，这里以文件名作为缓存键
+        if entry is not None and len(by_name) == len(groupable):
+            cached = entry["files"]
+            if entry["fingerprint"] == listing_fingerprint(groupable):
+                for name, (_, branch_id, priority) in cached.items():
+                    by_name[name]["分支"] = branch_id
+                    by_name[name]["处理优先级"] = priority
+                self.hits += 1
+                self._visited[dir_path] = entry
+                return
+            new_files = [file for file in groupable if file["文件名带扩展名"] not in cached]
+            unchanged = all(name in by_name and by_name[name]["文件修改时间"] == mtime
+                            for name, (mtime, _, _) in cached.items())
+            if unchanged and len(new_files) <= len(cached) * self.incremental_ratio:
+                for name, (_, branch_id, _) in cached.items():
+                    by_name[name]["分支"] = branch_id
+                branches = [[by_name[name] for name in names] for names in entry["branches"]]
+                add_to_branches(branches, new_files)
+                assign_priorities(branches)
+                self.incremental += 1
+                self._store(dir_path, groupable, branches)
+                return
+        self.misses += 1
+        branches = group_directory(files, use_index, use_numpy)
+        self._store(dir_path, groupable, branches)
+
+    def save(self):
+        """保存本次访问到的目录，未访问到的（已删除的）目录自动淘汰"""
+        try:
+            os.makedirs(os.path.dirname(self.cache_path) or '.', exist_ok=True)
+            tmp_path = f"{self.cache_path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._visited, f, ensure_ascii=False)
+            os.replace(tmp_path, self.cache_path)
+        except Exception as e:
+            logger.warning(f"保存分组缓存失败: {e}")
+
+
+def group_all(file_data_list, cache=None):
+    """
+    对全部扫描记录按目录计算分支和处理优先级
+    Args:
+        file_data_list: 扫描记录列表
+        cache: GroupCache，为None时每个目录都完整分组
+    Returns:
+        {父目录: [记录列表]}
+    """
+    dir_groups = group_files_by_directory(file_data_list)
+    for dir_path, files in dir_groups.items():
+        if cache is not None:
+            cache.group_directory(dir_path, files)
+        else:
+            group_directory(files)
+    return dir_groups
+
+
+def _make_synthetic_directory(count=1000, shows=50, seed=0):
+    """
+    生成用于基准测试的单目录扫描记录：多部剧集、多种命名模板和后缀名混在同一目录
+    Args:
+        count: 文件数
+        shows: 剧集数量
+        seed: 随机种子
+    """
+    rng = random.Random(seed)
+    letters = string.ascii_letters + "    "
+    titles = ["".join(rng.choice(letters) for _ in range(rng.randint(6, 30))).strip() or "Show"
+              for _ in range(shows)]
+    templates = ["[{group}] {title} S{season:02d}E{episode:02d} [1080p]{ext}",
+                 "{title}.S{season:02d}E{episode:02d}.WEB-DL.{group}{ext}",
+                 "[{group}] {title} - SP{episode} [BD]{ext}"]
+    files = []
+    for i in range(count):
+        show = rng.randrange(shows)
+        season, episode = rng.randint(1, 3), rng.randint(1, 60)
+        name = templates[show % len(templates)].format(
+            group=rng.choice(["GroupA", "GrpB"]), title=titles[show], season=season, episode=episode,
+            ext=(".mkv", ".mp4", ".avi")[show % 3 if rng.random() < 0.9 else rng.randrange(3)])
+        files.append({
+            "父目录": "/bench",
+            "文件名带扩展名": name,
+            "文件完整路径": f"/bench/{i}/{name}",
+            "文件修改时间": f"2024-01-{rng.randint(1, 28):02d} 00:{rng.randint(0, 59):02d}:00",
+            "季度信息": f"S{season:02d}",
+            "集数信息": f"E{episode:02d}",
+            "分支": 0,
+            "处理优先级": 0,
+        })
+    return files
+
+
+def _baseline_group_directory(files):
+    """
+    基线版本中的原始分组与优先级算法（除缩进外逐字保留），check_index 以它为对照，
+    验证逐对比较、候选索引和 NumPy 各版本的结果与原始算法完全一致
+    Args:
+        files: 同一目录下的扫描记录列表，结果直接写入"分支"和"处理优先级"字段
+    """
+    # 计算字符串相似度 (Levenshtein距离)
+    def levenshtein_distance(s1, s2):
+        if len(s1) < len(s2):
+            return levenshtein_distance(s2, s1)
+        if len(s2) == 0:
+            return len(s1)
+        previous_row = range(len(s2) + 1)
+        for i, c1 in enumerate(s1):
+            current_row = [i + 1]
+            for j, c2 in enumerate(s2):
+                insertions = previous_row[j + 1] + 1
+                deletions = current_row[j] + 1
+                substitutions = previous_row[j] + (c1 != c2)
+                current_row.append(min(insertions, deletions, substitutions))
+            previous_row = current_row
+        return previous_row[-1]
+
+    # 裁剪文件名到相同长度，保留后缀名
+    def trim_filenames(name1, name2):
+        base1, ext1 = os.path.splitext(name1)
+        base2, ext2 = os.path.splitext(name2)
+        
+        target_len = min(len(name1), len(name2))
+        
+        # 处理第一个文件名
+        if len(name1) > target_len:
+            base_len = target_len - len(ext1)
+            base1 = base1[:base_len] if base_len > 0 else ''
+            name1 = f"{base1}{ext1}"
+        
+        # 处理第二个文件名
+        if len(name2) > target_len:
+            base_len = target_len - len(ext2)
+            base2 = base2[:base_len] if base_len > 0 else ''
+            name2 = f"{base2}{ext2}"
+        
+        return name1, name2
+
+    # 1. 文件归类 (分支)
+    branches = []
+    ungrouped = [file for file in files if "Viden2x_HQ" not in file["文件完整路径"]]
+    while ungrouped:
+        current_file = ungrouped.pop(0)
+        current_group = [current_file]
+        current_name = current_file["文件名带扩展名"]
+        current_ext = os.path.splitext(current_name)[1]
+        current_len = len(current_name)
+
+        # 比较剩余文件
+        to_remove = []
+        for i, file in enumerate(ungrouped):
+            name = file["文件名带扩展名"]
+            ext = os.path.splitext(name)[1]
+            name_len = len(name)
+
+            # 检查后缀名是否相同
+            if ext != current_ext:
+                continue
+
+            # 检查文件名长度差异
+            if abs(name_len - current_len) > 5:
+                continue
+
+            # 检查文件名相似度
+            # 移除文件名中的季度和集数信息 (SxxExx格式)
+            pattern = re.compile(r'S\d{2,}E\d{2,}', re.IGNORECASE)
+            cleaned_current = pattern.sub('', current_name)
+            cleaned_name = pattern.sub('', name) 
+            distance = levenshtein_distance(cleaned_current, cleaned_name)
+            similarity = 1 - (distance / max(len(current_name), len(name)))
+            if similarity > 0.6:
+                current_group.append(file)
+                to_remove.append(i)
+
+        # 将同一组的文件标记相同分支
+        branch_id = len(branches)
+        for file in current_group:
+            file["分支"] = branch_id
+        branches.append(current_group)
+
+        # 从待分组列表中移除已分组文件
+        for i in reversed(to_remove):
+            ungrouped.pop(i)
+
+    # 处理小分支合并 - 将文件数≤2的分支合并到相似度最高的大分支
+    small_branches = [b for b in branches if len(b) <= 2]
+    large_branches = [b for b in branches if len(b) >= 3]
+
+    # 仅当存在大分支时才合并小分支
+    if large_branches and small_branches:
+        # 创建新分支列表，以大分支为基础
+        new_branches = large_branches.copy()
+        
+        for small_branch in small_branches:
+            # 取小分支的第一个文件作为代表
+            small_rep = small_branch[0]
+            small_name = small_rep["文件名带扩展名"]
+            min_distance = float('inf')
+            best_branch = None
+
+            # 在新分支列表中找到相似度最高的大分支（不设置匹配阈值）
+            for candidate_branch in new_branches:
+                # 取候选分支的第一个文件作为代表
+                rep_name = candidate_branch[0]["文件名带扩展名"]
+                 # 裁剪文件名到相同长度，保留后缀名
+                small_name_trimmed, rep_name_trimmed = trim_filenames(small_name, rep_name)
+                 # 计算裁剪后的字符串相似度
+                distance = levenshtein_distance(small_name_trimmed, rep_name_trimmed)
+                if distance < min_distance:
+                    min_distance = distance
+                    best_branch = candidate_branch
+            # 将小分支合并到最佳匹配的大分支（不设置相似度阈值）
+            # 无条件合并到最相似的大分支
+            branch_id = new_branches.index(best_branch)
+
+            for file in small_branch:
+                file["分支"] = branch_id
+            best_branch.extend(small_branch)
+    
+        # 更新分支列表为合并后的新分支
+        branches = new_branches
+
+    # 2. 计算处理优先级
+    # 2.3 按新的排序逻辑分配优先级
+    # 过滤掉分支级为-1的分支
+    filtered_branches = [branch for branch in branches if all(file["分支"] != -1 for file in branch)]
+    
+    def get_file_sort_key(file):
+        """获取文件排序键：按修改时间排序"""
+        try:
+            modify_time = datetime.strptime(file["文件修改时间"], '%Y-%m-%d %H:%M:%S')
+        except ValueError:
+            # 如果无法解析时间，使用当前时间
+            modify_time = datetime.now()
+        return modify_time
+    
+    # 新的排序逻辑：
+    # 1. 按季度和集数组合对所有分支中的文件分组
+    # 2. 对每组相同季度和集数的文件按修改时间排序
+    # 3. 统计每个分支中具有最早修改时间的文件数量
+    # 4. 按照这个数量进行排序，数量多的分支优先级更高
+    
+    # 按季度和集数组合对所有文件分组
+    # 只有在所有分支中都存在的季度和集数组合才会被纳入排序考虑
+    episode_groups = {}  # {(季度, 集数): [文件列表]}
+    
+    # 首先统计每个季度和集数组合出现在多少个分支中
+    episode_branch_counts = {}
+    branch_count = len(filtered_branches)
+    
+    for branch in filtered_branches:
+        # 使用集合来避免同一分支中重复的季度和集数组合被多次计算
+        branch_episode_keys = set()
+        for file in branch:
+            episode_key = (file["季度信息"], file["集数信息"])
+            branch_episode_keys.add(episode_key)
+        
+        # 增加每个季度和集数组合的分支计数
+        for episode_key in branch_episode_keys:
+            episode_branch_counts[episode_key] = episode_branch_counts.get(episode_key, 0) + 1
+    
+    # 只保留那些在所有分支中都存在的季度和集数组合
+    valid_episode_keys = {key for key, count in episode_branch_counts.items() if count == branch_count}
+    
+    # 对所有文件进行分组，但只保留有效的季度和集数组合
+    for branch in filtered_branches:
+        for file in branch:
+            episode_key = (file["季度信息"], file["集数信息"])
+            if episode_key in valid_episode_keys:
+                if episode_key not in episode_groups:
+                    episode_groups[episode_key] = []
+                episode_groups[episode_key].append(file)
+    
+    # 对每组相同季度和集数的文件按修改时间排序
+    for episode_key, files in episode_groups.items():
+        files.sort(key=get_file_sort_key)
+    
+    # 统计每个分支中具有最早修改时间的文件数量
+    # （即在各自季度和集数组合中时间最早的文件）
+    branch_early_file_counts = [0] * len(filtered_branches)
+    # 创建一个从文件路径到分支索引的映射，提高查找效率
+    file_to_branch_index = {}
+    for branch_idx, branch in enumerate(filtered_branches):
+        for file in branch:
+            file_to_branch_index[file["文件完整路径"]] = branch_idx
+            
+    # 对于每个episode group，只统计最早修改的那个文件所属的分支
+    for episode_key, files in episode_groups.items():
+        if files:  # 确保组中有文件
+            # files已经按修改时间排序，第一个就是最早修改的文件
+            earliest_file = files[0]
+            # 找到该文件所属的分支
+            branch_idx = file_to_branch_index.get(earliest_file["文件完整路径"])
+            if branch_idx is not None:
+                branch_early_file_counts[branch_idx] += 1
+    
+    # 根据每个分支中早期文件的数量排序分支
+    # 数量多的分支优先级更高（处理优先级数字更小）
+    branch_indices = list(range(len(filtered_branches)))
+    # 按早期文件数量降序排列（使用负数实现降序）
+    sorted_indices = sorted(branch_indices, key=lambda i: -branch_early_file_counts[i])
+    
+    # 根据排序结果分配处理优先级，确保同一分支内的文件具有相同的优先级
+    # 修改优先级分配逻辑，使早期文件数量多的分支优先级数字更小（优先级更高）
+    # 优先级从0开始分配，数值越小优先级越高
+    for priority, branch_idx in enumerate(sorted_indices):
+        branch = filtered_branches[branch_idx]
+        for file in branch:
+            file["处理优先级"] = priority
+
+
+def check_index(rounds=20, count=300):
+    """
+    差分验证：在随机目录上对比逐对比较、候选索引（纯 Python 及 NumPy）与基线原始算法的分组结果
+    （原始算法逐对计算完整的编辑距离，默认参数下约需半分钟）
+    Args:
+        rounds: 随机目录数量（剧集数量在 3 到 150 之间轮换）
+        count: 每个目录的文件数
+    Returns:
+        结果一致时返回 True
+    """
+    variants = [(False, False), (True, False)] + ([(True, True)] if np is not None else [])
+    for seed in range(rounds):
+        files = _make_synthetic_directory(count, shows=(3, 10, 40, 150)[seed % 4], seed=seed)
+        expected = [dict(file) for file in files]
+        _baseline_group_directory(expected)
+        expected = [(f["分支"], f["处理优先级"]) for f in expected]
+        for use_index, use_numpy in variants:
+            result = [dict(file) for file in files]
+            group_directory(result, use_index=use_index, use_numpy=use_numpy)
+            if [(f["分支"], f["处理优先级"]) for f in result] != expected:
+                print(f"❌ 种子 {seed} 的分组结果与原始算法不一致（use_index={use_index}, use_numpy={use_numpy}）")
+                return False
+    return True
+
+
+if __name__ == "__main__":
+    # 分组耗时及差分验证: python grouping.py [文件数] [剧集数]
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    shows = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    print("差分验证:", "✅ 一致" if check_index() else "❌ 不一致")
+    variants = [("逐对比较", False, False), ("候选索引", True, False)]
+    if np is not None:
+        variants.append(("候选索引+NumPy", True, True))
+    for label, use_index, use_numpy in variants:
+        files = _make_synthetic_directory(count, shows)
+        start = time.perf_counter()
+        group_directory(files, use_index=use_index, use_numpy=use_numpy)
+        elapsed = time.perf_counter() - start
+        print(f"{label}: {count} 个文件分为 {len({file['分支'] for file in files})} 个分支, 用时 {elapsed:.3f}s")
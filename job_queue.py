@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+"""
+待处理文件的排序策略与持久化队列
+
+排序策略（SchedulingPolicy）决定待处理文件的处理顺序，可通过 [Schedule] Policy 选择：
+- fifo：扫描顺序；
+- priority：按处理优先级，同优先级保持扫描顺序；
+- smallest：工作量最小的优先；
+- cost：综合处理优先级、工作量、文件修改时间的新旧和等待时间（老化），
+  新出的周更剧集优先，大文件等待越久越靠前，不会一直被推后。
+
+工作量按 时长（小时）× 分辨率（相对 1080p）计算，视频信息只取探测缓存（排序时不运行 ffprobe），
+未缓存时按文件大小折算。
+JobQueue 把每个文件首次进入队列的时间保存在 data 目录下，程序重启后等待时间继续累计。
+
+python job_queue.py <扫描结果JSON> 可在记录的扫描结果上模拟比较各排序策略。
+"""
+import argparse
+import json
+import logging
+import math
+import os
+import time
+
+from name_parser import parsed
+
+logger = logging.getLogger(__name__)
+
+# 工作量的参考分辨率
+REFERENCE_PIXELS = 1920 * 1080
+# 没有视频信息时，每 BYTES_PER_UNIT 字节按 1 小时 1080p 的工作量折算
+BYTES_PER_UNIT = 2 * 2**30
+# 尚未分组（处理优先级为 -1）的文件按该优先级排序
+UNGROUPED_PRIORITY = 10
+
+
+def work_units(record, probe=None):
+    """
+    估算文件的处理工作量
+    Args:
+        record: 文件记录
+        probe: 可选的 probe.VideoProbe，只读取其缓存
+    Returns:
+        时长（小时）× 分辨率（相对 1080p）；没有缓存的视频信息时按文件大小折算
+    """
+    info = probe.cached(record) if probe is not None else None
+    if info and info.duration and info.width and info.height:
+        return info.duration / 3600 * info.width * info.height / REFERENCE_PIXELS
+    return (record.get("文件大小 (字节)") or 0) / BYTES_PER_UNIT
+
+
+class SchedulingPolicy:
+    """排序策略基类：按 key 从小到大排序，key 相同时保持原顺序"""
+    name = None
+
+    def __init__(self, probe=None):
+        """
+        初始化策略
+        Args:
+            probe: 可选的 probe.VideoProbe，用于计算工作量
+        """
+        self.probe = probe
+
+    def key(self, record, now, queued_at):
+        """
+        排序键
+        Args:
+            record: 文件记录
+            now: 当前时间戳
+            queued_at: 文件进入队列的时间戳
+        """
+        raise NotImplementedError
+
+    def order(self, records, now=None, queued=None):
+        """
+        排序待处理文件
+        Args:
+            records: 文件记录列表
+            now: 当前时间戳，省略时取当前时间
+            queued: {文件完整路径: 进入队列的时间戳}，缺少的文件视为刚进入队列
+        Returns:
+            排序后的新列表
+        """
+        now = time.time() if now is None else now
+        queued = queued or {}
+        return sorted(records, key=lambda record: self.key(record, now, queued.get(record["文件完整路径"], now)))
+
+
+class FifoPolicy(SchedulingPolicy):
+    """扫描顺序"""
+    name = 'fifo'
+
+    def key(self, record, now, queued_at):
+        return 0
+
+
+class PriorityPolicy(SchedulingPolicy):
+    """按处理优先级（数字小的优先）"""
+    name = 'priority'
+
+    def key(self, record, now, queued_at):
+        priority = record.get("处理优先级")
+        return UNGROUPED_PRIORITY if priority is None or priority < 0 else priority
+
+
+class SmallestWorkPolicy(SchedulingPolicy):
+    """工作量最小的优先"""
+    name = 'smallest'
+
+    def key(self, record, now, queued_at):
+        return work_units(record, self.probe)
+
+
+class CostAwarePolicy(SchedulingPolicy):
+    """
+    综合评分（越小越优先，单位约为 1 小时 1080p 的工作量）：
+        工作量 + PriorityWeight × 处理优先级 + RecencyWeight × log2(1 + 修改至今天数)
+        - AgingPerDay × 等待天数
+    """
+    name = 'cost'
+
+    def __init__(self, probe=None, priority_weight=1.0, recency_weight=0.5, aging_per_day=1.0):
+        """
+        初始化策略
+        Args:
+            probe: 可选的 probe.VideoProbe
+            priority_weight: 处理优先级每差 1 相当的工作量
+            recency_weight: 修改时间新旧的权重（按天数取对数，一年前的文件约为 8.5 倍权重）
+            aging_per_day: 每等待一天抵消的工作量
+        """
+        super().__init__(probe)
+        self.priority_weight = priority_weight
+        self.recency_weight = recency_weight
+        self.aging_per_day = aging_per_day
+        self._priority = PriorityPolicy()
+
+    def key(self, record, now, queued_at):
+        modified = parsed(record).mtime
+        age_days = max(0.0, (now - modified) / 86400) if modified is not None else 0.0
+        waiting_days = max(0.0, (now - queued_at) / 86400)
+        return (work_units(record, self.probe)
+                + self.priority_weight * self._priority.key(record, now, queued_at)
+                + self.recency_weight * math.log2(1 + age_days)
+                - self.aging_per_day * waiting_days)
+
+
+POLICIES = {policy.name: policy for policy in (FifoPolicy, PriorityPolicy, SmallestWorkPolicy, CostAwarePolicy)}
+
+
+def create_policy(name='cost', probe=None, **weights):
+    """
+    按名称创建排序策略
+    Args:
+        name: fifo / priority / smallest / cost
+        probe: 可选的 probe.VideoProbe
+        weights: cost 策略的权重（priority_weight、recency_weight、aging_per_day），其他策略忽略
+    Returns:
+        策略实例
+    """
+    name = (name or 'cost').lower()
+    if name not in POLICIES:
+        raise ValueError(f"未知的排序策略: {name}，可选: {', '.join(POLICIES)}")
+    if name == CostAwarePolicy.name:
+        return CostAwarePolicy(probe, **weights)
+    return POLICIES[name](probe)
+
+
+class JobQueue:
+    """持久化的待处理队列：记录每个文件首次进入队列的时间，按排序策略给出处理顺序"""
+    def __init__(self, queue_path, policy):
+        """
+        初始化队列
+        Args:
+            queue_path: 保存进入队列时间的JSON文件路径
+            policy: 排序策略
+        """
+        self.queue_path = queue_path
+        self.policy = policy
+        self._queued = {}
+        try:
+            with open(queue_path, 'r', encoding='utf-8') as f:
+                self._queued = json.load(f)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"读取待处理队列失败: {e}，等待时间重新计算")
+
+    def order(self, records, now=None):
+        """
+        同步队列内容并排序：新文件记录进入队列的时间，已不在待处理列表中的文件移出队列
+        Args:
+            records: 当前全部待处理记录
+            now: 当前时间戳，省略时取当前时间
+        Returns:
+            排序后的新列表
+        """
+        now = time.time() if now is None else now
+        self._queued = {record["文件完整路径"]: self._queued.get(record["文件完整路径"], now) for record in records}
+        return self.policy.order(records, now, self._queued)
+
+    def save(self):
+        """保存进入队列的时间"""
+        try:
+            os.makedirs(os.path.dirname(self.queue_path) or '.', exist_ok=True)
+            tmp_path = f"{self.queue_path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._queued, f, ensure_ascii=False)
+            os.replace(tmp_path, self.queue_path)
+        except Exception as e:
+            logger.warning(f"保存待处理队列失败: {e}")
+
+
+def simulate(records, policy, seconds_per_unit=3600, at_once=False):
+    """
+    模拟单个 GPU 按策略依次处理记录
+    Args:
+        records: 文件记录列表
+        policy: 排序策略
+        seconds_per_unit: 每单位工作量（1 小时 1080p）的处理秒数
+        at_once: True 时全部文件在开始时进入队列，否则按文件修改时间依次进入
+    Returns:
+        [(记录, 进入队列时间戳, 完成时间戳)]，按完成顺序排列
+    """
+    arrivals = sorted(((parsed(record).mtime or 0, index, record) for index, record in enumerate(records)),
+                      key=lambda item: item[:2])
+    start = arrivals[0][0] if arrivals else 0
+    if at_once:
+        start = max(arrival for arrival, _, _ in arrivals) if arrivals else 0
+        arrivals = [(start, index, record) for _, index, record in arrivals]
+    clock, queued, pending, finished = start, {}, [], []
+    next_arrival = 0
+    while pending or next_arrival < len(arrivals):
+        if not pending:
+            clock = max(clock, arrivals[next_arrival][0])
+        while next_arrival < len(arrivals) and arrivals[next_arrival][0] <= clock:
+            arrival, _, record = arrivals[next_arrival]
+            pending.append(record)
+            queued[record["文件完整路径"]] = arrival
+            next_arrival += 1
+        record = policy.order(pending, clock, queued)[0]
+        pending.remove(record)
+        clock += work_units(record, policy.probe) * seconds_per_unit
+        finished.append((record, queued[record["文件完整路径"]], clock))
+    return finished
+
+
+def _percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))] if values else 0.0
+
+
+def _mean(values):
+    return sum(values) / len(values) if values else 0.0
+
+
+def _compare(records, policy_names, seconds_per_unit, at_once):
+    """打印各策略从进入队列到处理完成的等待时间（小时）"""
+    # 大于 80% 分位数的视为大文件，用于观察老化是否生效
+    large = _percentile([record.get("文件大小 (字节)") or 0 for record in records], 0.8)
+    print(f"文件 {len(records)} 个，每单位工作量 {seconds_per_unit / 3600:.2f} 小时，"
+          f"{'全部同时进入队列' if at_once else '按修改时间进入队列'}")
+    for name in policy_names:
+        finished = simulate(records, create_policy(name), seconds_per_unit, at_once)
+        waits, small, big = [], [], []
+        for record, arrival, done in finished:
+            wait = (done - arrival) / 3600
+            waits.append(wait)
+            (big if (record.get("文件大小 (字节)") or 0) > large else small).append(wait)
+        print(f"{name:<8} 平均 {_mean(waits):8.1f}  P95 {_percentile(waits, 0.95):8.1f}  最长 {max(waits, default=0):8.1f}  "
+              f"小文件平均 {_mean(small):8.1f}  大文件平均 {_mean(big):8.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="在记录的扫描结果上模拟比较排序策略")
+    parser.add_argument('backlog', help="扫描结果JSON文件（data/scan_result_*.json）")
+    parser.add_argument('--seconds-per-unit', type=float, default=3600,
+                        help="每单位工作量（1 小时 1080p）的处理秒数，默认 3600")
+    parser.add_argument('--at-once', action='store_true', help="全部文件在开始时进入队列（默认按修改时间依次进入）")
+    parser.add_argument('--policies', default=','.join(POLICIES), help="逗号分隔的策略名称")
+    args = parser.parse_args()
+    with open(args.backlog, 'r', encoding='utf-8') as f:
+        # 处理步骤为0的文件不进入处理队列
+        backlog = [record for record in json.load(f) if record.get("处理步骤") in (1, 2)]
+    _compare(backlog, args.policies.split(','), args.seconds_per_unit, args.at_once)
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""
+扫描结果迁移工具
+
+把 data 目录下现有的 scan_result_*.json 导入到指定的存储后端，
+或者把后端中的数据导出回原有格式的JSON文件。
+
+用法:
+    python migrate_data.py                       # 将 data/scan_result_*.json 全部导入 SQLite
+    python migrate_data.py --backend journal     # 导入为追加日志模式
+    python migrate_data.py --export              # 从 SQLite 导出回 JSON
+    python migrate_data.py data/scan_result_Z.json
+"""
+import argparse
+import glob
+import logging
+import os
+import sys
+
+from data_manager import create_data_manager
+
+
+def get_base_dir():
+    """获取基础目录，兼容PyInstaller打包后的环境"""
+    if hasattr(sys, '_MEIPASS'):
+        return os.path.dirname(sys.executable)
+    return os.path.dirname(os.path.abspath(__file__))
+
+
+def migrate(json_path, backend, export=False):
+    """
+    迁移单个扫描结果文件
+    Args:
+        json_path: scan_result_*.json 文件路径
+        backend: 目标存储后端名称
+        export: 为True时从后端导出到JSON，否则从JSON导入到后端
+    Returns:
+        迁移是否成功
+    """
+    manager = create_data_manager(json_path, backend)
+    if export:
+        success = manager.export_json(json_path)
+        logging.info(f"{'✅' if success else '❌'} 导出 {backend} -> {json_path}")
+        return success
+    count = manager.import_json(json_path)
+    logging.info(f"✅ 导入 {json_path} -> {backend}，共 {count} 条记录")
+    return True
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="扫描结果存储后端迁移工具")
+    parser.add_argument('files', nargs='*', help="要迁移的 scan_result_*.json 文件，默认处理 data 目录下全部文件")
+    parser.add_argument('--backend', default='sqlite', choices=['sqlite', 'journal'], help="目标存储后端")
+    parser.add_argument('--export', action='store_true', help="从存储后端导出回JSON文件")
+    parser.add_argument('--data-dir', default=os.path.join(get_base_dir(), 'data'), help="扫描结果所在目录")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    files = args.files or sorted(glob.glob(os.path.join(args.data_dir, 'scan_result_*.json')))
+    if not files:
+        logging.warning(f"未找到需要迁移的扫描结果: {args.data_dir}")
+        return 1
+
+    failed = [path for path in files if not migrate(os.path.abspath(path), args.backend, args.export)]
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
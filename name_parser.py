@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""
+文件名解析模块
+
+每个文件名只解析一次：季度、集数、去掉季度集数后的文件名、扩展名和长度；
+"文件修改时间"字符串同样只解析一次为 epoch 秒。分组、优先级排序和六天筛选
+都只读取这里的解析结果，不再在循环中重复执行正则、splitext 和 strptime。
+扫描记录本身仍是原样持久化的字典，解析结果按（文件名, 修改时间）缓存。
+缓存不设上限（固定上限的 LRU 在顺序遍历超过上限的媒体库时每次都被整体淘汰，命中率为零），
+由调用方在每次扫描开始时调用 clear_cache()，占用只与一次扫描涉及的文件数相关。
+"""
+import os
+import re
+from collections import namedtuple
+from datetime import datetime
+from functools import lru_cache
+
+# 从文件名中提取 季度(S01) 和 集数(E06)
+SEASON_EPISODE_PATTERN = re.compile(r'S(\d{2})E(\d{2,4})', re.IGNORECASE)
+
+# 移除文件名中的季度和集数信息 (SxxExx格式)
+SEASON_EPISODE_RE = re.compile(r'S\d{2,}E\d{2,}', re.IGNORECASE)
+
+# "文件修改时间"字段的格式
+MTIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# season/episode: 季度和集数（未匹配时为 "00"/"0000"），cleaned: 移除季度集数后的文件名，
+# ext: 扩展名，length: 文件名长度，mtime: 修改时间 epoch 秒（无法解析时为 None）
+ParsedName = namedtuple('ParsedName', ['season', 'episode', 'cleaned', 'ext', 'length', 'mtime'])
+
+
+@lru_cache(maxsize=None)
+def parse_mtime(text):
+    """
+    解析"文件修改时间"字符串
+    Args:
+        text: '%Y-%m-%d %H:%M:%S' 格式的时间
+    Returns:
+        epoch 秒，无法解析时返回 None
+    """
+    try:
+        return datetime.strptime(text, MTIME_FORMAT).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+@lru_cache(maxsize=None)
+def _name_fields(name):
+    """文件名本身的解析结果（与修改时间无关的部分）"""
+    season = "00"  # 默认值
+    episode = "0000"  # 默认值
+    season_match = SEASON_EPISODE_PATTERN.search(name)
+    if season_match:
+        season = season_match.group(1)  # 如 '01'
+        episode = season_match.group(2)  # 如 '06'
+    return season, episode, SEASON_EPISODE_RE.sub('', name), os.path.splitext(name)[1], len(name)
+
+
+@lru_cache(maxsize=None)
+def parse_name(name, mtime_text=None):
+    """
+    解析文件名（及修改时间）
+    Args:
+        name: 文件名（带扩展名）
+        mtime_text: "文件修改时间"字段，可省略
+    Returns:
+        ParsedName
+    """
+    mtime = parse_mtime(mtime_text) if mtime_text is not None else None
+    return ParsedName(*_name_fields(name), mtime)
+
+
+def parsed(record):
+    """
+    扫描记录的解析结果
+    Args:
+        record: 扫描记录
+    Returns:
+        ParsedName
+    """
+    return parse_name(record["文件名带扩展名"], record.get("文件修改时间"))
+
+
+def clear_cache():
+    """清空解析缓存，每次扫描开始时调用，避免常驻的监视模式下缓存随文件增删无限增长"""
+    parse_mtime.cache_clear()
+    _name_fields.cache_clear()
+    parse_name.cache_clear()
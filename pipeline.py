@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+"""
+重叠 I/O 的处理流水线
+
+video2x 处理第 N 个文件时，后台线程预先把后续文件从扫描目录复制到临时目录（预取），
+并把第 N-1 个文件的处理结果移回原目录（移出），GPU 不再等待网络共享上的复制和移动。
+预取数量受 PrefetchDepth 限制，预取文件占用的临时空间受 TmpBudgetGB 和 MinFreeGB 限制；
+复制先写入 .part 文件再改名，处理端只会看到完整的文件；预取完成后调用 on_fetched
+（由调用方记录检查点，启动时的恢复过程不会把其他实例尚未使用的预取文件当作残缺文件删除）。
+调用方放弃的文件（占用失败、超出处理窗口、处理结束仍未使用）通过 release/retain 立即释放
+预取名额和预算并删除副本，不会一直占用到 close。
+"""
+import logging
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+PART_SUFFIX = '.part'
+
+
+class IOPipeline:
+    """后台预取与移出执行器：预取和移出各用一个线程，分别按提交顺序执行"""
+    def __init__(self, depth=1, tmp_budget_bytes=40 * 2**30, min_free_bytes=20 * 2**30,
+                 on_fetched=None, on_unused=None):
+        """
+        初始化流水线
+        Args:
+            depth: 最多预取（含正在复制）的文件数，0 表示不预取
+            tmp_budget_bytes: 预取文件在临时目录中合计占用的上限（字节）
+            min_free_bytes: 预取后临时目录所在磁盘至少保留的剩余空间（字节）
+            on_fetched: 可选，预取完成后在预取线程中以 (源文件, 临时路径) 调用
+            on_unused: 可选，关闭时删除未被使用的预取文件后以 (源文件, 临时路径) 调用
+        """
+        self.depth = depth
+        self.tmp_budget_bytes = tmp_budget_bytes
+        self.min_free_bytes = min_free_bytes
+        self.on_fetched = on_fetched
+        self.on_unused = on_unused
+        self._fetch_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='prefetch')
+        self._move_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='move-out')
+        self._lock = threading.Lock()
+        # 目标路径 -> (Future, 源文件大小, 源文件路径)，处理端取走之前一直计入预算
+        self._fetches = {}
+        # 移出成功后 on_done 抛出的异常，close() 时返回
+        self._move_errors = []
+
+    def _reserved_bytes(self):
+        return sum(size for _, size, _ in self._fetches.values())
+
+    def prefetch(self, src, dst, size):
+        """
+        在后台把源文件复制到临时目录
+        Args:
+            src: 源文件路径
+            dst: 临时目录中的目标路径
+            size: 源文件大小（字节）
+        Returns:
+            是否已安排预取（超出预取数量或临时空间预算时返回 False）
+        """
+        with self._lock:
+            if dst in self._fetches:
+                return True
+            if len(self._fetches) >= self.depth:
+                return False
+            if self._reserved_bytes() + size > self.tmp_budget_bytes:
+                logger.info(f"临时目录预算不足，暂不预取: {src}")
+                return False
+            try:
+                os.makedirs(os.path.dirname(dst), exist_ok=True)
+                free = shutil.disk_usage(os.path.dirname(dst)).free
+            except OSError as e:
+                logger.warning(f"无法检查临时目录空间: {e}，暂不预取")
+                return False
+            if free - size < self.min_free_bytes:
+                logger.info(f"临时目录剩余空间不足，暂不预取: {src}")
+                return False
+            self._fetches[dst] = (self._fetch_pool.submit(self._prefetch, src, dst), size, src)
+        logger.info(f"开始预取: {src}")
+        return True
+
+    @staticmethod
+    def _copy(src, dst):
+        part_path = dst + PART_SUFFIX
+        try:
+            shutil.copy2(src, part_path)
+            os.replace(part_path, dst)
+        except BaseException:
+            try:
+                os.remove(part_path)
+            except OSError:
+                pass
+            raise
+        logger.info(f"预取完成: {dst}")
+
+    def _prefetch(self, src, dst):
+        self._copy(src, dst)
+        if self.on_fetched is not None:
+            try:
+                self.on_fetched(src, dst)
+            except Exception as e:
+                logger.warning(f"预取完成后的回调失败: {e}")
+
+    def wait(self, dst):
+        """
+        等待已安排的预取完成并将其移出预算，没有预取时立即返回
+        Args:
+            dst: 临时目录中的目标路径
+        Returns:
+            预取是否成功完成
+        """
+        with self._lock:
+            future, _, _ = self._fetches.pop(dst, (None, 0, None))
+        if future is None:
+            return False
+        try:
+            future.result()
+            return True
+        except Exception as e:
+            logger.warning(f"预取失败: {e}")
+            return False
+
+    def _discard(self, future, src, dst):
+        """删除未被使用的预取副本（预取完成后在预取线程中调用，已取消的预取无需处理）"""
+        if future.cancelled() or future.exception() is not None or not os.path.exists(dst):
+            return
+        try:
+            os.remove(dst)
+            logger.info(f"已清理未使用的预取文件: {dst}")
+        except OSError as e:
+            logger.warning(f"清理预取文件失败: {e}")
+            return
+        if self.on_unused is not None:
+            try:
+                self.on_unused(src, dst)
+            except Exception as e:
+                logger.warning(f"清理预取文件后的回调失败: {e}")
+
+    def _drop(self, dsts):
+        with self._lock:
+            dropped = [(dst, self._fetches.pop(dst)) for dst in dsts if dst in self._fetches]
+        for dst, (future, _, src) in dropped:
+            future.cancel()
+            # 正在复制的预取无法取消，复制完成后再删除
+            future.add_done_callback(lambda f, src=src, dst=dst: self._discard(f, src, dst))
+
+    def release(self, src):
+        """
+        放弃某个源文件的预取：立即释放预取名额和预算，删除已复制的副本
+        Args:
+            src: 源文件路径，没有对应的预取时不做任何事
+        """
+        with self._lock:
+            dsts = [dst for dst, (_, _, source) in self._fetches.items() if source == src]
+        self._drop(dsts)
+
+    def retain(self, sources):
+        """
+        只保留指定源文件的预取，其余预取按 release 放弃
+        Args:
+            sources: 仍可能被处理的源文件路径集合
+        """
+        with self._lock:
+            dsts = [dst for dst, (_, _, source) in self._fetches.items() if source not in sources]
+        self._drop(dsts)
+
+    def fetch(self, src, dst):
+        """
+        取得源文件在临时目录中的副本：等待已安排的预取完成，未预取或预取失败时直接复制
+        Args:
+            src: 源文件路径
+            dst: 临时目录中的目标路径
+        """
+        if not self.wait(dst):
+            self._copy(src, dst)
+
+    def move_out(self, src, dst, on_done=None):
+        """
+        在后台把处理结果移动到目标路径
+        Args:
+            src: 临时目录中的处理结果
+            dst: 目标路径
+            on_done: 移动成功后在移出线程中调用（更新记录、清理临时文件等）
+        """
+        def run():
+            try:
+                os.makedirs(os.path.dirname(dst), exist_ok=True)
+                shutil.move(src, dst)
+                logger.info(f"文件已移动到原目录: {dst}")
+            except Exception as e:
+                logger.error(f"移动文件到原目录失败: {e}")
+                return
+            if on_done is not None:
+                try:
+                    on_done()
+                except Exception as e:
+                    # 文件已移出但后续的记录更新失败，记录下来在 close() 时返回
+                    logger.exception(f"文件已移动到原目录，但后续操作失败: {dst}")
+                    self._move_errors.append((dst, e))
+        self._move_pool.submit(run)
+
+    def defer(self, callback):
+        """在此前提交的全部移出完成后调用 callback（例如释放记录占用）"""
+        def run():
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"移出后续操作失败: {e}")
+        self._move_pool.submit(run)
+
+    def close(self):
+        """
+        等待全部移出完成，并删除已预取但未被使用的临时文件
+        Returns:
+            移出成功但 on_done 失败的 (目标路径, 异常) 列表
+        """
+        with self._lock:
+            dsts = list(self._fetches)
+        self._drop(dsts)
+        self._fetch_pool.shutdown(wait=True)
+        self._move_pool.shutdown(wait=True)
+        errors, self._move_errors = self._move_errors, []
+        return errors
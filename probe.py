@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+"""
+视频流信息探测
+
+通过 ffprobe 读取第一个视频流的分辨率、帧率、编码、时长和帧数，
+结果按 (路径, 大小, 修改时间) 缓存，文件未变化时不重复探测。
+指定缓存文件时探测成功的结果同时保存在该JSON文件中，程序重启后继续使用。
+排序等需要一次处理大量记录的地方只读取缓存（cached），未缓存的文件由 warm 在后台线程中探测。
+"""
+import json
+import logging
+import os
+import subprocess
+import threading
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+VideoInfo = namedtuple('VideoInfo', ['width', 'height', 'fps', 'codec', 'duration', 'frames'])
+
+
+def _rate(text):
+    """解析 ffprobe 的 "30000/1001" 形式帧率"""
+    try:
+        num, _, den = text.partition('/')
+        return float(num) / float(den or 1)
+    except (ValueError, ZeroDivisionError, AttributeError):
+        return 0.0
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def parse_ffprobe(output):
+    """
+    解析 ffprobe -of json 的输出
+    Args:
+        output: ffprobe 标准输出
+    Returns:
+        VideoInfo，没有视频流时返回 None
+    """
+    data = json.loads(output)
+    streams = data.get("streams") or []
+    if not streams:
+        return None
+    stream = streams[0]
+    fps = _rate(stream.get("avg_frame_rate")) or _rate(stream.get("r_frame_rate"))
+    duration = _number(stream.get("duration")) or _number((data.get("format") or {}).get("duration"))
+    # MKV 等容器通常没有 nb_frames，按时长和帧率估算
+    frames = int(_number(stream.get("nb_frames"))) or int(round(duration * fps))
+    return VideoInfo(int(stream.get("width") or 0), int(stream.get("height") or 0), fps,
+                     stream.get("codec_name") or '', duration, frames)
+
+
+def probe_video(path, ffprobe='ffprobe'):
+    """
+    用 ffprobe 探测视频流信息
+    Args:
+        path: 视频文件路径
+        ffprobe: ffprobe 可执行文件路径
+    Returns:
+        VideoInfo，探测失败时返回 None
+    """
+    cmd = [ffprobe, '-v', 'error', '-select_streams', 'v:0',
+           '-show_entries', 'stream=width,height,avg_frame_rate,r_frame_rate,codec_name,duration,nb_frames',
+           '-show_entries', 'format=duration', '-of', 'json', path]
+    result = subprocess.run(cmd, capture_output=True, text=True, encoding='utf-8', errors='ignore', timeout=60)
+    if result.returncode != 0:
+        logger.warning(f"ffprobe 探测失败: {path}: {result.stderr.strip()}")
+        return None
+    return parse_ffprobe(result.stdout)
+
+
+class VideoProbe:
+    """带缓存的视频信息探测"""
+    def __init__(self, ffprobe='ffprobe', cache_path=None):
+        """
+        初始化探测器
+        Args:
+            ffprobe: ffprobe 可执行文件路径
+            cache_path: 可选的缓存JSON文件路径，省略时只缓存在内存中
+        """
+        self.ffprobe = ffprobe
+        self.cache_path = cache_path
+        self._lock = threading.Lock()
+        self._cache = {}
+        self._available = True
+        # 文件完整路径 -> {"size", "mtime", "info"}，只包含探测成功的结果
+        self._entries = self._load() if cache_path else {}
+        self._dirty = False
+        for path, entry in self._entries.items():
+            self._cache[(path, entry["size"], entry["mtime"])] = VideoInfo(*entry["info"])
+
+    def _load(self):
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+            return {path: entry for path, entry in entries.items()
+                    if len(entry.get("info") or ()) == len(VideoInfo._fields)}
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            logger.warning(f"读取视频信息缓存失败: {e}，重新探测")
+            return {}
+
+    @staticmethod
+    def _key(record):
+        return (record.get("文件完整路径"), record.get("文件大小 (字节)"), record.get("文件修改时间"))
+
+    def cached(self, record):
+        """
+        只从缓存获取视频信息，不启动 ffprobe
+        Args:
+            record: 文件记录
+        Returns:
+            VideoInfo，未缓存或探测失败时返回 None
+        """
+        with self._lock:
+            return self._cache.get(self._key(record))
+
+    def warm(self, records):
+        """
+        在后台线程中依次探测尚未缓存的记录，不阻塞调用方
+        Args:
+            records: 文件记录列表，按希望的探测顺序排列
+        Returns:
+            后台线程，没有需要探测的记录时返回 None
+        """
+        with self._lock:
+            missing = [record for record in records if self._key(record) not in self._cache]
+        if not missing or not self._available:
+            return None
+
+        def run():
+            for record in missing:
+                if not self._available:
+                    break
+                self.info(record)
+        thread = threading.Thread(target=run, name='probe-warm', daemon=True)
+        thread.start()
+        return thread
+
+    def info(self, record):
+        """
+        获取记录对应文件的视频信息，未缓存时同步运行 ffprobe
+        Args:
+            record: 文件记录
+        Returns:
+            VideoInfo，探测失败或 ffprobe 不可用时返回 None
+        """
+        key = self._key(record)
+        with self._lock:
+            if key in self._cache:
+                return self._cache[key]
+        info = None
+        if self._available:
+            try:
+                info = probe_video(key[0], self.ffprobe)
+            except FileNotFoundError:
+                # 只提示一次，之后不再尝试
+                logger.warning(f"未找到 ffprobe: {self.ffprobe}，无法探测视频信息")
+                self._available = False
+            except (OSError, subprocess.SubprocessError, ValueError) as e:
+                logger.warning(f"ffprobe 探测失败: {key[0]}: {e}")
+        with self._lock:
+            self._cache[key] = info
+            if info is not None and self.cache_path:
+                self._entries[key[0]] = {"size": key[1], "mtime": key[2], "info": list(info)}
+                self._dirty = True
+        return info
+
+    def save(self):
+        """把新的探测结果写入缓存文件（与文件中其他进程保存的结果合并）"""
+        with self._lock:
+            if not self._dirty:
+                return
+            entries = dict(self._entries)
+            self._dirty = False
+        try:
+            os.makedirs(os.path.dirname(self.cache_path) or '.', exist_ok=True)
+            try:
+                with open(self.cache_path, 'r', encoding='utf-8') as f:
+                    merged = json.load(f)
+            except (FileNotFoundError, ValueError):
+                merged = {}
+            merged.update(entries)
+            tmp_path = f"{self.cache_path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(merged, f, ensure_ascii=False)
+            os.replace(tmp_path, self.cache_path)
+        except Exception as e:
+            logger.warning(f"保存视频信息缓存失败: {e}")
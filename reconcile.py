@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+新旧扫描结果对账模块
+
+以规范化路径（Windows 上不区分大小写）为索引把旧记录与本次扫描记录一一对应，分类为：
+新增（只在扫描中）、删除（只在旧记录中）、修改（大小或修改时间变化）和未变化。
+文件是否存在完全由本次扫描结果决定，不再逐条调用 os.path.exists；
+扫描未覆盖的目录（扫描范围之外或超时跳过的子树）中的旧记录原样保留。
+"""
+import logging
+import os
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+# merged: 合并后的记录列表（未变化的旧记录保留处理状态，修改过的替换为新记录，新增的追加在末尾）
+# added: 新增记录，removed: 已删除的旧记录，modified: (旧记录, 新记录) 列表，unchanged: 保留的旧记录
+Reconciliation = namedtuple('Reconciliation', ['merged', 'added', 'removed', 'modified', 'unchanged'])
+
+
+def normalize_path(path):
+    """对账使用的路径键（规范化分隔符，只在不区分大小写的 Windows 上统一大小写）"""
+    return os.path.normcase(os.path.normpath(path))
+
+
+def _prefixes(dirs):
+    return tuple(os.path.join(normalize_path(d), '') for d in dirs)
+
+
+def reconcile(old_records, new_records, roots, skipped_dirs=()):
+    """
+    对比旧记录与本次扫描记录
+    Args:
+        old_records: 数据文件中已有的记录
+        new_records: 本次扫描记录
+        roots: 本次扫描的根目录列表，只有其中的旧记录会被判定为删除
+        skipped_dirs: 扫描超时被跳过的子树根目录，其中的旧记录原样保留
+    Returns:
+        Reconciliation
+    """
+    scanned = {}
+    for record in new_records:
+        scanned.setdefault(normalize_path(record["文件完整路径"]), record)
+
+    roots, skipped = _prefixes(roots), _prefixes(skipped_dirs)
+    def in_scope(key):
+        return key.startswith(roots) and not key.startswith(skipped)
+
+    merged, removed, modified, unchanged = [], [], [], []
+    matched = set()
+    for old in old_records:
+        key = normalize_path(old["文件完整路径"])
+        new = scanned.get(key)
+        if new is None:
+            if in_scope(key):
+                removed.append(old)
+            else:
+                merged.append(old)
+                unchanged.append(old)
+        elif key in matched:
+            # 同一路径的重复旧记录只保留第一条
+            removed.append(old)
+        else:
+            matched.add(key)
+            if (old.get("文件大小 (字节)") == new["文件大小 (字节)"]
+                    and old.get("文件修改时间") == new["文件修改时间"]):
+                merged.append(old)
+                unchanged.append(old)
+            else:
+                merged.append(new)
+                modified.append((old, new))
+
+    added = [record for key, record in scanned.items() if key not in matched]
+    merged.extend(added)
+    logger.info(f"对账完成: 新增 {len(added)}，删除 {len(removed)}，修改 {len(modified)}，未变化 {len(unchanged)}")
+    return Reconciliation(merged, added, removed, modified, unchanged)
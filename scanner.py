@@ -0,0 +1,444 @@
+# -*- coding: utf-8 -*-
+"""
+视频文件扫描模块
+
+基于 os.scandir 单次遍历扫描目录：先按扩展名过滤，只对视频文件调用一次
+DirEntry.stat()，同时取得大小和修改时间；扫描结果以生成器逐条产出。
+配合 DirectoryCache 可跳过修改时间未变化的目录，直接复用上次的文件列表；
+scan_videos_parallel 将一、二级子目录分发到线程池并行扫描。
+"""
+import json
+import os
+import sys
+import time
+import logging
+import queue
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from datetime import datetime
+
+from name_parser import parse_name
+from video_record import VideoRecord
+
+# 视频文件扩展名集合
+VIDEO_EXTENSIONS = {'.mp4', '.mkv', '.avi', '.mov', '.flv', '.wmv', '.m4v', '.mpeg', '.mpg', '.ts', '.webm', '.vob', '.ogv', '.rmvb', '.asf', '.rm', '.3gp'}
+
+logger = logging.getLogger(__name__)
+
+
+def build_file_record(parent_dir, filename_with_ext, full_path, file_size, mod_time):
+    """
+    根据文件信息构建扫描记录
+    Args:
+        parent_dir: 父目录
+        filename_with_ext: 文件名（带扩展名）
+        full_path: 文件完整路径
+        file_size: 文件大小（字节）
+        mod_time: 修改时间（epoch秒）
+    Returns:
+        扫描记录（VideoRecord）
+    """
+    mod_time_str = datetime.fromtimestamp(mod_time).strftime('%Y-%m-%d %H:%M:%S')
+
+    # 季度和集数信息，同一文件名只解析一次
+    name = parse_name(filename_with_ext)
+
+    return VideoRecord(parent_dir, filename_with_ext, full_path, file_size, mod_time_str,
+                       name.season, name.episode,
+                       step=3 if "Viden2x_HQ" in filename_with_ext else 0)
+
+
+def scan_directory(dir_path, with_mtimes=False):
+    """
+    列出单个目录中的视频文件记录和子目录
+    Args:
+        dir_path: 目录路径
+        with_mtimes: 是否额外返回每个视频文件的修改时间（epoch秒）
+    Returns:
+        (视频文件记录列表, 子目录路径列表)，with_mtimes为True时追加修改时间列表；
+        目录无法访问时均为空
+    """
+    records = []
+    subdirs = []
+    mtimes = []
+    try:
+        with os.scandir(dir_path) as it:
+            entries = list(it)
+    except OSError as e:
+        logger.warning("⚠️ 无法访问目录 '%s': %s", dir_path, e)
+        return (records, subdirs, mtimes) if with_mtimes else (records, subdirs)
+
+    for entry in entries:
+        try:
+            # 与 os.walk 一致：不进入指向目录的符号链接
+            if entry.is_dir():
+                if not entry.is_symlink():
+                    subdirs.append(entry.path)
+                continue
+            # 只处理视频文件，扩展名过滤放在 stat 之前
+            ext = os.path.splitext(entry.name)[1].lower()
+            if ext not in VIDEO_EXTENSIONS:
+                continue
+            st = entry.stat()
+            record = build_file_record(dir_path, entry.name, entry.path, st.st_size, st.st_mtime)
+            records.append(record)
+            mtimes.append(st.st_mtime)
+            logger.debug(f"发现视频文件: {record['文件完整路径']}")
+        except Exception as e:
+            logger.error("⚠️ 处理文件 '%s' 时出错: %s", entry.name, e, exc_info=True)
+    return (records, subdirs, mtimes) if with_mtimes else (records, subdirs)
+
+
+class DirectoryCache:
+    """
+    持久化的目录修改时间缓存
+
+    每个目录记录其修改时间、条目数、视频文件 [文件名, 大小, 修改时间] 列表和子目录列表。
+    目录的修改时间只在其中的条目增删或改名时变化，因此修改时间未变的目录无需重新列出，
+    但子目录仍需逐个检查各自的修改时间。原地写入的文件（如下载中的文件）不会改变目录
+    修改时间，所以最近修改过的缓存文件会重新 stat 一次。
+    """
+    def __init__(self, cache_path, recheck_seconds=48 * 3600):
+        """
+        初始化目录缓存
+        Args:
+            cache_path: 缓存JSON文件路径
+            recheck_seconds: 缓存中修改时间在该秒数以内的文件会重新获取大小和修改时间
+        """
+        self.cache_path = cache_path
+        self.recheck_seconds = recheck_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+        self._visited = {}
+        # 并行扫描时多个线程共享同一个缓存
+        self._lock = threading.Lock()
+        try:
+            with open(cache_path, 'r', encoding='utf-8') as f:
+                self._entries = json.load(f)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"读取目录缓存失败: {e}，将完整扫描")
+
+    def lookup(self, dir_path, dir_mtime_ns):
+        """
+        查询目录缓存
+        Args:
+            dir_path: 目录路径
+            dir_mtime_ns: 目录当前的修改时间（纳秒）
+        Returns:
+            命中时返回 (视频文件记录列表, 子目录路径列表)，否则返回None
+        """
+        with self._lock:
+            entry = self._entries.get(dir_path)
+            if entry is None or entry["mtime"] != dir_mtime_ns:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._visited[dir_path] = entry
+        recent = time.time() - self.recheck_seconds
+        records = []
+        for i, (name, size, mtime) in enumerate(entry["files"]):
+            full_path = os.path.join(dir_path, name)
+            if mtime >= recent:
+                try:
+                    st = os.stat(full_path)
+                    size, mtime = st.st_size, st.st_mtime
+                    entry["files"][i] = [name, size, mtime]
+                except OSError as e:
+                    logger.warning("⚠️ 无法获取文件信息 '%s': %s", full_path, e)
+                    continue
+            records.append(build_file_record(dir_path, name, full_path, size, mtime))
+        subdirs = [os.path.join(dir_path, name) for name in entry["subdirs"]]
+        return records, subdirs
+
+    def store(self, dir_path, dir_mtime_ns, records, subdirs, mtimes):
+        """
+        记录一次完整列出目录的结果
+        Args:
+            dir_path: 目录路径
+            dir_mtime_ns: 列出前取得的目录修改时间（纳秒）
+            records: 目录中的视频文件记录
+            subdirs: 子目录路径列表
+            mtimes: 与 records 一一对应的文件修改时间（epoch秒）
+        """
+        files = [[r["文件名带扩展名"], r["文件大小 (字节)"], mtime] for r, mtime in zip(records, mtimes)]
+        entry = {
+            "mtime": dir_mtime_ns,
+            "count": len(files) + len(subdirs),
+            "files": files,
+            "subdirs": [os.path.basename(path) for path in subdirs],
+        }
+        with self._lock:
+            self._visited[dir_path] = entry
+            # 同一进程内的下一次扫描（监视模式）直接使用新的列出结果，不必等到 save()
+            self._entries[dir_path] = entry
+
+    def retain_subtree(self, root):
+        """保留某个子树的旧缓存（该子树本次扫描超时未完成时使用，避免下次被迫完整扫描）"""
+        prefix = os.path.join(root, '')
+        with self._lock:
+            for dir_path, entry in self._entries.items():
+                if (dir_path == root or dir_path.startswith(prefix)) and dir_path not in self._visited:
+                    self._visited[dir_path] = entry
+
+    def save(self):
+        """保存本次扫描访问到的目录，未访问到的（已删除的）目录自动淘汰"""
+        try:
+            os.makedirs(os.path.dirname(self.cache_path) or '.', exist_ok=True)
+            tmp_path = f"{self.cache_path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._visited, f, ensure_ascii=False)
+            os.replace(tmp_path, self.cache_path)
+        except Exception as e:
+            logger.warning(f"保存目录缓存失败: {e}")
+
+
+def visit_directory(dir_path, cache=None):
+    """
+    扫描单个目录（不递归），有缓存时优先复用
+    Args:
+        dir_path: 目录路径
+        cache: 可选的 DirectoryCache
+    Returns:
+        (视频文件记录列表, 子目录路径列表)
+    """
+    if cache is None:
+        return scan_directory(dir_path)
+    try:
+        # 先取目录修改时间再列目录，列出期间发生的变化会在下次扫描时被发现
+        dir_mtime_ns = os.stat(dir_path).st_mtime_ns
+    except OSError as e:
+        logger.warning("⚠️ 无法访问目录 '%s': %s", dir_path, e)
+        return [], []
+    cached = cache.lookup(dir_path, dir_mtime_ns)
+    if cached is not None:
+        return cached
+    records, subdirs, mtimes = scan_directory(dir_path, with_mtimes=True)
+    cache.store(dir_path, dir_mtime_ns, records, subdirs, mtimes)
+    return records, subdirs
+
+
+def scan_videos(scan_path, cache=None, on_directory=None):
+    """
+    递归扫描目录下的视频文件，遍历顺序与 os.walk(topdown=True) 相同
+    Args:
+        scan_path: 扫描根目录
+        cache: 可选的 DirectoryCache，修改时间未变化的目录直接复用缓存
+        on_directory: 可选回调，开始扫描每个目录前以目录路径调用
+    Yields:
+        视频文件扫描记录
+    """
+    stack = [scan_path]
+    while stack:
+        dir_path = stack.pop()
+        if on_directory is not None:
+            on_directory(dir_path)
+        records, subdirs = visit_directory(dir_path, cache)
+        yield from records
+        # 逆序入栈，保证按目录列出顺序深度优先遍历
+        stack.extend(reversed(subdirs))
+
+
+class _DaemonExecutor:
+    """
+    工作线程为守护线程的简单线程池。concurrent.futures 的线程池在解释器退出时会等待全部工作线程，
+    卡在网络共享目录操作中的线程会拖住程序退出（以及之后的自动关机）；守护线程不会
+    """
+    def __init__(self, max_workers, thread_name_prefix):
+        self._workers = max(1, max_workers)
+        self._tasks = queue.Queue()
+        # 最近一次有工作线程取得进展（进入新目录或完成任务）的时间
+        self.last_progress = time.monotonic()
+        for i in range(self._workers):
+            threading.Thread(target=self._work, name=f"{thread_name_prefix}_{i}", daemon=True).start()
+
+    def _work(self):
+        while True:
+            task = self._tasks.get()
+            if task is None:
+                return
+            future, fn, args = task
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(fn(*args))
+            except BaseException as e:
+                future.set_exception(e)
+            self.last_progress = time.monotonic()
+
+    def submit(self, fn, *args):
+        future = Future()
+        self._tasks.put((future, fn, args))
+        return future
+
+    def shutdown(self):
+        """通知工作线程在当前任务结束后退出，不等待"""
+        for _ in range(self._workers):
+            self._tasks.put(None)
+
+
+class _ScanJob:
+    """线程池中的一个扫描任务，记录当前正在扫描的目录及开始时间，用于单目录超时判断"""
+    def __init__(self, executor, root, recursive, cache):
+        self.root = root
+        self.current = None
+        self.since = None
+        self.submitted = time.monotonic()
+        self._executor = executor
+        self.future = executor.submit(self._run, recursive, cache)
+
+    def _enter(self, dir_path):
+        self.current = dir_path
+        self.since = time.monotonic()
+        self._executor.last_progress = self.since
+
+    def _run(self, recursive, cache):
+        if recursive:
+            return list(scan_videos(self.root, cache, self._enter))
+        self._enter(self.root)
+        return visit_directory(self.root, cache)
+
+    def wait(self, dir_timeout):
+        """
+        等待任务完成
+        Returns:
+            任务结果；任务中的某个目录扫描超过 dir_timeout 秒，或任务尚未开始而全部工作线程
+            已有 dir_timeout 秒没有进展（都卡在慢目录中）时返回None
+        """
+        while True:
+            try:
+                return self.future.result(timeout=0.2)
+            except FutureTimeoutError:
+                now = time.monotonic()
+                if self.since is not None:
+                    if now - self.since > dir_timeout:
+                        logger.warning("⚠️ 扫描目录 '%s' 超过 %s 秒，跳过子树: %s", self.current, dir_timeout, self.root)
+                        return None
+                elif now - max(self.submitted, self._executor.last_progress) > dir_timeout:
+                    self.future.cancel()
+                    logger.warning("⚠️ 扫描线程全部卡住超过 %s 秒，跳过尚未开始的子树: %s", dir_timeout, self.root)
+                    return None
+
+
+def scan_videos_parallel(scan_path, workers=8, dir_timeout=120, cache=None, skipped=None):
+    """
+    并行扫描视频文件：根目录在当前线程列出，一级子目录的列出和二级子目录的递归扫描
+    分发到线程池；结果按与 scan_videos 完全相同的顺序产出。
+    单个目录扫描超过 dir_timeout 秒时放弃其所在子树，避免一个慢目录拖住整次扫描。
+    被放弃的线程无法强行中断，会在后台继续等待该目录操作返回并占用一个工作线程，
+    之后的目录可用的线程相应减少；全部线程都卡住时尚未开始的子树同样按超时跳过。
+    工作线程为守护线程，卡住的目录操作不会阻止程序退出。
+    Args:
+        scan_path: 扫描根目录
+        workers: 线程数
+        dir_timeout: 单个目录的超时秒数
+        cache: 可选的 DirectoryCache
+        skipped: 可选列表，超时被跳过的子树根目录会追加到其中
+    Yields:
+        视频文件扫描记录
+    """
+    root_records, level1_dirs = visit_directory(scan_path, cache)
+    yield from root_records
+    if not level1_dirs:
+        return
+
+    def skip(root):
+        if skipped is not None:
+            skipped.append(root)
+        if cache is not None:
+            cache.retain_subtree(root)
+
+    executor = _DaemonExecutor(workers, 'scan')
+    jobs = []
+    try:
+        level1_jobs = [_ScanJob(executor, d, False, cache) for d in level1_dirs]
+        jobs.extend(level1_jobs)
+        # 先收齐一级目录的列表并立即提交其下的二级子树，使所有子树尽早并行执行
+        plan = []
+        for job in level1_jobs:
+            result = job.wait(dir_timeout)
+            if result is None:
+                skip(job.root)
+                continue
+            records, subdirs = result
+            subtree_jobs = [_ScanJob(executor, d, True, cache) for d in subdirs]
+            jobs.extend(subtree_jobs)
+            plan.append((records, subtree_jobs))
+        # 按遍历顺序依次产出
+        for records, subtree_jobs in plan:
+            yield from records
+            for job in subtree_jobs:
+                result = job.wait(dir_timeout)
+                if result is None:
+                    skip(job.root)
+                    continue
+                yield from result
+    finally:
+        for job in jobs:
+            job.future.cancel()
+        executor.shutdown()
+
+
+def _legacy_scan(scan_path):
+    """原有的 os.walk + getsize + getmtime 扫描方式，仅用于性能对比"""
+    records = []
+    for root, dirs, files in os.walk(scan_path):
+        for file in files:
+            ext = os.path.splitext(file)[1].lower()
+            if ext not in VIDEO_EXTENSIONS:
+                continue
+            full_path = os.path.join(root, file)
+            records.append(build_file_record(root, file, full_path,
+                                             os.path.getsize(full_path), os.path.getmtime(full_path)))
+    return records
+
+
+def _make_synthetic_tree(root, shows=200, episodes=24, extras=6):
+    """生成用于基准测试的目录树：每部剧一个目录，包含视频和若干非视频文件"""
+    for show in range(shows):
+        show_dir = os.path.join(root, f"Show {show:04d}", "Season 1")
+        os.makedirs(show_dir, exist_ok=True)
+        for ep in range(1, episodes + 1):
+            open(os.path.join(show_dir, f"[Group] Show {show:04d} S01E{ep:02d} [1080p].mkv"), 'wb').close()
+        for extra in range(extras):
+            open(os.path.join(show_dir, f"extra_{extra}.ass"), 'wb').close()
+
+
+def benchmark(root=None, repeat=3):
+    """
+    对比原有扫描方式与 scandir 扫描方式的吞吐量
+    Args:
+        root: 要扫描的目录，为None时在临时目录生成合成目录树
+        repeat: 重复次数，取最快一次
+    """
+    import tempfile
+    tmp = None
+    if root is None:
+        tmp = tempfile.TemporaryDirectory()
+        root = tmp.name
+        _make_synthetic_tree(root)
+    try:
+        results = {}
+        for name, func in (("os.walk + getsize/getmtime", _legacy_scan),
+                           ("os.scandir + DirEntry.stat", lambda p: list(scan_videos(p)))):
+            best = None
+            for _ in range(repeat):
+                start = time.perf_counter()
+                count = len(func(root))
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            results[name] = (count, best)
+            print(f"{name:<28} {count} 个视频文件, {best:.3f}s, {count / best:,.0f} 文件/秒")
+        (legacy_count, legacy_time), (new_count, new_time) = results.values()
+        assert legacy_count == new_count
+        print(f"加速比: {legacy_time / new_time:.2f}x")
+    finally:
+        if tmp is not None:
+            tmp.cleanup()
+
+
+if __name__ == "__main__":
+    # 性能对比: python scanner.py [目录]
+    benchmark(sys.argv[1] if len(sys.argv) > 1 else None)
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+长视频分段处理模块
+
+用 ffmpeg 流复制（不重新编码）把源文件按关键帧切成若干段，每段依次经过各处理阶段
+（画面增强、帧率增强），多段由线程池并行处理，最后用 concat 分离器无损拼接。
+每段完成后通过回调记录进度，中断后重新处理时已完成的段直接跳过。
+"""
+import json
+import logging
+import os
+import re
+import shutil
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+CHUNK_LIST = 'chunks.json'
+
+
+def _run(cmd, env=None, registry=None):
+    """执行命令，返回是否成功；提供 registry 时通过其运行，以便 GPU 繁忙时挂起"""
+    if registry is not None:
+        return registry.run(cmd, env=env).returncode == 0
+    return subprocess.run(cmd, env=env).returncode == 0
+
+
+def _output_ok(path):
+    return os.path.exists(path) and os.path.getsize(path) > 0
+
+
+def split_video(input_path, work_dir, segment_seconds, ffmpeg='ffmpeg'):
+    """
+    按关键帧把视频切分为多段（流复制），已切分过时直接复用
+    Args:
+        input_path: 源文件路径
+        work_dir: 分段工作目录
+        segment_seconds: 每段的目标时长（秒），实际在其后的第一个关键帧处切分
+        ffmpeg: ffmpeg 可执行文件路径
+    Returns:
+        分段文件路径列表，切分失败时返回 None
+    """
+    list_path = os.path.join(work_dir, CHUNK_LIST)
+    if os.path.exists(list_path):
+        with open(list_path, encoding='utf-8') as f:
+            chunks = [os.path.join(work_dir, name) for name in json.load(f)]
+        if all(os.path.exists(chunk) for chunk in chunks):
+            logger.info(f"复用已有分段: {work_dir}，共 {len(chunks)} 段")
+            return chunks
+
+    os.makedirs(work_dir, exist_ok=True)
+    ext = os.path.splitext(input_path)[1]
+    pattern = os.path.join(work_dir, f"chunk_%04d{ext}")
+    cmd = [ffmpeg, '-hide_banner', '-loglevel', 'error', '-y', '-i', input_path,
+           '-map', '0', '-c', 'copy', '-f', 'segment', '-segment_time', str(segment_seconds),
+           '-reset_timestamps', '1', pattern]
+    if not _run(cmd):
+        logger.error(f"分段失败: {input_path}")
+        return None
+    # 只匹配分段器输出的文件名，之前中断的处理留在工作目录中的阶段输出（chunk_0000.s1.mkv 等）不算分段
+    chunk_name = re.compile(r'chunk_\d+' + re.escape(ext))
+    names = sorted(name for name in os.listdir(work_dir) if chunk_name.fullmatch(name))
+    # 分段列表最后写入，存在即表示切分完整
+    tmp_path = f"{list_path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(names, f, ensure_ascii=False)
+    os.replace(tmp_path, list_path)
+    logger.info(f"已切分为 {len(names)} 段: {input_path}")
+    return [os.path.join(work_dir, name) for name in names]
+
+
+def concat_video(chunks, output_path, ffmpeg='ffmpeg'):
+    """
+    用 concat 分离器无损拼接处理后的分段
+    Args:
+        chunks: 按顺序排列的分段文件路径
+        output_path: 输出文件路径
+        ffmpeg: ffmpeg 可执行文件路径
+    Returns:
+        是否成功
+    """
+    list_path = f"{output_path}.concat.txt"
+    with open(list_path, 'w', encoding='utf-8') as f:
+        for chunk in chunks:
+            escaped = os.path.abspath(chunk).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+    cmd = [ffmpeg, '-hide_banner', '-loglevel', 'error', '-y', '-f', 'concat', '-safe', '0',
+           '-i', list_path, '-map', '0', '-c', 'copy', output_path]
+    try:
+        return _run(cmd) and _output_ok(output_path)
+    finally:
+        os.remove(list_path)
+
+
+def process_chunks(chunks, stages, done, on_chunk_done, workers=2, env=None, registry=None):
+    """
+    并行处理各分段，每段依次经过全部处理阶段
+    Args:
+        chunks: 分段文件路径列表
+        stages: 处理阶段列表，每项为 (名称, 函数)，函数接收 (输入路径, 输出路径) 返回命令参数列表
+        done: 已完成的分段序号集合，这些分段直接跳过
+        on_chunk_done: 某段全部阶段完成后以分段序号调用（在工作线程中调用，已加锁）
+        workers: 并行处理的分段数
+        env: 子进程环境变量
+        registry: 运行处理阶段命令的进程登记表（gpu_monitor.ProcessRegistry），None 时直接运行
+    Returns:
+        按顺序排列的处理结果路径列表，有分段失败时返回 None
+    """
+    lock = threading.Lock()
+
+    def output_of(chunk, stage_index):
+        base, ext = os.path.splitext(chunk)
+        return f"{base}.s{stage_index}{ext}"
+
+    def run_chunk(index):
+        chunk = chunks[index]
+        final_path = output_of(chunk, len(stages) - 1)
+        if index in done and _output_ok(final_path):
+            return True
+        current = chunk
+        for stage_index, (name, build_cmd) in enumerate(stages):
+            output_path = output_of(chunk, stage_index)
+            if not _run(build_cmd(current, output_path), env, registry) or not _output_ok(output_path):
+                logger.error(f"第 {index + 1}/{len(chunks)} 段{name}失败: {chunk}")
+                return False
+            if current != chunk:
+                # 中间结果只供下一阶段使用
+                os.remove(current)
+            current = output_path
+        with lock:
+            on_chunk_done(index)
+        logger.info(f"第 {index + 1}/{len(chunks)} 段处理完成")
+        return True
+
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='segment') as executor:
+        results = list(executor.map(run_chunk, range(len(chunks))))
+    if not all(results):
+        return None
+    return [output_of(chunk, len(stages) - 1) for chunk in chunks]
+
+
+def remove_work_dir(work_dir):
+    """删除分段工作目录"""
+    shutil.rmtree(work_dir, ignore_errors=True)
@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+"""
+处理吞吐量历史与耗时预测
+
+保存在 data 目录下的 SQLite 数据库中，包含两张表：
+- jobs：每个成功处理的文件一条（文件大小、起始处理步骤、耗时）；
+- stages：每个完成的处理阶段一条（源文件分辨率、时长、帧数、大小、处理器、着色器/模型、
+  编码器和预设、帧率倍数、耗时）。
+
+预测某个阶段的耗时时，取相同阶段、相同配置（含帧率倍数）最近若干条记录的合计工作量除以合计耗时作为速度：
+有视频信息时工作量为 帧数 × 阶段输入像素数，否则为文件大小；相同配置没有记录时使用该阶段的全部记录。
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# 阶段名称
+STAGE_RESOLUTION = 'resolution'
+STAGE_FRAME = 'frame'
+
+# 数据库路径 -> ThroughputHistory，同一进程中共用一个实例
+_histories = {}
+_histories_lock = threading.Lock()
+
+
+def open_history(db_path):
+    """
+    获取数据库对应的吞吐量历史（同一路径返回同一实例）
+    Args:
+        db_path: 数据库文件路径
+    Returns:
+        ThroughputHistory
+    """
+    key = os.path.normcase(os.path.abspath(db_path))
+    with _histories_lock:
+        if key not in _histories:
+            _histories[key] = ThroughputHistory(db_path)
+        return _histories[key]
+
+
+class ThroughputHistory:
+    """文件和处理阶段的耗时历史"""
+    def __init__(self, db_path, window=50):
+        """
+        初始化吞吐量历史
+        Args:
+            db_path: 数据库文件路径
+            window: 估算时使用的最近记录数
+        """
+        self.db_path = db_path
+        self.window = window
+        self._lock = threading.RLock()
+        self._conn = None
+        self._rates = {}  # 查询条件 -> 速度，记录新数据时清空
+
+    def _connect(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "path TEXT, size INTEGER NOT NULL, step INTEGER NOT NULL, "
+                "seconds REAL NOT NULL, finished REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_step ON jobs(step, id)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS stages ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "path TEXT, stage TEXT NOT NULL, "
+                "processor TEXT, model TEXT, encoder TEXT, preset TEXT, "
+                "width INTEGER, height INTEGER, duration REAL, frames INTEGER, "
+                "pixels INTEGER, size INTEGER NOT NULL, seconds REAL NOT NULL, finished REAL NOT NULL, "
+                "multiplier INTEGER)"
+            )
+            # 早期的数据库没有帧率倍数列
+            if 'multiplier' not in {row[1] for row in conn.execute("PRAGMA table_info(stages)")}:
+                conn.execute("ALTER TABLE stages ADD COLUMN multiplier INTEGER")
+            conn.execute("DROP INDEX IF EXISTS idx_stages_profile")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_stages_profile_multiplier "
+                         "ON stages(stage, processor, model, encoder, preset, multiplier, id)")
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _insert(self, sql, values):
+        try:
+            with self._lock:
+                conn = self._connect()
+                conn.execute(sql, values)
+                conn.commit()
+                self._rates.clear()
+        except sqlite3.Error as e:
+            logger.warning(f"记录处理耗时失败: {e}")
+
+    def _rate(self, sql, params):
+        """执行返回 (合计工作量, 合计秒数) 的查询，返回速度，没有记录时返回 None"""
+        key = (sql, params)
+        with self._lock:
+            if key not in self._rates:
+                try:
+                    row = self._connect().execute(sql, params).fetchone()
+                except sqlite3.Error as e:
+                    logger.warning(f"读取处理耗时历史失败: {e}")
+                    return None
+                self._rates[key] = row[0] / row[1] if row and row[0] and row[1] else None
+            return self._rates[key]
+
+    def record(self, path, size, step, seconds):
+        """
+        记录一个成功处理的文件
+        Args:
+            path: 源文件路径
+            size: 源文件大小（字节）
+            step: 开始处理时的处理步骤（1 表示画面增强和帧率增强，2 表示只做帧率增强）
+            seconds: 处理耗时（秒）
+        """
+        if not size or seconds <= 0:
+            return
+        self._insert("INSERT INTO jobs (path, size, step, seconds, finished) VALUES (?, ?, ?, ?, ?)",
+                     (path, size, step, seconds, time.time()))
+
+    def rate(self, step):
+        """
+        相同起始步骤最近 window 个文件的吞吐量
+        Returns:
+            字节/秒，没有历史时返回 None
+        """
+        return self._rate("SELECT SUM(size), SUM(seconds) FROM "
+                          "(SELECT size, seconds FROM jobs WHERE step = ? ORDER BY id DESC LIMIT ?)",
+                          (step, self.window))
+
+    def estimate(self, record):
+        """
+        按文件级历史估算一个记录的处理秒数
+        Args:
+            record: 文件记录
+        Returns:
+            预计秒数，没有历史时返回 None
+        """
+        rate = self.rate(record.get("处理步骤"))
+        size = record.get("文件大小 (字节)") or 0
+        return size / rate if rate else None
+
+    def record_stage(self, path, stage, profile, size, seconds, info=None, pixels=None):
+        """
+        记录一个完成的处理阶段
+        Args:
+            path: 源文件路径
+            stage: 阶段名称
+            profile: (处理器, 着色器/模型, 编码器, 预设, 帧率倍数)，画面增强的帧率倍数为 None
+            size: 源文件大小（字节）
+            seconds: 阶段耗时（秒）
+            info: 源文件的 probe.VideoInfo，未知时为 None
+            pixels: 阶段输入每帧的像素数，未知时为 None
+        """
+        if not size or seconds <= 0:
+            return
+        width, height, duration, frames = (info.width, info.height, info.duration, info.frames) if info else (None,) * 4
+        self._insert("INSERT INTO stages (path, stage, processor, model, encoder, preset, multiplier, width, height, "
+                     "duration, frames, pixels, size, seconds, finished) "
+                     "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                     (path, stage, *profile, width, height, duration, frames or None, pixels or None,
+                      size, seconds, time.time()))
+
+    def estimate_stage(self, stage, profile, size, work=None):
+        """
+        估算一个处理阶段的秒数
+        Args:
+            stage: 阶段名称
+            profile: (处理器, 着色器/模型, 编码器, 预设, 帧率倍数)
+            size: 源文件大小（字节）
+            work: 帧数 × 阶段输入像素数，未知时为 None
+        Returns:
+            预计秒数，没有可用历史时返回 None
+        """
+        # 优先按帧数 × 像素数估算，没有带视频信息的历史时按文件大小估算
+        measures = [("frames * pixels", work, " AND frames IS NOT NULL AND pixels IS NOT NULL")] if work else []
+        measures.append(("size", size, ""))
+        for column, amount, extra in measures:
+            if not amount:
+                continue
+            for where, params in (("stage = ? AND processor = ? AND model = ? AND encoder = ? AND preset = ? "
+                                   "AND multiplier IS ?",
+                                   (stage, *profile)),
+                                  ("stage = ?", (stage,))):
+                rate = self._rate(f"SELECT SUM(work), SUM(seconds) FROM (SELECT {column} AS work, seconds "
+                                  f"FROM stages WHERE {where}{extra} ORDER BY id DESC LIMIT ?)",
+                                  (*params, self.window))
+                if rate:
+                    return amount / rate
+        return None
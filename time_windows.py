@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""
+每日处理时间窗口
+
+配置格式为以分号分隔的若干窗口，每个窗口由星期范围和时段组成，例如：
+    1-5 01:00-08:00; 6-7 00:00-24:00
+表示工作日凌晨 1 点到 8 点、周末全天。结束时间不晚于开始时间的时段跨越午夜，
+属于开始那一天（例如 "5 22:00-06:00" 为周五晚上到周六早上）。
+相邻或重叠的窗口合并计算，周日 00:00-24:00 与周一 00:00-08:00 视为一个连续窗口。
+"""
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+# 计算窗口结束时间时向后查看的天数，超过该范围仍未结束的窗口视为不限时
+HORIZON_DAYS = 8
+
+Window = namedtuple('Window', ['days', 'start', 'end'])  # 星期集合（1-7）、开始和结束分钟数
+
+
+def _parse_days(text):
+    if '-' in text:
+        start, end = map(int, text.split('-', 1))
+    else:
+        start = end = int(text)
+    if not (1 <= start <= 7 and 1 <= end <= 7):
+        raise ValueError(f"星期范围须在 1-7 之间: {text}")
+    if start <= end:
+        return frozenset(range(start, end + 1))
+    # 例如 6-1：周六、周日、周一
+    return frozenset(list(range(start, 8)) + list(range(1, end + 1)))
+
+
+def _parse_minutes(text):
+    hour, minute = map(int, text.split(':'))
+    if not (0 <= hour <= 24 and 0 <= minute < 60) or (hour == 24 and minute):
+        raise ValueError(f"无效的时间: {text}")
+    return hour * 60 + minute
+
+
+def parse_windows(text):
+    """
+    解析时间窗口配置
+    Args:
+        text: 配置字符串，如 "1-5 01:00-08:00; 6-7 00:00-24:00"
+    Returns:
+        Window 列表
+    """
+    windows = []
+    for item in text.split(';'):
+        item = item.strip()
+        if not item:
+            continue
+        try:
+            days, hours = item.split()
+            start, end = hours.split('-')
+            windows.append(Window(_parse_days(days), _parse_minutes(start), _parse_minutes(end)))
+        except ValueError as e:
+            raise ValueError(f"无效的时间窗口 '{item}': {e}") from None
+    return windows
+
+
+class TimeWindows:
+    """一组每周重复的处理时间窗口"""
+    def __init__(self, windows):
+        """
+        初始化时间窗口
+        Args:
+            windows: Window 列表
+        """
+        self.windows = list(windows)
+
+    @classmethod
+    def from_config(cls, time_windows='', allowed_days='1-7'):
+        """
+        按配置创建时间窗口：未配置 TimeWindows 时使用 AllowedDays 的全天窗口
+        Args:
+            time_windows: TimeWindows 配置
+            allowed_days: AllowedDays 配置
+        Returns:
+            TimeWindows 实例
+        """
+        if time_windows and time_windows.strip():
+            return cls(parse_windows(time_windows))
+        return cls([Window(_parse_days(allowed_days.strip()), 0, 24 * 60)])
+
+    def _intervals(self, now):
+        """now 前一天到 HORIZON_DAYS 天后的具体时段，已按开始时间排序并合并"""
+        midnight = datetime(now.year, now.month, now.day)
+        intervals = []
+        for offset in range(-1, HORIZON_DAYS):
+            day = midnight + timedelta(days=offset)
+            for window in self.windows:
+                if day.isoweekday() not in window.days:
+                    continue
+                end = window.end if window.end > window.start else window.end + 24 * 60
+                intervals.append((day + timedelta(minutes=window.start), day + timedelta(minutes=end)))
+        merged = []
+        for start, end in sorted(intervals):
+            if merged and start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        return merged
+
+    def is_open(self, now=None):
+        """当前是否在某个窗口内"""
+        return self.remaining_seconds(now) != 0
+
+    def remaining_seconds(self, now=None):
+        """
+        当前窗口的剩余秒数
+        Args:
+            now: 当前时间，省略时取当前本地时间
+        Returns:
+            不在窗口内时返回 0，窗口持续到 HORIZON_DAYS 天以后（例如每天全天）时返回 None
+        """
+        now = now or datetime.now()
+        horizon = datetime(now.year, now.month, now.day) + timedelta(days=HORIZON_DAYS)
+        for start, end in self._intervals(now):
+            if start <= now < end:
+                return None if end >= horizon else (end - now).total_seconds()
+        return 0
+
+    def next_open(self, now=None):
+        """下一个窗口的开始时间，HORIZON_DAYS 天内没有窗口时返回 None"""
+        now = now or datetime.now()
+        for start, end in self._intervals(now):
+            if end > now:
+                return max(start, now)
+        return None
+
+    def next_fit(self, now, seconds, weeks=8):
+        """
+        最早的、之后的窗口剩余时间足以完成 seconds 秒工作的开始时间
+        Args:
+            now: 最早开始时间
+            seconds: 工作所需秒数
+            weeks: 最多向后查找的周数
+        Returns:
+            开始时间，找不到足够长的窗口时返回 None
+        """
+        limit = now + timedelta(weeks=weeks)
+        while now < limit:
+            horizon = datetime(now.year, now.month, now.day) + timedelta(days=HORIZON_DAYS)
+            next_now = horizon - timedelta(days=1)
+            for start, end in self._intervals(now):
+                if end <= now:
+                    continue
+                start = max(start, now)
+                if (end - start).total_seconds() >= seconds:
+                    return start
+                if end >= horizon:
+                    # 窗口延续到查看范围之外：从 now 起一直开放视为不限时，否则从窗口开始处重新计算
+                    if start == now:
+                        return start
+                    next_now = start
+                    break
+            now = next_now
+        return None
+
+    def __repr__(self):
+        return f"TimeWindows({self.windows!r})"
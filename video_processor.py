@@ -1,4 +1,5 @@
 import os
+import hashlib
 import json
 import subprocess
 import logging
@@ -6,8 +7,14 @@ import time
 import shutil
 import configparser
 import sys
+from collections import namedtuple
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-from data_manager import DataManager
+from data_manager import create_data_manager
+import checkpoint
+import segment
+import throughput
+from gpu_monitor import processes
+from probe import VideoProbe
 
 def get_base_dir():
     """获取基础目录，兼容PyInstaller打包后的环境"""
@@ -24,6 +31,10 @@ config.read('config.ini')
 # 读取处理开关配置
 enable_resolution_enhancement = config.getboolean('Processing', 'EnableResolutionEnhancement', fallback=True)
 enable_frame_enhancement = config.getboolean('Processing', 'EnableFrameEnhancement', fallback=True)
+# 融合模式：两个阶段都启用时，画面增强只输出快速无损的中间文件，最终文件只在帧率增强时编码一次
+fused_mode = config.getboolean('Processing', 'FusedMode', fallback=False)
+intermediate_encoder = config.get('Processing', 'IntermediateEncoder', fallback='hevc_nvenc')
+intermediate_options = config.get('Processing', 'IntermediateOptions', fallback='preset=p1 tune=lossless').split()
 
 # 读取基础路径
 DATA_DIR = os.path.join(BASE_DIR, 'data')
@@ -50,9 +61,31 @@ threads = config.get('FrameEnhancement', 'Threads', fallback='100')
 tmp_dir = config.get('PATHS', 'TmpDir')
 tmp_dir = os.path.join(BASE_DIR, tmp_dir)
 os.makedirs(tmp_dir, exist_ok=True)
+# 各文件已完成阶段的检查点清单
+checkpoints = checkpoint.CheckpointStore(os.path.join(tmp_dir, 'checkpoints'))
 scan_path = config.get('PATHS', 'ScanPath', fallback=None)
 # 读取video2x路径配置
 video2x_path = config.get('PATHS', 'Video2xPath')
+# 读取分段处理配置：大于 MinSizeGB 的文件按关键帧切分后并行处理，再无损拼接
+segment_enabled = config.getboolean('Segment', 'Enable', fallback=False)
+segment_min_bytes = int(config.getfloat('Segment', 'MinSizeGB', fallback=4) * 2**30)
+segment_seconds = config.getint('Segment', 'SegmentSeconds', fallback=600)
+segment_workers = config.getint('Segment', 'Workers', fallback=2)
+ffmpeg_path = config.get('Segment', 'FFmpegPath', fallback='ffmpeg')
+# 记录中保存已完成分段序号的字段
+SEGMENT_KEY = "分段进度"
+# 各阶段耗时历史（与 app 共用同一实例）和源文件视频信息探测
+history = throughput.open_history(os.path.join(DATA_DIR, 'throughput.db'))
+prober = VideoProbe(config.get('Probe', 'FFprobePath', fallback='ffprobe'), os.path.join(DATA_DIR, 'probe_cache.json'))
+# 源文件已达到目标时跳过或减少处理：分辨率不低于目标分辨率时跳过画面增强；
+# 帧率增强倍数降低到输出帧率不超过 MaxOutputFps（0 为不限制），降到 1 时跳过帧率增强
+skip_reached_resolution = config.getboolean('Probe', 'SkipReachedResolution', fallback=True)
+max_output_fps = config.getfloat('Probe', 'MaxOutputFps', fallback=0)
+# 记录中保存跳过处理原因的字段
+SKIPPED_KEY = "跳过处理"
+
+# 单个文件实际执行的处理阶段：是否画面增强、是否帧率增强、帧率倍数
+WorkPlan = namedtuple('WorkPlan', ['resolution', 'frame', 'multiplier'])
 
 
 
@@ -67,11 +100,312 @@ sanitized_name = sanitize_path_for_filename(scan_path)
 json_filename = f"scan_result_{sanitized_name}.json"
 output_json_path = os.path.join(DATA_DIR, json_filename)
 # 初始化数据管理器
-data_manager = DataManager(output_json_path)
+data_backend = config.get('Data', 'Backend', fallback='json')
+data_manager_options = {}
+if data_backend.lower() == 'journal':
+    data_manager_options['compact_threshold'] = config.getint('Data', 'JournalCompactThreshold', fallback=1000)
+elif data_backend.lower() == 'json':
+    data_manager_options['cache'] = config.getboolean('Data', 'Cache', fallback=False)
+data_manager = create_data_manager(output_json_path, data_backend, **data_manager_options)
+
+
+def plan_work(file, multiplier=None, cached_only=False):
+    """
+    按源文件的视频信息决定该文件实际执行的处理阶段
+    Args:
+        file: 文件记录
+        multiplier: 配置的帧率倍数，省略时使用 FrameMultiplier
+        cached_only: 只使用已缓存的视频信息，不运行 ffprobe
+    Returns:
+        WorkPlan；无法读取视频信息时按配置执行全部启用的阶段
+    """
+    resolution, frame = enable_resolution_enhancement, enable_frame_enhancement
+    multiplier = int(frame_multiplier if multiplier is None else multiplier)
+    info = None
+    if resolution or frame:
+        info = prober.cached(file) if cached_only else prober.info(file)
+    if info:
+        if (resolution and skip_reached_resolution and info.width and info.height
+                and info.width >= int(res_width) and info.height >= int(res_height)):
+            resolution = False
+        if frame and max_output_fps > 0 and info.fps:
+            # 误差容限避免 30000/1001 这类帧率因浮点误差少算一倍
+            multiplier = min(multiplier, int(max_output_fps / info.fps + 1e-6))
+            frame = multiplier > 1
+    return WorkPlan(resolution, frame, multiplier)
+
+
+def output_filename(input_path, plan):
+    """成品文件名：原文件名后依次加上目标分辨率、帧率倍数和 Viden2x_HQ"""
+    base_name, ext = os.path.splitext(os.path.basename(input_path))
+    tags = []
+    if plan.resolution:
+        tags.append(f"{res_width}x{res_height}")
+    if plan.frame:
+        tags.append(f"fpsx{plan.multiplier}")
+    return f"{base_name} {' '.join(tags + ['Viden2x_HQ'])}{ext}"
+
+
+def staging_path(file, tmp_dir):
+    """
+    文件下一步处理前需要复制到的临时路径，供流水线预取
+    Args:
+        file: 待处理记录
+        tmp_dir: 临时目录
+    Returns:
+        临时路径，下一步无需复制源文件时返回 None
+    """
+    if file.get("处理步骤") != 1:
+        return None
+    plan = plan_work(file)
+    if use_segments(file, plan):
+        return None
+    source = file["文件完整路径"]
+    filename = os.path.basename(source)
+    if plan.resolution:
+        path, stage = os.path.join(BASE_DIR, 'tmp', 'raw', filename), checkpoint.STAGE_RAW
+    elif plan.frame:
+        path, stage = os.path.join(tmp_dir, filename), checkpoint.STAGE_INTERMEDIATE
+    else:
+        return None
+    # 已有完整副本时无需预取
+    return None if checkpoints.verify(source, stage, path) else path
+
+
+def _staging_stage(path):
+    """预取到该临时路径的副本对应的检查点阶段"""
+    raw_dir = os.path.join(BASE_DIR, 'tmp', 'raw')
+    return checkpoint.STAGE_RAW if os.path.dirname(os.path.abspath(path)) == os.path.abspath(raw_dir) else checkpoint.STAGE_INTERMEDIATE
+
+
+def record_prefetch(source, path):
+    """预取完成后记录检查点，供 IOPipeline 的 on_fetched 使用"""
+    checkpoints.record(source, _staging_stage(path), path)
+
+
+def discard_prefetch(source, path):
+    """未使用的预取文件被删除后丢弃其检查点，供 IOPipeline 的 on_unused 使用"""
+    checkpoints.discard(source, _staging_stage(path))
+
+
+def copy_to_tmp(input_path, tmp_path, logger, pipeline=None, stage=checkpoint.STAGE_RAW):
+    """将源文件复制到临时目录并记录检查点，启用流水线时优先使用后台预取的副本"""
+    if pipeline is not None:
+        # 先等待已安排的预取完成（完成时已记录检查点），下面按检查点判断是否可直接使用
+        pipeline.wait(tmp_path)
+    if checkpoints.verify(input_path, stage, tmp_path):
+        logger.info(f"文件已存在于临时目录: {tmp_path}")
+        return
+    if pipeline is not None:
+        pipeline.fetch(input_path, tmp_path)
+    else:
+        shutil.copy2(input_path, tmp_path)
+    checkpoints.record(input_path, stage, tmp_path)
+    logger.info(f"文件已复制到临时目录: {tmp_path}")
+
+
+def recover_checkpoints(active_sources=()):
+    """
+    启动时的恢复过程：删除崩溃遗留的残缺临时文件，保留校验通过的阶段结果
+    Args:
+        active_sources: 其他存活进程正在处理的源文件路径，其临时文件（源文件副本、
+            处理中或挂起中的输出）即使不在清单中也不删除
+    Returns:
+        {源文件路径: 校验通过的阶段名称集合}
+    """
+    prefixes = []
+    for source in active_sources:
+        filename = os.path.basename(source)
+        # 源文件副本及其 .part 文件与源文件同名，处理结果以 "<原文件名> " 开头
+        prefixes += [filename, f"{os.path.splitext(filename)[0]} "]
+    prefixes = tuple(prefixes)
+
+    def keep(path):
+        return bool(prefixes) and os.path.basename(path).startswith(prefixes)
+    return checkpoints.recover([tmp_dir, os.path.join(BASE_DIR, 'tmp', 'raw')], keep=keep)
+
+
+def move_out(output_path, target_path, on_done, logger, pipeline=None):
+    """将处理结果移动到原目录后调用 on_done，启用流水线时在后台移动"""
+    if pipeline is not None:
+        pipeline.move_out(output_path, target_path, on_done)
+        return
+    os.makedirs(os.path.dirname(target_path), exist_ok=True)
+    shutil.move(output_path, target_path)
+    logger.info(f"文件已移动到原目录: {target_path}")
+    on_done()
+
+
+def is_fused(plan=None):
+    """画面增强是否只输出无损中间文件（融合模式且两个阶段都执行，省略 plan 时按配置判断）"""
+    if plan is None:
+        return fused_mode and enable_resolution_enhancement and enable_frame_enhancement
+    return fused_mode and plan.resolution and plan.frame
+
+
+def encoder_args(encoder, preset, crf, plan=None):
+    """
+    画面增强的编码参数
+    Args:
+        encoder: 编码器
+        preset: 编码预设
+        crf: 编码质量
+        plan: 该文件的 WorkPlan，省略时按配置判断是否融合
+    Returns:
+        video2x 命令行中的编码参数列表
+    """
+    if is_fused(plan):
+        # 中间文件只供帧率增强解码，使用快速无损编码，避免一次有损编码和画质损失
+        args = ['-c', intermediate_encoder]
+        for option in intermediate_options:
+            args += ['-e', option]
+        return args
+    return ['-c', encoder, '-e', f'preset={preset}', '-e', f'qp={crf}']
+
+
+# 命令以参数列表形式直接启动 video2x（不经过 shell），挂起/恢复作用于 video2x 进程本身
+def resolution_command(input_path, output_path, video2x_path, res_width, res_height, res_processor, res_shader, res_encoder, res_preset, res_crf, plan=None):
+    """画面增强的 video2x 命令"""
+    return [video2x_path, '-i', input_path, '-o', output_path, '-w', str(res_width), '-h', str(res_height),
+            '-p', res_processor, '--libplacebo-shader', res_shader] + encoder_args(res_encoder, res_preset, res_crf, plan)
+
+
+def frame_command(input_path, output_path, video2x_path, frame_multiplier, frame_processor, rife_model, frame_encoder, frame_preset, frame_crf, threads):
+    """帧率增强的 video2x 命令"""
+    return [video2x_path, 'upscale', '-i', input_path, '-o', output_path, '-m', str(frame_multiplier),
+            '-p', frame_processor, '--rife-model', rife_model, '-c', frame_encoder,
+            '-e', f'preset={frame_preset}', '-e', f'qp={frame_crf}', '-t', str(threads)]
+
+
+def stage_profiles(plan=None):
+    """
+    执行的处理阶段及其配置
+    Args:
+        plan: 该文件的 WorkPlan，省略时为配置中启用的阶段
+    Returns:
+        {阶段名称: (处理器, 着色器/模型, 编码器, 预设, 帧率倍数)}，按处理顺序排列，画面增强的帧率倍数为 None
+    """
+    resolution, frame = (plan.resolution, plan.frame) if plan else (enable_resolution_enhancement, enable_frame_enhancement)
+    multiplier = plan.multiplier if plan else int(frame_multiplier)
+    profiles = {}
+    if resolution:
+        if is_fused(plan):
+            profiles[throughput.STAGE_RESOLUTION] = (res_processor, res_shader, intermediate_encoder, ' '.join(intermediate_options), None)
+        else:
+            profiles[throughput.STAGE_RESOLUTION] = (res_processor, res_shader, res_encoder, f'preset={res_preset} qp={res_crf}', None)
+    if frame:
+        # 实际使用的帧率倍数（可能按源帧率降低）决定输出帧数，不同倍数的速度分开统计
+        profiles[throughput.STAGE_FRAME] = (frame_processor, rife_model, frame_encoder, f'preset={frame_preset} qp={frame_crf}', multiplier)
+    return profiles
+
+
+def stage_pixels(stage, info, plan=None):
+    """阶段输入每帧的像素数：帧率增强在画面增强之后时为目标分辨率，否则为源文件分辨率"""
+    resolution = plan.resolution if plan else enable_resolution_enhancement
+    if stage == throughput.STAGE_FRAME and resolution:
+        return int(res_width) * int(res_height)
+    return info.width * info.height if info else None
 
 
-def process_single_file(file, tmp_dir, video2x_path, res_width, res_height, res_processor, res_shader, res_encoder, res_preset, res_crf, logger):
+def record_stage(file, stage, seconds, plan=None):
+    """记录一个完成的处理阶段的耗时"""
+    info = prober.info(file)
+    history.record_stage(file.get("文件完整路径"), stage, stage_profiles(plan)[stage], file.get("文件大小 (字节)"),
+                         seconds, info, stage_pixels(stage, info, plan))
+
+
+def estimate_file(file, cached_only=False):
+    """
+    估算一个记录剩余处理阶段的耗时
+    Args:
+        file: 文件记录
+        cached_only: 只使用已缓存的视频信息，不运行 ffprobe（未缓存时按配置的全部阶段和文件大小估算）
+    Returns:
+        预计秒数（源文件已达到目标、无需处理时为 0）；阶段历史不足时按文件级历史估算，仍无法估算时返回 None
+    """
+    plan = plan_work(file, cached_only=cached_only)
+    profiles = stage_profiles(plan)
+    if file.get("处理步骤") == 2:
+        profiles.pop(throughput.STAGE_RESOLUTION, None)
+    info = prober.cached(file) if cached_only else prober.info(file)
+    total = 0
+    for stage, profile in profiles.items():
+        pixels = stage_pixels(stage, info, plan)
+        work = info.frames * pixels if info and info.frames and pixels else None
+        seconds = history.estimate_stage(stage, profile, file.get("文件大小 (字节)"), work)
+        if seconds is None:
+            return history.estimate(file)
+        total += seconds
+    return total
+
+
+def gpu_env():
+    """video2x 子进程的环境变量"""
+    env = os.environ.copy()
+    env['CUDA_VISIBLE_DEVICES'] = '0'
+    env['NVIDIA_VISIBLE_DEVICES'] = 'all'
+    return env
+
+
+def use_segments(file, plan=None):
+    """该文件是否按分段模式处理"""
+    if not (segment_enabled and file.get("处理步骤") == 1 and (file.get("文件大小 (字节)") or 0) >= segment_min_bytes):
+        return False
+    plan = plan or plan_work(file)
+    return plan.resolution or plan.frame
+
+
+def process_segmented(file, tmp_dir, stages, final_filename, final_step, logger, pipeline=None):
+    """
+    分段处理：切分源文件，各分段并行经过全部处理阶段，拼接后移回原目录
+    Args:
+        file: 待处理记录，已完成的分段序号保存在"分段进度"字段
+        tmp_dir: 临时目录
+        stages: 处理阶段列表，每项为 (名称, 函数)，函数接收 (输入路径, 输出路径) 返回命令
+        final_filename: 成品文件名
+        final_step: 完成后的处理步骤
+        logger: 日志记录器
+        pipeline: 可选的 IOPipeline，用于在后台移出成品
+    """
+    input_path = file["文件完整路径"]
+    stem = os.path.splitext(os.path.basename(input_path))[0]
+    # 按完整路径区分工作目录：同名不同扩展名或不同目录下的同名文件不会共用分段和分段进度
+    work_dir = os.path.join(tmp_dir, 'segments', f"{stem}_{hashlib.sha1(input_path.encode('utf-8')).hexdigest()[:12]}")
+    logger.info(f"开始分段处理: {input_path}")
+    start_time = time.time()
+    chunks = segment.split_video(input_path, work_dir, segment_seconds, ffmpeg_path)
+    if not chunks:
+        logger.error(f"分段失败，跳过: {input_path}")
+        return
+
+    done = set(file.get(SEGMENT_KEY) or [])
+    def chunk_done(index):
+        done.add(index)
+        file[SEGMENT_KEY] = sorted(done)
+        data_manager.update_record({"文件完整路径": input_path}, {SEGMENT_KEY: file[SEGMENT_KEY]})
+
+    outputs = segment.process_chunks(chunks, stages, done, chunk_done, segment_workers, gpu_env(), processes)
+    if outputs is None:
+        logger.error(f"部分分段处理失败，已完成 {len(done)}/{len(chunks)} 段，下次继续: {input_path}")
+        return
+    output_path = os.path.join(tmp_dir, final_filename)
+    if not segment.concat_video(outputs, output_path, ffmpeg_path):
+        logger.error(f"分段拼接失败: {output_path}")
+        return
+    logger.info(f"分段处理完成:{output_path},耗时: {time.time() - start_time:.2f}秒")
+
+    def finish():
+        file['处理步骤'] = final_step
+        # 分段进度只对本次的分段有效，完成后清空
+        file[SEGMENT_KEY] = []
+        data_manager.update_record({"文件完整路径": input_path}, file)
+        segment.remove_work_dir(work_dir)
+    move_out(output_path, os.path.join(os.path.dirname(input_path), final_filename), finish, logger, pipeline)
+
+
+def process_single_file(file, tmp_dir, video2x_path, res_width, res_height, res_processor, res_shader, res_encoder, res_preset, res_crf, logger, pipeline=None, plan=None):
     """进行画面增强处理"""
+    plan = plan or plan_work(file)
     input_path = file["文件完整路径"]
     # 验证输入路径是否存在
     if not os.path.exists(input_path):
@@ -88,12 +422,8 @@ def process_single_file(file, tmp_dir, video2x_path, res_width, res_height, res_
     # 将输入文件复制到tmp/raw目录
     raw_input_path = os.path.join(raw_tmp_dir, filename)
     try:
-        # 先判断目录中是否已经有该文件
-        if os.path.exists(raw_input_path):
-            logger.info(f"文件已存在于临时目录: {raw_input_path}")
-        else:
-            shutil.copy2(input_path, raw_input_path)
-            logger.info(f"文件已复制到临时目录: {raw_input_path}")
+        # 目录中已经有该文件时直接使用
+        copy_to_tmp(input_path, raw_input_path, logger, pipeline)
     except Exception as e:
         logger.error(f"复制文件到临时目录失败: {e}")
         return
@@ -103,36 +433,25 @@ def process_single_file(file, tmp_dir, video2x_path, res_width, res_height, res_
     logger.info(f"开始增强画面: {raw_input_path}")
     try:
         start_time = time.time()
-        # 使用shell=True并正确引用路径以避免空格问题
-        cmd = [
-            video2x_path,
-            '-i', input_path,
-            '-o', output_path,
-            '-w', str(res_width),
-            '-h', str(res_height),
-            '-p', res_processor,
-            '--libplacebo-shader', res_shader,
-            '-c', res_encoder,
-            '-e', f'preset={res_preset}',
-            '-e', f'qp={res_crf}',
-        ]
-        
-        # 使用完整的命令字符串并确保路径正确引用
-        cmd_str = f'"{video2x_path}" -i "{raw_input_path}" -o "{output_path}" -w {res_width} -h {res_height} -p {res_processor} --libplacebo-shader {res_shader} -c {res_encoder} -e preset={res_preset} -e qp={res_crf}'
-        # 优化subprocess调用参数以提高性能，同时保持输出可见
+        cmd = resolution_command(raw_input_path, output_path, video2x_path, res_width, res_height, res_processor, res_shader, res_encoder, res_preset, res_crf, plan)
         # 设置环境变量以匹配IDE环境
-        env = os.environ.copy()
-        env['CUDA_VISIBLE_DEVICES'] = '0'
-        env['NVIDIA_VISIBLE_DEVICES'] = 'all'
-        # 为了在控制台显示输出，我们不捕获输出，但需要处理可能的异常
+        env = gpu_env()
+        # 为了在控制台显示输出，我们不捕获输出，但需要处理可能的异常；
+        # 进程登记到 gpu_monitor.processes，GPU 被其他程序占满时可被挂起
         try:
-            result = subprocess.run(cmd_str, shell=True, capture_output=False, text=True, encoding='utf-8', errors='ignore', env=env)
+            result = processes.run(cmd, env=env)
         except Exception as e:
             logger.error(f"执行命令时发生异常: {e}")
             raise
         end_time = time.time()
         duration = end_time - start_time
+        if result.returncode != 0 or not os.path.exists(output_path) or os.path.getsize(output_path) == 0:
+            # 输出不完整，保留已校验的源文件副本，下次直接重试
+            logger.error(f"画面增强失败: 退出代码 {result.returncode}, 输出: {output_path}")
+            return
+        checkpoints.record(input_path, checkpoint.STAGE_INTERMEDIATE, output_path)
         logger.info(f"画面增强完成:{output_path},耗时: {duration:.2f}秒")
+        record_stage(file, throughput.STAGE_RESOLUTION, duration, plan)
         file['处理步骤'] = 2  # 标记为已增强
         #对数据进行更新
         data_manager.update_record({"文件完整路径": file.get("文件完整路径")},file)
@@ -144,20 +463,21 @@ def process_single_file(file, tmp_dir, video2x_path, res_width, res_height, res_
                 logger.info(f"已清理临时文件: {raw_input_path}")
             except Exception as e:
                 logger.error(f"清理临时文件失败: {e}")
-        if not enable_frame_enhancement:
+        checkpoints.discard(input_path, checkpoint.STAGE_RAW)
+        if not plan.frame:
             # 构建新文件名
-            base_name, ext = os.path.splitext(input_path)
-            new_filename = f"{base_name} {res_width}x{res_height} Viden2x_HQ{ext}"
+            new_filename = output_filename(input_path, plan)
             # 使用字符串截取方式获取原始目录路径
             original_dir = os.path.dirname(input_path)
             target_path = os.path.join(original_dir, new_filename)
             # 将输入文件移动到原目录
+            def finish():
+                file['处理步骤'] = 2.5  # 标记为只进行了增强
+                data_manager.update_record({"文件完整路径": file.get("文件完整路径")},file)
+                checkpoints.discard(input_path)
             try:
                 if os.path.exists(output_path):
-                    shutil.move(output_path, target_path)
-                    logger.info(f"文件已移动到原目录: {target_path}")
-                    file['处理步骤'] = 2.5  # 标记为只进行了增强
-                    data_manager.update_record({"文件完整路径": file.get("文件完整路径")},file)
+                    move_out(output_path, target_path, finish, logger, pipeline)
                 else:
                     logger.error(f"输入文件不存在: {output_path}")
                     return
@@ -193,56 +513,60 @@ def process_single_file(file, tmp_dir, video2x_path, res_width, res_height, res_
             except Exception as e:
                 logger.error(f"清理临时文件失败: {e}")
 
-def process_frame_enhancement(file, tmp_dir, frame_multiplier, frame_processor, rife_model, video2x_path, res_width, res_height, frame_encoder, frame_preset, frame_crf, threads, logger):
+def process_frame_enhancement(file, tmp_dir, frame_multiplier, frame_processor, rife_model, video2x_path, res_width, res_height, frame_encoder, frame_preset, frame_crf, threads, logger, pipeline=None, plan=None):
     """进行帧率增强处理"""
+    plan = plan or plan_work(file, frame_multiplier)
+    frame_multiplier = plan.multiplier
     input_filename = os.path.basename(file['文件完整路径'])
     input_path = os.path.join(tmp_dir, input_filename)
     
-    # 验证临时文件路径是否存在
+    # 验证临时文件路径是否存在，不存在时退回处理步骤1重新生成
     if not os.path.exists(input_path):
-        logger.warning(f"临时文件不存在，跳过帧率增强: {input_path}")
+        logger.warning(f"临时文件不存在，退回重新处理: {input_path}")
+        file['处理步骤'] = 1
+        data_manager.update_record({"文件完整路径": file.get("文件完整路径")},file)
         return
     
-    # 检查临时文件夹中是否存在已增强的文件
-    if not os.path.exists(input_path):
-        logger.warning(f"临时文件不存在，跳过帧率增强: {input_path}")
+    # 检查临时文件是否完整（画面增强中断时可能只写了一部分），不完整时退回处理步骤1重新生成
+    if not checkpoints.verify(file['文件完整路径'], checkpoint.STAGE_INTERMEDIATE, input_path):
+        logger.warning(f"临时文件未通过检查点校验，删除后重新处理: {input_path}")
+        os.remove(input_path)
+        file['处理步骤'] = 1
+        data_manager.update_record({"文件完整路径": file.get("文件完整路径")},file)
         return
     
     # 构建新文件名
-    base_name, ext = os.path.splitext(input_filename)
-    new_filename = f"{base_name} {res_width}x{res_height} fpsx{frame_multiplier} Viden2x_HQ{ext}"
-    if not enable_resolution_enhancement:
-        new_filename = f"{base_name} fpsx{frame_multiplier} Viden2x_HQ{ext}"
+    new_filename = output_filename(input_filename, plan)
     output_path = os.path.join(tmp_dir, new_filename)
     
     # 设置环境变量
-    env = os.environ.copy()
-    env['CUDA_VISIBLE_DEVICES'] = '0'
-    env['NVIDIA_VISIBLE_DEVICES'] = 'all'
+    env = gpu_env()
+
+    def finish():
+        # 更新文件记录路径和处理状态
+        file['处理步骤'] = 3  # 标记为已完成所有处理
+        #对数据进行更新
+        data_manager.update_record({"文件完整路径": file.get("文件完整路径")},file)
+        # 清理临时画面增强文件
+        if os.path.exists(input_path):
+            os.remove(input_path)
+            logger.info(f"已清理临时画面增强文件: {input_path}")
+        checkpoints.discard(file['文件完整路径'])
+
+    if checkpoints.verify(file['文件完整路径'], checkpoint.STAGE_OUTPUT, output_path):
+        # 上次帧率增强已完成但未移回原目录
+        logger.info(f"帧率增强结果已存在，直接移回原目录: {output_path}")
+        move_out(output_path, os.path.join(os.path.dirname(file['文件完整路径']), new_filename), finish, logger, pipeline)
+        return
     
     try:
         logger.info(f"开始帧率增强: {input_path}")
         start_time = time.time()
-        cmd = [
-            video2x_path,
-            'upscale',  # 显式指定upscale命令
-            '-i', input_path,
-            '-o', output_path,
-            '-m', str(frame_multiplier),
-            '-p', frame_processor,
-            '--rife-model', rife_model,
-            '-c', frame_encoder,
-            '-e', f'preset={frame_preset}',
-            '-e', f'qp={frame_crf}',
-            '-t', threads
-        ]
-        
-        # 使用完整的命令字符串并确保路径正确引用
-        cmd_str = f'"{video2x_path}" upscale -i "{input_path}" -o "{output_path}" -m {frame_multiplier} -p {frame_processor} --rife-model {rife_model} -c {frame_encoder} -e preset={frame_preset} -e qp={frame_crf} -t {threads}'
+        cmd = frame_command(input_path, output_path, video2x_path, frame_multiplier, frame_processor, rife_model, frame_encoder, frame_preset, frame_crf, threads)
 
         # 为了在控制台显示输出，我们不捕获输出，但需要处理可能的异常
         try:
-            result = subprocess.run(cmd_str, shell=True, capture_output=False, text=True, encoding='utf-8', errors='ignore', env=env)
+            result = processes.run(cmd, env=env)
         except Exception as e:
             logger.error(f"执行命令时发生异常: {e}")
             raise
@@ -257,28 +581,20 @@ def process_frame_enhancement(file, tmp_dir, frame_multiplier, frame_processor,
             # 验证输出文件完整性
             if os.path.exists(output_path) and os.path.getsize(output_path) > 0:
                 logger.info(f"帧率增强文件验证成功: {output_path}")
+                checkpoints.record(file['文件完整路径'], checkpoint.STAGE_OUTPUT, output_path)
+                record_stage(file, throughput.STAGE_FRAME, duration, plan)
                 # 将文件移动到原文件目录
                 original_dir = os.path.dirname(file['文件完整路径'])
                 target_path = os.path.join(original_dir, new_filename)
                 try:
-                    os.makedirs(original_dir, exist_ok=True)
-                    shutil.move(output_path, target_path)
-                    logger.info(f"帧率增强文件已移动至: {target_path}")
-                    # 更新文件记录路径和处理状态
-                    file['处理步骤'] = 3  # 标记为已完成所有处理
-                    #对数据进行更新
-                    data_manager.update_record({"文件完整路径": file.get("文件完整路径")},file)
-                    # 清理临时画面增强文件
-                    if os.path.exists(input_path):
-                        os.remove(input_path)
-                        logger.info(f"已清理临时画面增强文件: {input_path}")
+                    move_out(output_path, target_path, finish, logger, pipeline)
                 except Exception as e:
                     logger.error(f"文件移动或清理失败: {str(e)}")
             else:
                 logger.error(f"帧率增强文件验证失败: {output_path} 不存在或为空")
         else:
             # 命令返回非零退出码，记录错误
-            logger.error(f"帧率增强失败: 退出代码 {result.returncode}, 命令: {result.args}")
+            logger.error(f"帧率增强失败: 退出代码 {result.returncode}, 命令: {' '.join(result.args)}")
             # 对于特定的内存访问错误，标记为已完成处理以跳过
             if result.returncode == 3221225477:
                 logger.info("检测到内存访问冲突错误，跳过此文件的帧率增强处理")
@@ -289,18 +605,15 @@ def process_frame_enhancement(file, tmp_dir, frame_multiplier, frame_processor,
                     original_dir = os.path.dirname(file['文件完整路径'])
                     target_path = os.path.join(original_dir, new_filename)
                     try:
-                        os.makedirs(original_dir, exist_ok=True)
-                        shutil.move(output_path, target_path)
-                        logger.info(f"帧率增强文件已移动至: {target_path}")
-                        file['处理步骤'] = 3    #标记为已执行完全部处理
-                        #对数据进行更新
-                        data_manager.update_record({"文件完整路径": file.get("文件完整路径")},file)
-                        # 清理临时画面增强文件
-                        if os.path.exists(input_path):
-                            os.remove(input_path)
-                            logger.info(f"已清理临时画面增强文件: {input_path}")
+                        move_out(output_path, target_path, finish, logger, pipeline)
                     except Exception as e:
                         logger.error(f"文件移动或清理失败: {str(e)}")
+                elif os.path.exists(input_path) and is_fused(plan):
+                    # 融合模式下的画面增强文件是无损中间文件，不能直接作为成品，保留处理步骤2等待重试
+                    logger.error(f"帧率增强失败，无损中间文件保留在临时目录等待重试: {input_path}")
+                elif os.path.exists(input_path) and not plan.resolution:
+                    # 未做画面增强时临时文件只是源文件副本，保留处理步骤2等待重试
+                    logger.error(f"帧率增强失败，源文件副本保留在临时目录等待重试: {input_path}")
                 elif os.path.exists(input_path):
                     # 如果帧率增强失败，但画面增强成功，将画面增强文件重命名并移动
                     logger.info("帧率增强失败，但画面增强成功，将使用画面增强文件")
@@ -361,14 +674,38 @@ def setup_logger():
     
     return logger
 
-def process_file(file, tmp_dir, video2x_path, res_width, res_height, res_processor, res_shader, res_encoder, res_preset, res_crf, frame_multiplier, frame_processor, rife_model, frame_encoder, frame_preset, frame_crf, threads, logger):
-    """处理单个文件，先执行画面增强，再执行帧率增强"""
-    # 先执行画面增强
+def process_file(file, tmp_dir, video2x_path, res_width, res_height, res_processor, res_shader, res_encoder, res_preset, res_crf, frame_multiplier, frame_processor, rife_model, frame_encoder, frame_preset, frame_crf, threads, logger, pipeline=None):
+    """处理单个文件，先执行画面增强，再执行帧率增强；源文件已达到目标分辨率或帧率的阶段跳过"""
     if enable_resolution_enhancement or enable_frame_enhancement:
-        if file.get("处理步骤") == 1 and enable_resolution_enhancement:
-            process_single_file(file, tmp_dir, video2x_path, res_width, res_height, res_processor, res_shader, res_encoder, res_preset, res_crf, logger)
-        elif file.get("处理步骤") == 1 and not enable_resolution_enhancement:
-            # 如果不启用画面增强，直接跳到下一步，但需要先将源文件复制到tmp目录
+        plan = plan_work(file, frame_multiplier)
+        if not (plan.resolution or plan.frame):
+            # 源文件已达到目标，不占用GPU，直接标记为处理完成
+            info = prober.info(file)
+            logger.info(f"源文件已达到目标（{info.width}x{info.height}，{info.fps:.3f}fps），跳过处理: {file['文件完整路径']}")
+            file[SKIPPED_KEY] = f"{info.width}x{info.height} {info.fps:.3f}fps"
+            file['处理步骤'] = 3
+            data_manager.update_record({"文件完整路径": file.get("文件完整路径")}, file)
+            return
+        if plan.resolution != enable_resolution_enhancement or plan.multiplier != int(frame_multiplier):
+            logger.info(f"按源文件信息调整处理: 画面增强={'是' if plan.resolution else '否'}，"
+                        f"帧率倍数={plan.multiplier if plan.frame else '跳过'}: {file['文件完整路径']}")
+        if use_segments(file, plan):
+            # 长视频分段并行处理，两个阶段在每个分段上依次执行
+            stages = []
+            if plan.resolution:
+                stages.append(("画面增强", lambda i, o: resolution_command(
+                    i, o, video2x_path, res_width, res_height, res_processor, res_shader, res_encoder, res_preset, res_crf, plan)))
+            if plan.frame:
+                stages.append(("帧率增强", lambda i, o: frame_command(
+                    i, o, video2x_path, plan.multiplier, frame_processor, rife_model, frame_encoder, frame_preset, frame_crf, threads)))
+            final_step = 3 if plan.frame else 2.5
+            process_segmented(file, tmp_dir, stages, output_filename(file["文件完整路径"], plan), final_step, logger, pipeline)
+            return
+        # 先执行画面增强
+        if file.get("处理步骤") == 1 and plan.resolution:
+            process_single_file(file, tmp_dir, video2x_path, res_width, res_height, res_processor, res_shader, res_encoder, res_preset, res_crf, logger, pipeline, plan)
+        elif file.get("处理步骤") == 1 and not plan.resolution:
+            # 如果不做画面增强，直接跳到下一步，但需要先将源文件复制到tmp目录
             input_path = file["文件完整路径"]
             filename = os.path.basename(input_path)
             output_path = os.path.join(tmp_dir, filename)
@@ -376,8 +713,8 @@ def process_file(file, tmp_dir, video2x_path, res_width, res_height, res_process
             # 将输入文件复制到tmp目录
             try:
                 if os.path.exists(input_path):
-                    shutil.copy2(input_path, output_path)
-                    logger.info(f"文件已复制到临时目录: {output_path}")
+                    # 帧率增强直接以该副本为输入，按中间文件记录检查点
+                    copy_to_tmp(input_path, output_path, logger, pipeline, checkpoint.STAGE_INTERMEDIATE)
                 else:
                     logger.error(f"输入文件不存在: {input_path}")
                     return
@@ -388,22 +725,22 @@ def process_file(file, tmp_dir, video2x_path, res_width, res_height, res_process
             file["处理步骤"] = 2
             data_manager.update_record({"文件完整路径": file.get("文件完整路径")},file)
         # 再执行帧率增强
-        if file.get("处理步骤") == 2 and enable_frame_enhancement:
-            process_frame_enhancement(file, tmp_dir, frame_multiplier, frame_processor, rife_model, video2x_path, res_width, res_height, frame_encoder, frame_preset, frame_crf, threads, logger)
+        if file.get("处理步骤") == 2 and plan.frame:
+            process_frame_enhancement(file, tmp_dir, frame_multiplier, frame_processor, rife_model, video2x_path, res_width, res_height, frame_encoder, frame_preset, frame_crf, threads, logger, pipeline, plan)
     else:
         logger.info("未启用画面增强和帧率增强，直接跳过处理")
         return
 
 
-def video_processorn(file_info, tmp_dir, video2x_path, res_width, res_height, res_processor, res_shader, res_encoder, res_preset, res_crf, frame_multiplier, frame_processor, rife_model, frame_encoder, frame_preset, frame_crf, threads):
-    """主函数，用于处理单个文件"""
+def video_processorn(file_info, tmp_dir, video2x_path, res_width, res_height, res_processor, res_shader, res_encoder, res_preset, res_crf, frame_multiplier, frame_processor, rife_model, frame_encoder, frame_preset, frame_crf, threads, pipeline=None):
+    """主函数，用于处理单个文件；传入 pipeline（IOPipeline）时源文件复制和结果移出在后台进行"""
     # 设置日志记录器
     logger = setup_logger()
     
     # 处理文件
     file_name = file_info.get('文件名带扩展名', '未知文件')
     try:  # 处理文件
-        process_file(file_info, tmp_dir, video2x_path, res_width, res_height, res_processor, res_shader, res_encoder, res_preset, res_crf, frame_multiplier, frame_processor, rife_model, frame_encoder, frame_preset, frame_crf, threads, logger)
+        process_file(file_info, tmp_dir, video2x_path, res_width, res_height, res_processor, res_shader, res_encoder, res_preset, res_crf, frame_multiplier, frame_processor, rife_model, frame_encoder, frame_preset, frame_crf, threads, logger, pipeline)
         logger.info(f"文件 '{file_name}' 处理完成")
         return True  # 处理成功
     except Exception as e:
@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+"""
+紧凑的扫描记录
+
+扫描、分组和视频处理在内存中使用 VideoRecord：字段存放在 __slots__ 中，
+每条记录不再携带十个中文键的哈希表，季度/集数字符串按值驻留共享。
+VideoRecord 实现了字典接口（record["文件名带扩展名"]、get、in、items 等），
+现有按中文键访问的代码无需改动；只有在持久化边界（数据管理器写出 JSON/SQLite、
+读入旧结果）才与原有的 JSON 格式互相转换，数据文件格式保持不变。
+
+用法:
+    python video_record.py [记录数]    # 对比字典记录与 VideoRecord 的内存占用
+"""
+import sys
+from collections.abc import Mapping, MutableMapping
+
+# 原有 JSON 字段与槽位的对应关系，顺序即写出时的字段顺序
+FIELDS = (
+    ("父目录", "parent"),
+    ("文件名带扩展名", "name"),
+    ("文件完整路径", "path"),
+    ("文件大小 (字节)", "size"),
+    ("文件修改时间", "mtime"),
+    ("季度信息", "season"),
+    ("集数信息", "episode"),
+    ("分支", "branch"),
+    ("处理优先级", "priority"),
+    ("处理步骤", "step"),
+    ("记录版本", "version"),
+    ("占用进程", "owner"),
+)
+
+_ATTRS = dict(FIELDS)
+_INTERNED = frozenset(("season", "episode"))
+_MISSING = object()
+
+
+class VideoRecord(MutableMapping):
+    """
+    以 __slots__ 存储的扫描记录，按原有中文键读写
+    未赋值的槽位表示该键不存在；FIELDS 以外的键存放在 _extra 中
+    """
+    __slots__ = tuple(attr for _, attr in FIELDS) + ("_extra",)
+
+    def __init__(self, parent, name, path, size, mtime, season, episode,
+                 branch=-1, priority=-1, step=0):
+        """
+        创建扫描记录
+        Args:
+            parent: 父目录
+            name: 文件名（带扩展名）
+            path: 文件完整路径
+            size: 文件大小（字节）
+            mtime: 文件修改时间字符串
+            season: 季度信息
+            episode: 集数信息
+            branch: 分支
+            priority: 处理优先级
+            step: 处理步骤
+        """
+        self.parent = parent
+        self.name = name
+        self.path = path
+        self.size = size
+        self.mtime = mtime
+        self.season = sys.intern(season)
+        self.episode = sys.intern(episode)
+        self.branch = branch
+        self.priority = priority
+        self.step = step
+        self._extra = None
+
+    @classmethod
+    def from_dict(cls, record):
+        """
+        由 JSON 格式的记录创建 VideoRecord（读入旧结果时使用）
+        Args:
+            record: 字典记录
+        Returns:
+            VideoRecord，已是 VideoRecord 时原样返回
+        """
+        if isinstance(record, cls):
+            return record
+        self = cls.__new__(cls)
+        self._extra = None
+        for key, value in record.items():
+            attr = _ATTRS.get(key)
+            if attr is None or attr in _INTERNED:
+                self[key] = value
+            else:
+                setattr(self, attr, value)
+        return self
+
+    def to_dict(self):
+        """转换为 JSON 格式的字典，字段顺序与原有扫描结果相同"""
+        record = {}
+        for key, attr in FIELDS:
+            value = getattr(self, attr, _MISSING)
+            if value is not _MISSING:
+                record[key] = value
+        if self._extra:
+            record.update(self._extra)
+        return record
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, _ATTRS[key])
+        except KeyError:
+            if self._extra is None:
+                raise
+            return self._extra[key]
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __setitem__(self, key, value):
+        attr = _ATTRS.get(key)
+        if attr is None:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+        elif attr in _INTERNED and isinstance(value, str):
+            setattr(self, attr, sys.intern(value))
+        else:
+            setattr(self, attr, value)
+
+    def __delitem__(self, key):
+        attr = _ATTRS.get(key)
+        if attr is not None:
+            try:
+                delattr(self, attr)
+            except AttributeError:
+                raise KeyError(key) from None
+        elif self._extra is None:
+            raise KeyError(key)
+        else:
+            del self._extra[key]
+
+    def get(self, key, default=None):
+        attr = _ATTRS.get(key)
+        if attr is not None:
+            return getattr(self, attr, default)
+        if self._extra is None:
+            return default
+        return self._extra.get(key, default)
+
+    def __contains__(self, key):
+        attr = _ATTRS.get(key)
+        if attr is not None:
+            return hasattr(self, attr)
+        return self._extra is not None and key in self._extra
+
+    def __iter__(self):
+        for key, attr in FIELDS:
+            if hasattr(self, attr):
+                yield key
+        if self._extra:
+            yield from self._extra
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return f"VideoRecord({self.to_dict()!r})"
+
+
+def json_default(obj):
+    """json.dump 的 default 钩子：VideoRecord 等映射类型按普通字典写出"""
+    if isinstance(obj, VideoRecord):
+        return obj.to_dict()
+    if isinstance(obj, Mapping):
+        return dict(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _make_records(count, shows=500):
+    """生成与扫描结果形态相同的合成记录（同一目录的父目录字符串共享）"""
+    from scanner import build_file_record
+    parents = [f"/media/library/Show {i:04d}/Season 01" for i in range(shows)]
+    records = []
+    for i in range(count):
+        show, episode = divmod(i, shows)
+        parent = parents[episode % shows]
+        name = f"Show {episode % shows:04d} - S01E{show + 1:02d} - 1080p WEB-DL.mkv"
+        records.append(build_file_record(parent, name, f"{parent}/{name}", 1_500_000_000 + i,
+                                         1_700_000_000 + i))
+    return records
+
+
+def benchmark(count=200_000):
+    """
+    对比字典记录与 VideoRecord 的内存占用
+    Args:
+        count: 记录数
+    """
+    import gc
+    import time
+    import tracemalloc
+
+    source = [record.to_dict() for record in _make_records(count)]
+    results = {}
+    for label, convert in (("dict", dict), ("VideoRecord", VideoRecord.from_dict)):
+        gc.collect()
+        tracemalloc.start()
+        start = time.perf_counter()
+        # 字符串值与扫描结果共享，只统计记录容器本身的开销
+        records = [convert(record) for record in source]
+        elapsed = time.perf_counter() - start
+        size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results[label] = size
+        start = time.perf_counter()
+        for record in records:
+            record["文件名带扩展名"], record.get("处理步骤")
+        access = time.perf_counter() - start
+        print(f"{label:>12}: {size / 2**20:8.1f} MiB，{size / count:6.1f} 字节/条，"
+              f"构建 {elapsed:.2f}s，读取两个字段 {access * 1e9 / count:.0f} ns/条")
+        del records
+    print(f"VideoRecord 内存为字典记录的 {results['VideoRecord'] / results['dict']:.0%}")
+
+
+if __name__ == "__main__":
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 200_000)
@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+"""
+目录变化监视模块
+
+Linux 上通过 inotify（ctypes 调用 libc，无需第三方依赖）订阅目录事件，
+其他平台或 inotify 不可用时退化为按间隔轮询目录修改时间。
+两种监视器都通过 poll(timeout) 返回发生变化的目录集合。
+"""
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import sys
+import time
+
+logger = logging.getLogger(__name__)
+
+# inotify 事件掩码
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+_EVENT_HEADER = struct.Struct('iIII')
+
+
+def _iter_directories(root):
+    """深度优先列出 root 及其下全部目录（不跟随符号链接）"""
+    stack = [root]
+    while stack:
+        dir_path = stack.pop()
+        yield dir_path
+        try:
+            with os.scandir(dir_path) as it:
+                subdirs = [entry.path for entry in it if entry.is_dir() and not entry.is_symlink()]
+        except OSError as e:
+            logger.warning("⚠️ 无法访问目录 '%s': %s", dir_path, e)
+            continue
+        stack.extend(reversed(subdirs))
+
+
+def collapse_directories(dirs):
+    """
+    合并嵌套的目录：若某目录的上级目录也在集合中，只保留上级目录
+    Args:
+        dirs: 目录路径集合
+    Returns:
+        按路径排序的目录列表
+    """
+    result = []
+    for dir_path in sorted(dirs):
+        if result and (dir_path == result[-1] or dir_path.startswith(os.path.join(result[-1], ''))):
+            continue
+        result.append(dir_path)
+    return result
+
+
+class InotifyWatcher:
+    """基于 inotify 的递归目录监视器，新建的子目录会自动加入监视"""
+    def __init__(self, root):
+        """
+        初始化监视器
+        Args:
+            root: 监视的根目录
+        Raises:
+            OSError: inotify 不可用或监视数量超过系统上限
+        """
+        self.root = root
+        libc_name = ctypes.util.find_library('c') or 'libc.so.6'
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        self._watches = {}
+        try:
+            self._add_tree(root)
+        except OSError:
+            self.close()
+            raise
+        logger.info(f"inotify 监视已建立，共 {len(self._watches)} 个目录")
+
+    def _add_watch(self, dir_path):
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(dir_path), WATCH_MASK)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, f"inotify_add_watch '{dir_path}': {os.strerror(errno)}")
+        self._watches[wd] = dir_path
+
+    def _add_tree(self, root):
+        for dir_path in _iter_directories(root):
+            self._add_watch(dir_path)
+
+    def poll(self, timeout):
+        """
+        等待目录变化
+        Args:
+            timeout: 最长等待秒数，None 表示一直等待
+        Returns:
+            发生变化的目录集合；事件队列溢出时返回 {根目录}
+        """
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return set()
+        changed = set()
+        while True:
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, _cookie, length = _EVENT_HEADER.unpack_from(data, offset)
+                offset += _EVENT_HEADER.size
+                name = data[offset:offset + length].rstrip(b'\0')
+                offset += length
+                if mask & IN_Q_OVERFLOW:
+                    logger.warning("inotify 事件队列溢出，将重新扫描整个目录")
+                    changed.add(self.root)
+                    continue
+                dir_path = self._watches.get(wd)
+                if dir_path is None:
+                    continue
+                if mask & IN_IGNORED:
+                    # 目录已被删除或移走，监视自动失效
+                    self._watches.pop(wd, None)
+                    continue
+                changed.add(dir_path)
+                if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                    new_dir = os.path.join(dir_path, os.fsdecode(name))
+                    try:
+                        self._add_tree(new_dir)
+                    except OSError as e:
+                        logger.warning(f"⚠️ 无法监视新目录 {new_dir}: {e}")
+        return changed
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+class PollingWatcher:
+    """按固定间隔检查每个目录修改时间的监视器，适用于非 Linux 平台和网络共享"""
+    def __init__(self, root, interval=60):
+        """
+        初始化监视器
+        Args:
+            root: 监视的根目录
+            interval: 轮询间隔秒数
+        """
+        self.root = root
+        self.interval = interval
+        self._mtimes = self._snapshot()
+
+    def _snapshot(self):
+        mtimes = {}
+        for dir_path in _iter_directories(self.root):
+            try:
+                mtimes[dir_path] = os.stat(dir_path).st_mtime_ns
+            except OSError:
+                continue
+        return mtimes
+
+    def poll(self, timeout):
+        """
+        等待目录变化
+        Args:
+            timeout: 最长等待秒数，None 表示等待一个轮询间隔
+        Returns:
+            发生变化（新增、删除或修改时间变化）的目录集合
+        """
+        time.sleep(self.interval if timeout is None else min(timeout, self.interval))
+        current = self._snapshot()
+        changed = {d for d, mtime in current.items() if self._mtimes.get(d) != mtime}
+        # 被删除的目录由其上级目录的修改时间变化体现，这里也一并报告
+        changed |= {os.path.dirname(d) for d in self._mtimes if d not in current and d != self.root}
+        self._mtimes = current
+        return changed
+
+    def close(self):
+        pass
+
+
+def create_watcher(root, mode='auto', interval=60):
+    """
+    创建目录监视器
+    Args:
+        root: 监视的根目录
+        mode: auto（Linux 优先 inotify）、inotify 或 poll
+        interval: 轮询模式的间隔秒数
+    Returns:
+        InotifyWatcher 或 PollingWatcher
+    """
+    mode = (mode or 'auto').lower()
+    if mode in ('auto', 'inotify') and sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher(root)
+        except OSError as e:
+            logger.warning(f"inotify 不可用: {e}，改用轮询模式")
+    elif mode == 'inotify':
+        logger.warning("当前平台不支持 inotify，改用轮询模式")
+    return PollingWatcher(root, interval)